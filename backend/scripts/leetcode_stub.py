@@ -0,0 +1,87 @@
+"""
+Local stand-in for the LeetCode GraphQL API, used by load tests.
+
+Answers just enough of the queries in src/leetcode/service/graphql_queries.py
+for matchmaking to run end to end without touching leetcode.com:
+
+    uvicorn leetcode_stub:app --app-dir scripts --port 8099
+    LEETCODE_GRAPHQL_URL=http://127.0.0.1:8099/graphql uvicorn src.main:app
+
+Every random question is STUB_PROBLEM_SLUG and every user's most recent
+accepted submission is for that same problem, so submissions always validate.
+STUB_LATENCY_MS adds an artificial delay to each response.
+"""
+import asyncio
+import json
+import os
+import time
+
+from fastapi import FastAPI, Request
+
+STUB_PROBLEM_SLUG = os.getenv("STUB_PROBLEM_SLUG", "two-sum")
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "0"))
+
+app = FastAPI()
+
+
+def _question(slug: str) -> dict:
+    return {
+        "questionId": "1",
+        "title": slug.replace("-", " ").title(),
+        "titleSlug": slug,
+        "content": "<p>Load test problem</p>",
+        "difficulty": "Easy",
+        "stats": json.dumps({"acRate": "55.0%"}),
+        "topicTags": [{"name": "Array"}, {"name": "Hash Table"}],
+    }
+
+
+@app.post("/graphql")
+async def graphql(request: Request):
+    body = await request.json()
+    query = body.get("query", "")
+    variables = body.get("variables") or {}
+
+    if STUB_LATENCY_MS:
+        await asyncio.sleep(STUB_LATENCY_MS / 1000)
+
+    if "randomQuestionV2" in query:
+        return {"data": {"randomQuestionV2": {"titleSlug": STUB_PROBLEM_SLUG}}}
+
+    if "question(titleSlug" in query:
+        return {"data": {"question": _question(variables.get("titleSlug", STUB_PROBLEM_SLUG))}}
+
+    if "recentAcSubmissionList" in query:
+        return {"data": {"recentAcSubmissionList": [{
+            "id": str(int(time.time() * 1000)),
+            "title": STUB_PROBLEM_SLUG.replace("-", " ").title(),
+            "titleSlug": STUB_PROBLEM_SLUG,
+            "timestamp": str(int(time.time())),
+            "lang": "python3",
+            "runtime": "42 ms",
+            "memory": "16.5 MB",
+        }]}}
+
+    if "submitStats" in query:
+        return {"data": {"matchedUser": {
+            "username": variables.get("username"),
+            "submitStats": {"acSubmissionNum": [
+                {"difficulty": "All", "count": 3},
+                {"difficulty": "Easy", "count": 1},
+                {"difficulty": "Medium", "count": 1},
+                {"difficulty": "Hard", "count": 1},
+            ]},
+        }}}
+
+    if "matchedUser" in query:
+        return {"data": {"matchedUser": {
+            "username": variables.get("username"),
+            "profile": {"ranking": 1, "userAvatar": "", "realName": "", "aboutMe": ""},
+        }}}
+
+    if "problemsetQuestionListV2" in query:
+        return {"data": {"problemsetQuestionListV2": {"questions": [
+            {"difficulty": "EASY", "topicTags": [{"name": "Array"}]},
+        ]}}}
+
+    return {"data": None, "errors": [{"message": "Query not supported by stub"}]}
@@ -0,0 +1,441 @@
+"""
+WebSocket matchmaking load test.
+
+Seeds simulated players straight into the database, opens one socket per
+player against /matchmaking/ws/matchmaking/{user_id} and plays matches in a
+loop (join_queue -> match_found -> submit_solution / resign_match) until the
+run ends. Reports time-to-match, per-message latency percentiles and the
+server's event-loop lag and memory growth (sampled from /matchmaking/metrics),
+and can compare the report against a stored baseline so releases can be
+checked for regressions.
+
+Run from backend/ against a server that is already up:
+
+    DATABASE_URL=sqlite+aiosqlite:///./loadtest.db \\
+        python scripts/load_test.py --clients 2000 --duration 120
+
+or let the script start the server plus the local LeetCode stand-in
+(scripts/leetcode_stub.py) itself:
+
+    python scripts/load_test.py --spawn --clients 2000 --write-baseline loadtest_baseline.json
+    python scripts/load_test.py --spawn --clients 2000 --baseline loadtest_baseline.json
+
+The script must see the same DATABASE_URL as the server (SQLite or MySQL).
+Thousands of sockets need a raised open-file limit (`ulimit -n 65535`).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict, deque
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+DEFAULT_DATABASE_URL = "sqlite+aiosqlite:///./loadtest.db"
+STUB_PORT = 8099
+
+# Metrics compared against the baseline; all are "lower is better".
+# The floor keeps tiny absolute changes (noise) from failing a run.
+TRACKED_METRICS = {
+    "time_to_match_ms.p95": 5.0,
+    "latency_ms.queue_joined.p99": 5.0,
+    "latency_ms.pong.p99": 5.0,
+    "latency_ms.match_completed.p95": 10.0,
+    "server.event_loop_lag_ms.p99": 2.0,
+    "server.event_loop_lag_ms.max": 10.0,
+    "server.rss_growth_bytes": 8 * 1024 * 1024,
+}
+
+
+def percentiles(values) -> dict:
+    from src.matchmaking.metrics import percentile
+    values = list(values)
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "max": round(max(values), 3) if values else 0.0,
+    }
+
+
+class RunStats:
+    def __init__(self):
+        self.time_to_match = []
+        self.latency = defaultdict(list)  # message type -> [ms]
+        self.errors = defaultdict(int)
+        self.matches_completed = 0  # counted by the player who ended the match
+        self.connected = 0
+        self.bytes_received = 0  # payload bytes after decompression
+        self.server_samples = []
+
+
+# -----------------------------
+# Database seeding
+# -----------------------------
+async def seed_users(count: int, elo_mean: float, elo_sd: float, prefix: str, rng: random.Random):
+    from sqlalchemy import select
+    from src.database.database import AsyncSessionLocal, init_db
+    from src.database.models import User
+
+    await init_db()
+    async with AsyncSessionLocal() as db:
+        users = []
+        for i in range(count):
+            elo = int(min(3000, max(400, rng.gauss(elo_mean, elo_sd))))
+            users.append(User(
+                email=f"{prefix}_{i}@loadtest.local",
+                hashed_password="loadtest",
+                leetcode_username=f"{prefix}_{i}",
+                user_elo=elo,
+                repeating_questions=True,  # the stub only ever serves one problem
+            ))
+        db.add_all(users)
+        await db.commit()
+        result = await db.execute(
+            select(User.id, User.user_elo).where(User.email.like(f"{prefix}\\_%", escape="\\"))
+        )
+        return result.all()
+
+
+async def delete_users(prefix: str):
+    from sqlalchemy import select, delete, update, or_
+    from src.database.database import AsyncSessionLocal
+    from src.database.models import User, MatchHistory, MatchParticipant, RatingHistory, UserStats, FriendEdge
+
+    async with AsyncSessionLocal() as db:
+        ids = select(User.id).where(User.email.like(f"{prefix}\\_%", escape="\\")).scalar_subquery()
+        matches = (
+            select(MatchHistory.match_id)
+            .where(or_(MatchHistory.winner_id.in_(ids), MatchHistory.loser_id.in_(ids)))
+            .scalar_subquery()
+        )
+        # Rows that reference the users or their matches go first (foreign keys)
+        await db.execute(delete(MatchParticipant).where(
+            or_(MatchParticipant.user_id.in_(ids), MatchParticipant.match_id.in_(matches))
+        ))
+        await db.execute(delete(RatingHistory).where(
+            or_(RatingHistory.user_id.in_(ids), RatingHistory.match_id.in_(matches))
+        ))
+        await db.execute(delete(UserStats).where(UserStats.user_id.in_(ids)))
+        await db.execute(update(UserStats).where(UserStats.last_match_id.in_(matches)).values(last_match_id=None))
+        await db.execute(delete(FriendEdge).where(or_(FriendEdge.user_id.in_(ids), FriendEdge.other_id.in_(ids))))
+        await db.execute(delete(MatchHistory).where(
+            or_(MatchHistory.winner_id.in_(ids), MatchHistory.loser_id.in_(ids))
+        ))
+        await db.execute(delete(User).where(User.email.like(f"{prefix}\\_%", escape="\\")))
+        await db.commit()
+
+
+# -----------------------------
+# Simulated client
+# -----------------------------
+class SimulatedClient:
+    def __init__(self, user_id: int, args, stats: RunStats, deadline: float, rng: random.Random):
+        self.user_id = user_id
+        self.args = args
+        self.stats = stats
+        self.deadline = deadline
+        self.rng = rng
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.pending_pings = deque()
+        self.ws = None
+        self.codec = None
+
+    async def send(self, message: dict):
+        await self.ws.send(self.codec.encode(message))
+
+    async def reader(self):
+        async for raw in self.ws:
+            self.stats.bytes_received += len(raw)
+            message = self.codec.decode(raw)
+            if message.get("type") == "ping":
+                await self.send({"type": "pong"})  # server heartbeat
+                continue
+            if message.get("type") == "pong" and self.pending_pings:
+                sent = self.pending_pings.popleft()
+                self.stats.latency["pong"].append((time.perf_counter() - sent) * 1000)
+                continue
+            await self.inbox.put(message)
+
+    async def pinger(self):
+        while True:
+            await asyncio.sleep(self.args.ping_interval * (0.5 + self.rng.random()))
+            self.pending_pings.append(time.perf_counter())
+            await self.send({"type": "ping"})
+
+    async def expect(self, types: set, timeout: float) -> dict:
+        """Wait for the next message of one of `types`, counting errors seen on the way."""
+        end = time.perf_counter() + timeout
+        while True:
+            remaining = end - time.perf_counter()
+            if remaining <= 0:
+                raise asyncio.TimeoutError
+            message = await asyncio.wait_for(self.inbox.get(), remaining)
+            if message.get("type") in types:
+                return message
+            if message.get("type") in ("error", "submission_invalid"):
+                self.stats.errors[message.get("message", message["type"])] += 1
+
+    async def play_match(self, match: dict):
+        match_id = match["match_id"]
+        await self.expect({"timer_update"}, timeout=30)  # countdown started
+        while (await self.expect({"timer_update"}, timeout=30)).get("phase") != "active":
+            pass
+
+        solve_time = min(self.rng.expovariate(1 / self.args.solve_mean), self.args.solve_mean * 4)
+        try:
+            await self.expect({"match_completed"}, timeout=solve_time)
+            return  # opponent finished first
+        except asyncio.TimeoutError:
+            pass
+
+        action = "resign_match" if self.rng.random() < self.args.resign_ratio else "submit_solution"
+        sent = time.perf_counter()
+        await self.send({"type": action, "match_id": match_id, "frontend_seconds": int(solve_time) + 1})
+        await self.expect({"match_completed"}, timeout=self.args.message_timeout)
+        self.stats.latency["match_completed"].append((time.perf_counter() - sent) * 1000)
+        self.stats.matches_completed += 1
+
+    async def run(self):
+        import websockets
+        from src.matchmaking.protocol import JSON_CODEC, MSGPACK_CODEC
+
+        codec = MSGPACK_CODEC if self.args.protocol == "msgpack" else JSON_CODEC
+        url = f"{self.args.ws_url}/matchmaking/ws/matchmaking/{self.user_id}"
+        async with websockets.connect(
+            url,
+            max_size=None,
+            open_timeout=60,
+            subprotocols=[codec.subprotocol] if codec.subprotocol else None,
+            compression="deflate" if self.args.compression else None,
+        ) as ws:
+            self.ws = ws
+            self.codec = codec
+            tasks = [asyncio.create_task(self.reader()), asyncio.create_task(self.pinger())]
+            try:
+                await self.expect({"connected"}, timeout=self.args.message_timeout)
+                self.stats.connected += 1
+                while time.perf_counter() < self.deadline:
+                    sent = time.perf_counter()
+                    await self.send({"type": "join_queue"})
+                    await self.expect({"queue_joined"}, timeout=self.args.message_timeout)
+                    self.stats.latency["queue_joined"].append((time.perf_counter() - sent) * 1000)
+
+                    remaining = self.deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    try:
+                        match = await self.expect({"match_found"}, timeout=remaining)
+                    except asyncio.TimeoutError:
+                        await self.send({"type": "leave_queue"})
+                        break
+                    self.stats.time_to_match.append((time.perf_counter() - sent) * 1000)
+                    await self.play_match(match)
+                    await asyncio.sleep(self.args.rejoin_delay * self.rng.random())
+            except asyncio.TimeoutError:
+                self.stats.errors["timeout"] += 1
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+
+# -----------------------------
+# Server metrics sampling
+# -----------------------------
+async def sample_server(http_url: str, stats: RunStats, stop: asyncio.Event, interval: float):
+    import httpx
+
+    async with httpx.AsyncClient(timeout=10) as client:
+        while not stop.is_set():
+            try:
+                response = await client.get(f"{http_url}/matchmaking/metrics")
+                stats.server_samples.append(response.json())
+            except httpx.HTTPError as e:
+                stats.errors[f"metrics: {type(e).__name__}"] += 1
+            try:
+                await asyncio.wait_for(stop.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+def build_report(args, stats: RunStats, wall_seconds: float, client_lag: dict) -> dict:
+    samples = stats.server_samples
+    lag_p99 = [s["event_loop_lag"]["p99_ms"] for s in samples]
+    return {
+        "clients": args.clients,
+        "connected": stats.connected,
+        "duration_s": round(wall_seconds, 1),
+        "matches_completed": stats.matches_completed,
+        "matches_per_s": round(stats.matches_completed / wall_seconds, 2) if wall_seconds else 0.0,
+        "time_to_match_ms": percentiles(stats.time_to_match),
+        "latency_ms": {kind: percentiles(values) for kind, values in sorted(stats.latency.items())},
+        "errors": dict(stats.errors),
+        "protocol": args.protocol,
+        "compression": args.compression,
+        "bytes_received_per_match": round(stats.bytes_received / stats.matches_completed) if stats.matches_completed else 0,
+        "server": {
+            "event_loop_lag_ms": {
+                "p99": max(lag_p99) if lag_p99 else 0.0,
+                "max": samples[-1]["event_loop_lag"]["max_ms"] if samples else 0.0,
+            },
+            "rss_start_bytes": samples[0]["rss_bytes"] if samples else 0,
+            "rss_end_bytes": samples[-1]["rss_bytes"] if samples else 0,
+            "rss_growth_bytes": samples[-1]["rss_bytes"] - samples[0]["rss_bytes"] if samples else 0,
+            "peak_connections": max((s["active_connections"] for s in samples), default=0),
+        },
+        # High client-side lag means the harness itself is saturated
+        "client_event_loop_lag_ms": client_lag,
+    }
+
+
+def lookup(report: dict, path: str):
+    value = report
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare_to_baseline(report: dict, baseline: dict, tolerance: float) -> list:
+    """Return a list of human-readable regressions (empty when the run is OK)."""
+    regressions = []
+    for path, floor in TRACKED_METRICS.items():
+        current, previous = lookup(report, path), lookup(baseline, path)
+        if current is None or previous is None:
+            continue
+        if current > previous * (1 + tolerance) and current - previous > floor:
+            regressions.append(f"{path}: {previous} -> {current}")
+    return regressions
+
+
+# -----------------------------
+# Optional local server
+# -----------------------------
+def spawn_processes(args) -> list:
+    env = {**os.environ, "LEETCODE_GRAPHQL_URL": f"http://127.0.0.1:{STUB_PORT}/graphql"}
+    port = args.http_url.rsplit(":", 1)[-1].split("/")[0]
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "leetcode_stub:app", "--app-dir", "scripts",
+         "--port", str(STUB_PORT), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--port", port, "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL,
+    )
+    return [stub, server]
+
+
+async def wait_for_server(http_url: str, timeout: float = 30):
+    import httpx
+
+    end = time.time() + timeout
+    async with httpx.AsyncClient(timeout=2) as client:
+        while time.time() < end:
+            try:
+                await client.get(f"{http_url}/")
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.5)
+    raise RuntimeError(f"Server at {http_url} did not come up within {timeout}s")
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    prefix = f"lt{uuid.uuid4().hex[:8]}"
+    processes = spawn_processes(args) if args.spawn else []
+    try:
+        await wait_for_server(args.http_url)
+        users = await seed_users(args.clients, args.elo_mean, args.elo_sd, prefix, rng)
+        print(f"👥 Seeded {len(users)} simulated players ({prefix})")
+
+        from src.matchmaking.metrics import LoopLagMonitor
+        client_monitor = LoopLagMonitor()
+        client_monitor.start()
+
+        stats = RunStats()
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_server(args.http_url, stats, stop, args.sample_interval))
+
+        started = time.perf_counter()
+        deadline = started + args.ramp + args.duration
+
+        async def start_client(index: int, user_id: int):
+            await asyncio.sleep(args.ramp * index / max(1, len(users)))
+            client = SimulatedClient(user_id, args, stats, deadline, random.Random(rng.random()))
+            try:
+                await client.run()
+            except Exception as e:
+                stats.errors[f"client: {type(e).__name__}"] += 1
+
+        await asyncio.gather(*(start_client(i, user_id) for i, (user_id, _) in enumerate(users)))
+        stop.set()
+        await sampler
+
+        await client_monitor.stop()
+        report = build_report(args, stats, time.perf_counter() - started, client_monitor.snapshot())
+        if not args.keep_users:
+            await delete_users(prefix)
+        return report
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Matchmaking WebSocket load test")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=60, help="seconds of steady state after ramp-up")
+    parser.add_argument("--ramp", type=float, default=10, help="seconds to open all connections")
+    parser.add_argument("--http-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--ws-url", default="ws://127.0.0.1:8000")
+    parser.add_argument("--spawn", action="store_true", help="start the server and the LeetCode stub")
+    parser.add_argument("--elo-mean", type=float, default=1200)
+    parser.add_argument("--elo-sd", type=float, default=150)
+    parser.add_argument("--solve-mean", type=float, default=5, help="mean seconds before a player acts")
+    parser.add_argument("--resign-ratio", type=float, default=0.2)
+    parser.add_argument("--rejoin-delay", type=float, default=2)
+    parser.add_argument("--ping-interval", type=float, default=5)
+    parser.add_argument("--message-timeout", type=float, default=30)
+    parser.add_argument("--sample-interval", type=float, default=1)
+    parser.add_argument("--protocol", default="json", choices=["json", "msgpack"], help="wire encoding the clients negotiate")
+    parser.add_argument("--compression", action="store_true", help="offer permessage-deflate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep-users", action="store_true")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="compare against this stored report")
+    parser.add_argument("--write-baseline", help="store this run's report as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DATABASE_URL", DEFAULT_DATABASE_URL)
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+
+    for path in (args.output, args.write_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+        if regressions:
+            print("❌ Regressions against baseline:")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print("✅ No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
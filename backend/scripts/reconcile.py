@@ -0,0 +1,132 @@
+"""
+Rebuild denormalized data from match history.
+
+    python scripts/reconcile.py counters            # report drift, then fix it
+    python scripts/reconcile.py counters --dry-run  # report only
+    python scripts/reconcile.py rating-history      # chart points for matches settled before rating_history
+    python scripts/reconcile.py participants        # per-user match_participants rows
+    python scripts/reconcile.py user-stats          # user_stats aggregates (run after participants)
+    python scripts/reconcile.py leaderboard         # Redis leaderboard against users.user_elo
+
+Run from backend/ with the same DATABASE_URL (and REDIS_URL) as the server.
+Safe to run at any time: every job recomputes from match_history (or users)
+and only fills or fixes what is missing or wrong.
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+async def reconcile_counters(dry_run: bool) -> int:
+    """users.games_played / wins / losses"""
+    from src.database.database import AsyncSessionLocal
+    from src.matchmaking.settlement import find_counter_drift, rebuild_user_counters
+
+    async with AsyncSessionLocal() as db:
+        drift = await find_counter_drift(db)
+        for row in drift[:20]:
+            print(f"  user {row['user_id']}: stored {row['stored']} != actual {row['actual']}")
+        if len(drift) > 20:
+            print(f"  ... and {len(drift) - 20} more")
+        print(f"🔎 {len(drift)} users with drifted match counters")
+
+        if drift and not dry_run:
+            updated = await rebuild_user_counters(db)
+            await db.commit()
+            print(f"✅ Rebuilt match counters for {updated} users")
+    return len(drift)
+
+
+async def reconcile_rating_history(dry_run: bool) -> int:
+    """rating_history points for matches settled before the table existed"""
+    from src.database.database import AsyncSessionLocal
+    from src.matchmaking.settlement import backfill_rating_history
+
+    async with AsyncSessionLocal() as db:
+        filled = await backfill_rating_history(db)
+        if dry_run:
+            await db.rollback()
+            print(f"🔎 {filled} settled matches without rating history")
+        else:
+            await db.commit()
+            print(f"✅ Added rating history for {filled} matches")
+    return filled
+
+
+async def reconcile_participants(dry_run: bool) -> int:
+    """match_participants rows for settled matches"""
+    from src.database.database import AsyncSessionLocal
+    from src.matchmaking.settlement import backfill_match_participants
+
+    async with AsyncSessionLocal() as db:
+        added = await backfill_match_participants(db)
+        if dry_run:
+            await db.rollback()
+            print(f"🔎 {added} match_participants rows missing")
+        else:
+            await db.commit()
+            print(f"✅ Added {added} match_participants rows")
+    return added
+
+
+async def reconcile_user_stats(dry_run: bool) -> int:
+    """user_stats rows and the users.winstreak mirror"""
+    from src.database.database import AsyncSessionLocal
+    from src.matchmaking.settlement import find_user_stats_drift, rebuild_user_stats
+
+    async with AsyncSessionLocal() as db:
+        drift = await find_user_stats_drift(db)
+        print(f"🔎 {len(drift)} users with drifted user_stats" + (f": {drift[:20]}" if drift else ""))
+        if drift and not dry_run:
+            rebuilt = await rebuild_user_stats(db)
+            await db.commit()
+            print(f"✅ Rebuilt user_stats for {rebuilt} users")
+    return len(drift)
+
+
+async def reconcile_leaderboard(dry_run: bool) -> int:
+    """Redis leaderboard sorted set against users.user_elo"""
+    from src.database.database import AsyncSessionLocal
+    from src.users.leaderboard import leaderboard
+
+    async with AsyncSessionLocal() as db:
+        drift = await leaderboard.reconcile(db, dry_run=dry_run)
+    for user_id, stored, actual in drift[:20]:
+        print(f"  user {user_id}: leaderboard {stored} != users {actual}")
+    if len(drift) > 20:
+        print(f"  ... and {len(drift) - 20} more")
+    print(f"🔎 {len(drift)} leaderboard entries drifted" + ("" if dry_run or not drift else ", fixed"))
+    return len(drift)
+
+
+JOBS = {
+    "counters": reconcile_counters,
+    "rating-history": reconcile_rating_history,
+    "participants": reconcile_participants,
+    "user-stats": reconcile_user_stats,
+    "leaderboard": reconcile_leaderboard,
+}
+
+
+async def run(args):
+    import src.database.models  # noqa: F401 - registers the tables init_db() checks
+    from src.database.database import init_db
+    await init_db()  # Make sure added columns exist before reading them
+    for name in args.jobs:
+        print(f"▶️ {name}")
+        await JOBS[name](args.dry_run)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild denormalized data from match history")
+    parser.add_argument("jobs", nargs="+", choices=list(JOBS))
+    parser.add_argument("--dry-run", action="store_true", help="report drift without fixing it")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
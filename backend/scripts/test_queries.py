@@ -1,4 +1,43 @@
-from src.database.query_executor import execute_query
+"""
+Run an ad-hoc read-only SQL query and print the rows as they stream in.
 
-users = execute_query("SHOW COLUMNS FROM users;")
-print(users)
\ No newline at end of file
+    python scripts/test_queries.py                                  # SHOW COLUMNS FROM users (MySQL)
+    python scripts/test_queries.py "SELECT id, user_elo FROM users WHERE user_elo > :elo" --param elo=1500
+    python scripts/test_queries.py "SELECT * FROM match_history" --replica --limit 100
+
+Run from backend/ with the same DATABASE_URL as the server.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from pprint import pprint
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+async def run(args):
+    from src.database.query_executor import stream_query
+
+    params = dict(param.split("=", 1) for param in args.param)
+    count = 0
+    async for row in stream_query(args.query, params, replica=args.replica):
+        pprint(row)
+        count += 1
+        if args.limit and count >= args.limit:
+            break
+    print(f"📄 {count} rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream the rows of a raw SQL query")
+    parser.add_argument("query", nargs="?", default="SHOW COLUMNS FROM users")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUE", help="bind parameter (string value)")
+    parser.add_argument("--replica", action="store_true", help="read from DATABASE_REPLICA_URL if configured")
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many rows (0 = all)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
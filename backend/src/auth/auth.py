@@ -22,6 +22,8 @@ from passlib.context import CryptContext
 from src.database.models import User
 from src.auth.schemas import UserCreate, UserRead
 from src.database.database import get_db
+from src.users.leaderboard import leaderboard
+from src.users.search import user_search_index
 
 load_dotenv()
 
@@ -58,6 +60,8 @@ class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
 
     async def on_after_register(self, user: User, request: Optional[Request] = None):
         print(f"User {user.id} has registered.")
+        user_search_index.add(user.id, user.email, user.leetcode_username)
+        leaderboard.record(user.id, user.user_elo)
 
     async def on_after_forgot_password(self, user: User, token: str, request: Optional[Request] = None):
         print(f"User {user.id} has forgot their password. Reset token: {token}")
@@ -15,6 +15,8 @@ from src.auth.temp_registration import (
     delete_temp_registration
 )
 from src.auth.auth import password_helper
+from src.users.leaderboard import leaderboard
+from src.users.search import user_search_index
 from src.leetcode.service.leetcode_service import LeetCodeService
 
 router = APIRouter()
@@ -160,6 +162,8 @@ async def complete_registration(
     
     # Clean up temporary registration
     delete_temp_registration(data.email)
+    user_search_index.add(new_user.id, new_user.email, new_user.leetcode_username)
+    leaderboard.record(new_user.id, new_user.user_elo)
     
     return CompleteRegistrationResponse(
         message="Registration completed successfully",
@@ -0,0 +1,132 @@
+# src/database/migrations.py
+"""
+Small, idempotent schema upgrades applied by init_db().
+
+Base.metadata.create_all() only creates missing tables, so columns and
+indexes added to existing models are listed in ADDED_COLUMNS/ADDED_INDEXES
+and created when absent. Each column's server_default fills existing rows.
+Derived tables are backfilled only in the run that creates them; after
+that, `scripts/reconcile.py` repairs them.
+"""
+from typing import List, Tuple
+from sqlalchemy import inspect, text
+from src.database.database import Base
+
+# table -> columns added after the table first shipped (order matters for backfills)
+ADDED_COLUMNS = {
+    "users": ["games_played", "wins", "losses"],
+    "match_history": ["status", "created_at", "completed_at", "resignation"],
+}
+
+# table -> named indexes added after the table first shipped (created after the columns)
+ADDED_INDEXES = {
+    "match_history": ["ix_match_history_winner_status", "ix_match_history_loser_status"],
+}
+
+
+def _column_ddl(column, dialect) -> str:
+    ddl = f"{column.name} {column.type.compile(dialect=dialect)}"
+    if column.server_default is not None:
+        ddl += f" DEFAULT '{column.server_default.arg}'"
+    if not column.nullable:
+        ddl += " NOT NULL"
+    return ddl
+
+
+def create_missing_tables(sync_conn) -> List[str]:
+    """Create any model tables missing from the live schema. Returns the names created."""
+    existing = set(inspect(sync_conn).get_table_names())
+    Base.metadata.create_all(sync_conn)
+    return [name for name in Base.metadata.tables if name not in existing]
+
+
+def add_missing_columns(sync_conn) -> List[Tuple[str, str]]:
+    """Add any ADDED_COLUMNS missing from the live schema. Returns (table, column) pairs added."""
+    inspector = inspect(sync_conn)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    for table_name, column_names in ADDED_COLUMNS.items():
+        if table_name not in existing_tables:
+            continue  # create_all() builds it complete
+        existing = {column["name"] for column in inspector.get_columns(table_name)}
+        table = Base.metadata.tables[table_name]
+        for name in column_names:
+            if name in existing:
+                continue
+            sync_conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {_column_ddl(table.c[name], sync_conn.dialect)}"))
+            print(f"🛠️ Added column {table_name}.{name}")
+            added.append((table_name, name))
+    return added
+
+
+def add_missing_indexes(sync_conn) -> List[str]:
+    """Create any ADDED_INDEXES missing from the live schema. Returns the names created."""
+    inspector = inspect(sync_conn)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+    for table_name, index_names in ADDED_INDEXES.items():
+        if table_name not in existing_tables:
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table_name)}
+        indexes = {index.name: index for index in Base.metadata.tables[table_name].indexes}
+        for name in index_names:
+            if name not in existing:
+                indexes[name].create(sync_conn)
+                print(f"🛠️ Added index {table_name}.{name}")
+                created.append(name)
+    return created
+
+
+async def run_migrations(conn):
+    """Bring the database up to date, backfilling derived tables and columns that were just added."""
+    created = await conn.run_sync(create_missing_tables)
+    added = await conn.run_sync(add_missing_columns)
+    if ("match_history", "status") in added:
+        # Before the column, settled matches were told apart by the "TBD" placeholder and elo_change
+        from sqlalchemy import update, or_
+        from src.database.models import MatchHistory, MatchStatus
+        result = await conn.execute(
+            update(MatchHistory)
+            .where(or_(MatchHistory.elo_change != 0, MatchHistory.leetcode_problem != "TBD"))
+            .values(status=MatchStatus.completed)
+        )
+        print(f"🛠️ Marked {result.rowcount} existing matches completed")
+    if ("match_history", "resignation") in added:
+        # Older rows only recorded resignations as -1 runtimes on both sides; the best guess available for them
+        from sqlalchemy import update
+        from src.database.models import MatchHistory, MatchStatus
+        result = await conn.execute(
+            update(MatchHistory)
+            .where(MatchHistory.status == MatchStatus.completed)
+            .where(MatchHistory.winner_runtime == -1, MatchHistory.loser_runtime == -1)
+            .values(resignation=True)
+        )
+        print(f"🛠️ Flagged {result.rowcount} existing matches as resignations")
+    if ("users", "games_played") in added:
+        from src.matchmaking.settlement import rebuild_user_counters
+        updated = await rebuild_user_counters(conn)
+        print(f"🛠️ Backfilled match counters for {updated} users")
+    await conn.run_sync(add_missing_indexes)
+
+    # match_participants is derived from match_history; fill it when the table is new
+    backfilled = 0
+    if "match_participants" in created:
+        from src.matchmaking.settlement import backfill_match_participants
+        backfilled = await backfill_match_participants(conn)
+        if backfilled:
+            print(f"🛠️ Backfilled {backfilled} match_participants rows")
+
+    # user_stats is derived from match_participants; fill it when either is new
+    if "user_stats" in created or backfilled:
+        from src.matchmaking.settlement import rebuild_user_stats
+        rebuilt = await rebuild_user_stats(conn)
+        if rebuilt:
+            print(f"🛠️ Backfilled user_stats for {rebuilt} users")
+
+    # friend_edges replaced the JSON lists in `friends`; copy them over once (the copy empties `friends`)
+    from sqlalchemy import select
+    from src.database.models import Friends
+    if (await conn.execute(select(Friends.user_id).limit(1))).first() is not None:
+        from src.friends.service import migrate_friend_lists
+        copied = await migrate_friend_lists(conn)
+        print(f"🛠️ Moved legacy friend lists into {copied} friend_edges rows")
@@ -3,8 +3,9 @@ Database models for the application.
 """
 from sqlalchemy.ext.mutable import MutableList
 from fastapi_users.db import SQLAlchemyBaseUserTable
-from sqlalchemy import Column, Integer, String, Boolean, Float, Text, JSON, Enum, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, Float, Text, JSON, Enum, ForeignKey, DateTime, Index
 from src.database.database import Base
+from datetime import datetime
 import enum
 
 
@@ -27,7 +28,11 @@ class User(SQLAlchemyBaseUserTable[int], Base):
     repeating_questions = Column(Boolean, default=False, nullable=False)
     difficulty = Column(MutableList.as_mutable(JSON), default=lambda: ["1", "2", "3"], nullable=False)
     topics = Column(MutableList.as_mutable(JSON), default=lambda: [str(i) for i in range(0, 74)], nullable=False)
-    winstreak = Column(Integer, default=0, nullable=False)  # Win streak counter
+    winstreak = Column(Integer, default=0, nullable=False)  # Mirror of user_stats.current_streak, kept by settlement
+    # Maintained by match settlement; rebuild with scripts/reconcile.py counters
+    games_played = Column(Integer, default=0, server_default="0", nullable=False)
+    wins = Column(Integer, default=0, server_default="0", nullable=False)
+    losses = Column(Integer, default=0, server_default="0", nullable=False)
     
     # FastAPI-users required fields (need to be added to your database)
     is_active = Column(Boolean, default=True, nullable=False)
@@ -60,6 +65,7 @@ class User(SQLAlchemyBaseUserTable[int], Base):
         self.hashed_password = value
 
 class Friends(Base):
+    """Legacy JSON friend lists; copied into friend_edges once by run_migrations(), then unused."""
     __tablename__ = "friends"
     
     user_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True, nullable=False)
@@ -68,13 +74,51 @@ class Friends(Base):
     friend_requests_received = Column(MutableList.as_mutable(JSON), default=list, nullable=False)
 
 
+class FriendState(str, enum.Enum):
+    pending = "pending"    # user_id asked other_id
+    accepted = "accepted"  # Friends; user_id is whoever sent the request
+
+
+class FriendEdge(Base):
+    """
+    One row per friend request or friendship between two users, keyed by
+    (requester, recipient). A user's own edges are a primary-key range scan
+    and edges pointing at them one seek on the reverse index, so every
+    accept/decline/cancel is a single indexed statement.
+    """
+    __tablename__ = "friend_edges"
+
+    user_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
+    other_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
+    state = Column(Enum(FriendState, name="friend_state"), nullable=False, default=FriendState.pending)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_friend_edges_other_state", "other_id", "state", "user_id"),)
+
+
+class MatchStatus(str, enum.Enum):
+    pending = "pending"      # Record created, not started
+    active = "active"        # Players are in the match
+    completed = "completed"  # Settled: ratings applied
+    abandoned = "abandoned"  # Ended without a result when a player was re-matched (not rated)
+
+
+# Statuses of a match that can still be settled
+LIVE_MATCH_STATUSES = (MatchStatus.pending, MatchStatus.active)
+
+
 class MatchHistory(Base):
     __tablename__ = "match_history"
 
     match_id = Column(Integer, primary_key=True, autoincrement=True)
-    winner_id = Column(Integer, ForeignKey("users.user_id"), nullable=False, index=True)
-    loser_id = Column(Integer, ForeignKey("users.user_id"), nullable=False, index=True)
+    # Indexed through the (player, status, match_id) composites below
+    winner_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
+    loser_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
     leetcode_problem = Column(String(255), nullable=False)
+    status = Column(Enum(MatchStatus, name="match_status"), nullable=False, default=MatchStatus.pending, server_default=MatchStatus.pending.value)
+    created_at = Column(DateTime, nullable=True, default=datetime.utcnow)  # NULL for matches from before the column
+    completed_at = Column(DateTime, nullable=True)
+    resignation = Column(Boolean, default=False, server_default="0", nullable=False)  # Settled by the loser resigning
     
     # ELO tracking columns
     elo_change = Column(Integer, nullable=False)  # Keep for backward compatibility
@@ -88,5 +132,61 @@ class MatchHistory(Base):
     loser_runtime = Column(Integer, nullable=False)
     winner_memory = Column(Float, nullable=False)
     loser_memory = Column(Float, nullable=False)
-    
+
+    # A player's live or completed matches, newest first, are one index seek per side
+    __table_args__ = (
+        Index("ix_match_history_winner_status", "winner_id", "status", "match_id"),
+        Index("ix_match_history_loser_status", "loser_id", "status", "match_id"),
+    )
+
+
+class UserStats(Base):
+    """
+    Per-user aggregates updated in the settlement transaction, so profile and
+    history stats are one primary-key read. Rebuild with scripts/reconcile.py user-stats.
+    """
+    __tablename__ = "user_stats"
+
+    user_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
+    wins = Column(Integer, default=0, server_default="0", nullable=False)
+    losses = Column(Integer, default=0, server_default="0", nullable=False)
+    current_streak = Column(Integer, default=0, server_default="0", nullable=False)  # Consecutive wins up to the last match
+    best_streak = Column(Integer, default=0, server_default="0", nullable=False)
+    last_match_id = Column(Integer, ForeignKey("match_history.match_id"), nullable=True)
+    total_seconds = Column(Integer, default=0, server_default="0", nullable=False)
+
+
+class MatchParticipant(Base):
+    """
+    One row per player per settled match, written by settlement.
+
+    The (user_id, match_id) primary key clusters a player's matches together,
+    so per-user history is one ordered range scan instead of an OR over
+    match_history.winner_id/loser_id.
+    """
+    __tablename__ = "match_participants"
+
+    user_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
+    match_id = Column(Integer, ForeignKey("match_history.match_id"), primary_key=True)
+    opponent_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
+    outcome = Column(String(4), nullable=False)  # "win" | "loss"
+    elo_delta = Column(Integer, nullable=False)
+    elo_after = Column(Integer, nullable=False)
+    problem_slug = Column(String(255), nullable=False)
+
+
+class RatingHistory(Base):
+    """Append-only rating trail: one row per player per settled match."""
+    __tablename__ = "rating_history"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
+    match_id = Column(Integer, ForeignKey("match_history.match_id"), nullable=False)
+    ts = Column(DateTime, nullable=False, default=datetime.utcnow)
+    elo_after = Column(Integer, nullable=False)
+    delta = Column(Integer, nullable=False)
+
+    # Charts read one user's points in time order: a single index range scan
+    __table_args__ = (Index("ix_rating_history_user_ts", "user_id", "ts"),)
+
 # backend/src/database/models.py
\ No newline at end of file
@@ -0,0 +1,123 @@
+# src/database/pool.py
+"""
+Connection pool sizing and instrumentation.
+
+All pool settings come from the environment (see engine_options()). The
+instrumented pool counts how long each checkout waited for a connection and
+how many requests are waiting right now; pool_snapshot() reports those next
+to SQLAlchemy's own checked-in/checked-out/overflow numbers.
+
+SQLite URLs (sqlite+aiosqlite://) get a single-node mode instead: WAL
+journaling plus tuned pragmas on every new connection, so readers no longer
+block behind the writer. In-memory SQLite keeps SQLAlchemy's static pool.
+"""
+import os
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))     # seconds to wait for a connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))     # seconds; keep below MySQL wait_timeout
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes")
+
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # safe with WAL; FULL fsyncs every commit
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+SLOW_CHECKOUT_SECONDS = 0.001  # checkouts slower than this count as having waited
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records checkout waits."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waiting = 0
+        self.checkouts = 0
+        self.waited = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1  # Waited DB_POOL_TIMEOUT without getting a connection
+            raise
+        finally:
+            self.waiting -= 1
+            elapsed = time.perf_counter() - start
+            self.checkouts += 1
+            if elapsed > SLOW_CHECKOUT_SECONDS:
+                self.waited += 1
+                self.wait_seconds_total += elapsed
+                self.wait_seconds_max = max(self.wait_seconds_max, elapsed)
+
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def is_sqlite_memory(url: str) -> bool:
+    return is_sqlite(url) and make_url(url).database in (None, "", ":memory:")
+
+
+def engine_options(url: str) -> dict:
+    """create_async_engine() keyword arguments for `url` from the DB_POOL_* settings."""
+    options = {"echo": DB_ECHO, "pool_pre_ping": DB_POOL_PRE_PING}
+    if is_sqlite_memory(url):
+        return options  # One shared connection (StaticPool); sizing does not apply
+    options.update(
+        poolclass=InstrumentedPool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    return options
+
+
+def install_sqlite_pragmas(async_engine):
+    """Apply WAL and the SQLITE_* pragmas to every new connection of a file-backed SQLite engine."""
+
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.close()
+
+
+def pool_snapshot(async_engine) -> dict:
+    pool = async_engine.pool
+    snapshot = {"class": type(pool).__name__}
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        snapshot.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+    if isinstance(pool, InstrumentedPool):
+        snapshot.update(
+            waiting=pool.waiting,
+            checkouts=pool.checkouts,
+            waited=pool.waited,
+            timeouts=pool.timeouts,
+            wait_ms_avg=round(pool.wait_seconds_total / pool.waited * 1000, 3) if pool.waited else 0.0,
+            wait_ms_max=round(pool.wait_seconds_max * 1000, 3),
+        )
+    return snapshot
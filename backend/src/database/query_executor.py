@@ -1,76 +1,101 @@
 # backend/src/database/query_executor.py
-import asyncio
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+"""
+Raw SQL helpers for admin scripts and reports, on the app's own engines.
+
+    rows = await execute_query("SELECT id, user_elo FROM users WHERE user_elo > :elo", {"elo": 1500})
+    async for row in stream_query("SELECT * FROM match_history"):   # constant memory
+        ...
+    await execute_many("INSERT INTO t (a, b) VALUES (:a, :b)", ({"a": i, "b": i} for i in range(10**6)))
+
+Statements are parsed once (prepare() caches the text() constructs, and
+SQLAlchemy's compiled cache reuses their compiled form). stream_query() runs
+on a server-side cursor and fetches `chunk_size` rows at a time, so large
+tables never sit in memory as a whole. Pass replica=True to read from
+DATABASE_REPLICA_URL when one is configured.
+"""
+from functools import lru_cache
+from itertools import islice
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
 from sqlalchemy import text
-import os
-from dotenv import load_dotenv
-
-# -----------------------------
-# Load environment variables
-# -----------------------------
-load_dotenv()
-DATABASE_URL = os.getenv("DATABASE_URL")
-
-# -----------------------------
-# Async database engine & session
-# -----------------------------
-async_engine = create_async_engine(DATABASE_URL, pool_pre_ping=True)
-AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
-
-# -----------------------------
-# General async query executor
-# -----------------------------
-async def execute_query(query: str, params: dict = None, fetch: bool = True):
+from sqlalchemy.sql.elements import TextClause
+from src.database.database import async_engine, read_engine
+
+STREAM_CHUNK_SIZE = 1000
+EXECUTE_MANY_BATCH_SIZE = 1000
+
+
+@lru_cache(maxsize=256)
+def prepare(query: str) -> TextClause:
+    """The text() construct for `query`, built once per distinct statement."""
+    return text(query)
+
+
+def _engine(replica: bool):
+    return read_engine if replica else async_engine
+
 
+async def execute_query(
+    query: str,
+    params: Optional[Dict[str, Any]] = None,
+    fetch: bool = True,
+    replica: bool = False,
+) -> Optional[List[Dict[str, Any]]]:
     """
-    Execute a raw SQL query against the RDS database asynchronously.
+    Execute a raw SQL statement once.
 
     Parameters:
-        query (str): SQL query string to execute
+        query (str): SQL with :named parameters
         params (dict): Parameters for the query
-        fetch (bool): If True, fetch and return results; 
-                      if False, commit changes without returning results
+        fetch (bool): If True, return the rows as a list of dicts;
+                      if False, commit and return None
+        replica (bool): Read from the replica engine (fetch only)
 
     Returns:
         List of dicts (if fetch=True) or None
     """
-    results = []
-    async with AsyncSessionLocal() as db:
-        try:
-            statement = text(query)
-            res = await db.execute(statement, params or {})
-            if fetch:
-                # Convert results to list of dicts
-                columns = res.keys()
-                results = [dict(zip(columns, row)) for row in res.fetchall()]
-            else:
-                await db.commit()
-        except Exception as e:
-            await db.rollback()
-            raise e
-    async with AsyncSessionLocal() as db:
-        try:
-            statement = text(query)
-            res = await db.execute(statement, params or {})
-            if fetch:
-                # Convert results to list of dicts
-                columns = res.keys()
-                results = [dict(zip(columns, row)) for row in res.fetchall()]
-            else:
-                await db.commit()
-        except Exception as e:
-            await db.rollback()
-            raise e
-    return results
-
-
-# ✅ Wrap test in an async main function
-from pprint import pprint
-
-async def main():
-    data = await execute_query(query="SELECT * FROM users")
-    pprint(data)
-
-
-if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if fetch:
+        async with _engine(replica).connect() as conn:
+            result = await conn.execute(prepare(query), params or {})
+            return [dict(row) for row in result.mappings()]
+
+    async with async_engine.begin() as conn:  # Commits on success, rolls back on error
+        await conn.execute(prepare(query), params or {})
+    return None
+
+
+async def stream_query(
+    query: str,
+    params: Optional[Dict[str, Any]] = None,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    replica: bool = False,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Yield rows as dicts from a server-side cursor, `chunk_size` rows per fetch."""
+    async with _engine(replica).connect() as conn:
+        result = await conn.stream(
+            prepare(query).execution_options(yield_per=chunk_size), params or {}
+        )
+        async for row in result.mappings():
+            yield dict(row)
+
+
+async def execute_many(
+    query: str,
+    rows: Iterable[Dict[str, Any]],
+    batch_size: int = EXECUTE_MANY_BATCH_SIZE,
+) -> int:
+    """
+    Run `query` once per parameter dict with the driver's executemany, in
+    batches of `batch_size`, in one transaction. `rows` may be a generator.
+    Returns the number of rows affected.
+    """
+    statement = prepare(query)
+    rows = iter(rows)
+    affected = 0
+    async with async_engine.begin() as conn:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            result = await conn.execute(statement, batch)
+            affected += max(result.rowcount, 0)
+    return affected
@@ -1,7 +1,7 @@
 # backend/src/friends/routes.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from src.database.database import get_db
+from src.database.database import get_db, get_read_db
 from src.friends import service
 from src.friends.schemas import (
     FriendRequest,
@@ -68,7 +68,7 @@ async def remove_friend(
 @router.get("/{user_id}/list", response_model=List[FriendResponse])
 async def get_friends_list(
     user_id: int,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get user's friends list"""
     return await service.get_friends_list(db, user_id)
@@ -77,7 +77,7 @@ async def get_friends_list(
 @router.get("/{user_id}/requests", response_model=FriendRequestsResponse)
 async def get_friend_requests(
     user_id: int,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get sent and received friend requests"""
     return await service.get_friend_requests(db, user_id)
@@ -87,7 +87,10 @@ async def get_friend_requests(
 async def search_users(
     user_id: int,
     query: str,
-    db: AsyncSession = Depends(get_db)
+    limit: int = Query(20, ge=1, le=50),
+    offset: int = Query(0, ge=0),
+    boost_friends: bool = True,
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Search for users to add as friends"""
-    return await service.search_users(db, query, user_id)
+    """Search for users to add as friends (ranked; page with offset)"""
+    return await service.search_users(db, query, user_id, limit=limit, offset=offset, boost_friends=boost_friends)
@@ -1,158 +1,128 @@
 # backend/src/friends/service.py
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, insert, update, delete, union_all, literal, and_, or_
+from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException
-from typing import List, Optional
-from src.database.models import User, Friends
+from datetime import datetime
+from typing import List
+from src.database.database import recent_writes
+from src.database.models import User, Friends, FriendEdge, FriendState
 from src.friends.schemas import FriendResponse, FriendRequestResponse
+from src.users.loader import UserLoader
+from src.users.search import user_search_index
 
+# The user columns friend responses read
+FRIEND_COLUMNS = ("email", "leetcode_username", "user_elo")
 
-async def get_or_create_friends_record(db: AsyncSession, user_id: int) -> Friends:
-    """Get or create a friends record for a user"""
-    result = await db.execute(select(Friends).where(Friends.user_id == user_id))
-    friends_record = result.scalar_one_or_none()
-    
-    if not friends_record:
-        friends_record = Friends(
-            user_id=user_id,
-            current_friends=[],
-            friend_requests_sent=[],
-            friend_requests_received=[]
-        )
-        db.add(friends_record)
-        try:
-            await db.commit()
-            await db.refresh(friends_record)
-        except Exception as e:
-            # Handle race condition - record was created by another request
-            await db.rollback()
-            result = await db.execute(select(Friends).where(Friends.user_id == user_id))
-            friends_record = result.scalar_one_or_none()
-            if not friends_record:
-                raise e  # Re-raise if it's a different error
-    
-    return friends_record
+
+async def load_users(db: AsyncSession, *user_ids: int) -> dict:
+    """Validate users exist with one query; returns {user_id: row}"""
+    users = await UserLoader(db, columns=FRIEND_COLUMNS).get_many(user_ids)
+    if len(users) < len(set(user_ids)):
+        raise HTTPException(status_code=404, detail="User not found")
+    return users
+
+
+def to_friend_response(user, schema=FriendResponse):
+    return schema(
+        user_id=user.id,
+        username=user.email,
+        leetcode_username=user.leetcode_username or "",
+        user_elo=user.user_elo
+    )
+
+
+def _between(a: int, b: int):
+    """Edges between two users in either direction: two primary-key seeks"""
+    return or_(
+        and_(FriendEdge.user_id == a, FriendEdge.other_id == b),
+        and_(FriendEdge.user_id == b, FriendEdge.other_id == a),
+    )
 
 
 async def send_friend_request(db: AsyncSession, sender_id: int, target_id: int) -> dict:
     """Send a friend request from sender to target user"""
     
     # Validate users exist
-    sender_user_result = await db.execute(select(User).where(User.id == sender_id))
-    sender_user = sender_user_result.scalar_one_or_none()
-    
-    target_user_result = await db.execute(select(User).where(User.id == target_id))
-    target_user = target_user_result.scalar_one_or_none()
-    
-    if not sender_user or not target_user:
-        raise HTTPException(status_code=404, detail="User not found")
+    users = await load_users(db, sender_id, target_id)
+    target_user = users[target_id]
     
     # Cannot send request to self
     if sender_id == target_id:
         raise HTTPException(status_code=400, detail="Cannot send friend request to yourself")
     
-    # Get or create friends records
-    sender_friends = await get_or_create_friends_record(db, sender_id)
-    target_friends = await get_or_create_friends_record(db, target_id)
+    result = await db.execute(
+        select(FriendEdge.user_id, FriendEdge.state).where(_between(sender_id, target_id))
+    )
+    edges = {requester: state for requester, state in result}
     
     # Check if already friends
-    if target_id in (sender_friends.current_friends or []):
+    if FriendState.accepted in edges.values():
         raise HTTPException(status_code=400, detail="Already friends with this user")
     
     # Check if request already sent
-    if target_id in (sender_friends.friend_requests_sent or []):
+    if sender_id in edges:
         raise HTTPException(status_code=400, detail="Friend request already sent")
     
     # Check if target already sent request to sender (mutual request)
-    if target_id in (sender_friends.friend_requests_received or []):
+    if target_id in edges:
         raise HTTPException(status_code=400, detail="This user already sent you a friend request. Accept it instead.")
     
-    # Add to sender's sent requests
-    if sender_friends.friend_requests_sent is None:
-        sender_friends.friend_requests_sent = []
-    sender_friends.friend_requests_sent.append(target_id)
-    
-    # Add to target's received requests
-    if target_friends.friend_requests_received is None:
-        target_friends.friend_requests_received = []
-    target_friends.friend_requests_received.append(sender_id)
-    
-    await db.commit()
+    db.add(FriendEdge(user_id=sender_id, other_id=target_id, state=FriendState.pending))
+    try:
+        await db.commit()
+    except IntegrityError:
+        # A concurrent request for the same pair got there first
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Friend request already sent")
+    recent_writes.mark(user_ids=(sender_id, target_id))
     
-    return {"message": f"Friend request sent to {target_user.username}"}
+    return {"message": f"Friend request sent to {target_user.email}"}
 
 
 async def accept_friend_request(db: AsyncSession, user_id: int, requester_id: int) -> dict:
     """Accept a friend request"""
     
     # Validate users exist
-    user_result = await db.execute(select(User).where(User.id == user_id))
-    user = user_result.scalar_one_or_none()
-    
-    requester_result = await db.execute(select(User).where(User.id == requester_id))
-    requester = requester_result.scalar_one_or_none()
-    
-    if not user or not requester:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Get friends records
-    user_friends = await get_or_create_friends_record(db, user_id)
-    requester_friends = await get_or_create_friends_record(db, requester_id)
+    users = await load_users(db, user_id, requester_id)
+    requester = users[requester_id]
     
-    # Check if request exists
-    if requester_id not in (user_friends.friend_requests_received or []):
+    result = await db.execute(
+        update(FriendEdge)
+        .where(
+            FriendEdge.user_id == requester_id,
+            FriendEdge.other_id == user_id,
+            FriendEdge.state == FriendState.pending,
+        )
+        .values(state=FriendState.accepted)
+    )
+    if result.rowcount != 1:
         raise HTTPException(status_code=400, detail="No friend request from this user")
     
-    # Remove from received requests
-    user_friends.friend_requests_received.remove(requester_id)
-    
-    # Remove from requester's sent requests
-    if user_id in (requester_friends.friend_requests_sent or []):
-        requester_friends.friend_requests_sent.remove(user_id)
-    
-    # Add to both users' friends lists
-    if user_friends.current_friends is None:
-        user_friends.current_friends = []
-    user_friends.current_friends.append(requester_id)
-    
-    if requester_friends.current_friends is None:
-        requester_friends.current_friends = []
-    requester_friends.current_friends.append(user_id)
-    
     await db.commit()
+    recent_writes.mark(user_ids=(user_id, requester_id))
     
-    return {"message": f"You are now friends with {requester.username}"}
+    return {"message": f"You are now friends with {requester.email}"}
 
 
 async def decline_friend_request(db: AsyncSession, user_id: int, requester_id: int) -> dict:
     """Decline/delete a received friend request"""
     
     # Validate users exist
-    user_result = await db.execute(select(User).where(User.id == user_id))
-    user = user_result.scalar_one_or_none()
-    
-    requester_result = await db.execute(select(User).where(User.id == requester_id))
-    requester = requester_result.scalar_one_or_none()
-    
-    if not user or not requester:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Get friends records
-    user_friends = await get_or_create_friends_record(db, user_id)
-    requester_friends = await get_or_create_friends_record(db, requester_id)
+    await load_users(db, user_id, requester_id)
     
-    # Check if request exists
-    if requester_id not in (user_friends.friend_requests_received or []):
+    result = await db.execute(
+        delete(FriendEdge).where(
+            FriendEdge.user_id == requester_id,
+            FriendEdge.other_id == user_id,
+            FriendEdge.state == FriendState.pending,
+        )
+    )
+    if result.rowcount != 1:
         raise HTTPException(status_code=400, detail="No friend request from this user")
     
-    # Remove from received requests
-    user_friends.friend_requests_received.remove(requester_id)
-    
-    # Remove from requester's sent requests
-    if user_id in (requester_friends.friend_requests_sent or []):
-        requester_friends.friend_requests_sent.remove(user_id)
-    
     await db.commit()
+    recent_writes.mark(user_ids=(user_id, requester_id))
     
     return {"message": "Friend request declined"}
 
@@ -161,145 +131,96 @@ async def cancel_friend_request(db: AsyncSession, sender_id: int, target_id: int
     """Cancel a sent friend request"""
     
     # Validate users exist
-    sender_result = await db.execute(select(User).where(User.id == sender_id))
-    sender = sender_result.scalar_one_or_none()
-    
-    target_result = await db.execute(select(User).where(User.id == target_id))
-    target = target_result.scalar_one_or_none()
+    await load_users(db, sender_id, target_id)
     
-    if not sender or not target:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Get friends records
-    sender_friends = await get_or_create_friends_record(db, sender_id)
-    target_friends = await get_or_create_friends_record(db, target_id)
-    
-    # Check if request exists
-    if target_id not in (sender_friends.friend_requests_sent or []):
+    result = await db.execute(
+        delete(FriendEdge).where(
+            FriendEdge.user_id == sender_id,
+            FriendEdge.other_id == target_id,
+            FriendEdge.state == FriendState.pending,
+        )
+    )
+    if result.rowcount != 1:
         raise HTTPException(status_code=400, detail="No friend request sent to this user")
     
-    # Remove from sender's sent requests
-    sender_friends.friend_requests_sent.remove(target_id)
-    
-    # Remove from target's received requests
-    if sender_id in (target_friends.friend_requests_received or []):
-        target_friends.friend_requests_received.remove(sender_id)
-    
     await db.commit()
+    recent_writes.mark(user_ids=(sender_id, target_id))
     
     return {"message": "Friend request cancelled"}
 
 
 async def remove_friend(db: AsyncSession, user_id: int, friend_id: int) -> dict:
-    """Remove a friend from both users' friends lists"""
+    """Remove a friendship, whichever of the two sent the original request"""
     
     # Validate users exist
-    user_result = await db.execute(select(User).where(User.id == user_id))
-    user = user_result.scalar_one_or_none()
-    
-    friend_result = await db.execute(select(User).where(User.id == friend_id))
-    friend = friend_result.scalar_one_or_none()
-    
-    if not user or not friend:
-        raise HTTPException(status_code=404, detail="User not found")
+    users = await load_users(db, user_id, friend_id)
+    friend = users[friend_id]
     
-    # Get friends records
-    user_friends = await get_or_create_friends_record(db, user_id)
-    friend_friends = await get_or_create_friends_record(db, friend_id)
-    
-    # Check if they are friends
-    if friend_id not in (user_friends.current_friends or []):
+    result = await db.execute(
+        delete(FriendEdge).where(_between(user_id, friend_id), FriendEdge.state == FriendState.accepted)
+    )
+    if result.rowcount < 1:
         raise HTTPException(status_code=400, detail="Not friends with this user")
     
-    # Remove from both friends lists
-    user_friends.current_friends.remove(friend_id)
-    
-    if user_id in (friend_friends.current_friends or []):
-        friend_friends.current_friends.remove(user_id)
-    
     await db.commit()
+    recent_writes.mark(user_ids=(user_id, friend_id))
     
-    return {"message": f"Removed {friend.username} from friends"}
+    return {"message": f"Removed {friend.email} from friends"}
+
+
+async def get_friend_ids(db: AsyncSession, user_id: int) -> List[int]:
+    """Ids of a user's friends: their accepted edges in both directions"""
+    result = await db.execute(
+        union_all(
+            select(FriendEdge.other_id).where(FriendEdge.user_id == user_id, FriendEdge.state == FriendState.accepted),
+            select(FriendEdge.user_id).where(FriendEdge.other_id == user_id, FriendEdge.state == FriendState.accepted),
+        )
+    )
+    return [friend_id for (friend_id,) in result]
 
 
 async def get_friends_list(db: AsyncSession, user_id: int) -> List[FriendResponse]:
     """Get list of user's friends"""
     
-    user_result = await db.execute(select(User).where(User.id == user_id))
-    user = user_result.scalar_one_or_none()
+    await load_users(db, user_id)
     
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Get friends record
-    user_friends = await get_or_create_friends_record(db, user_id)
-    
-    if not user_friends.current_friends:
+    friend_ids = await get_friend_ids(db, user_id)
+    if not friend_ids:
         return []
     
-    # Fetch friend details
-    friends_result = await db.execute(
-        select(User).where(User.id.in_(user_friends.current_friends))
-    )
-    friends = friends_result.scalars().all()
-    
-    return [
-        FriendResponse(
-            user_id=friend.id,
-            username=friend.username,
-            leetcode_username=friend.leetcode_username or "",
-            user_elo=friend.user_elo
-        )
-        for friend in friends
-    ]
+    # Fetch friend details (only the columns the response needs)
+    friends = await UserLoader(db, columns=FRIEND_COLUMNS).get_many(friend_ids)
+    
+    return [to_friend_response(friend) for friend in friends.values()]
 
 
 async def get_friend_requests(db: AsyncSession, user_id: int) -> dict:
     """Get sent and received friend requests"""
     
-    user_result = await db.execute(select(User).where(User.id == user_id))
-    user = user_result.scalar_one_or_none()
+    await load_users(db, user_id)
     
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    # Pending edges from the user (primary key) and to the user (reverse index)
+    result = await db.execute(
+        union_all(
+            select(literal("sent"), FriendEdge.other_id).where(
+                FriendEdge.user_id == user_id, FriendEdge.state == FriendState.pending
+            ),
+            select(literal("received"), FriendEdge.user_id).where(
+                FriendEdge.other_id == user_id, FriendEdge.state == FriendState.pending
+            ),
+        )
+    )
+    ids = {"sent": [], "received": []}
+    for direction, other_id in result:
+        ids[direction].append(other_id)
     
-    # Get friends record
-    user_friends = await get_or_create_friends_record(db, user_id)
+    # Sent and received request details in one query
+    users = UserLoader(db, columns=FRIEND_COLUMNS).want_many(ids["sent"]).want_many(ids["received"])
+    sent = await users.get_many(ids["sent"])
+    received = await users.get_many(ids["received"])
     
-    sent_requests = []
-    received_requests = []
-    
-    # Get sent requests details
-    if user_friends.friend_requests_sent:
-        sent_result = await db.execute(
-            select(User).where(User.id.in_(user_friends.friend_requests_sent))
-        )
-        sent_users = sent_result.scalars().all()
-        sent_requests = [
-            FriendRequestResponse(
-                user_id=u.id,
-                username=u.username,
-                leetcode_username=u.leetcode_username or "",
-                user_elo=u.user_elo
-            )
-            for u in sent_users
-        ]
-    
-    # Get received requests details
-    if user_friends.friend_requests_received:
-        received_result = await db.execute(
-            select(User).where(User.id.in_(user_friends.friend_requests_received))
-        )
-        received_users = received_result.scalars().all()
-        received_requests = [
-            FriendRequestResponse(
-                user_id=u.id,
-                username=u.username,
-                leetcode_username=u.leetcode_username or "",
-                user_elo=u.user_elo
-            )
-            for u in received_users
-        ]
+    sent_requests = [to_friend_response(u, FriendRequestResponse) for u in sent.values()]
+    received_requests = [to_friend_response(u, FriendRequestResponse) for u in received.values()]
     
     return {
         "sent": sent_requests,
@@ -307,27 +228,62 @@ async def get_friend_requests(db: AsyncSession, user_id: int) -> dict:
     }
 
 
-async def search_users(db: AsyncSession, query: str, current_user_id: int) -> List[FriendResponse]:
-    """Search for users by username or leetcode_username"""
+async def migrate_friend_lists(db) -> int:
+    """
+    Copy the legacy JSON lists in `friends` into friend_edges, then empty
+    `friends` so the copy happens once. Ids of deleted users are dropped.
+    Takes a session or connection; the caller commits. Returns edges written.
+    """
+    result = await db.execute(
+        select(Friends.user_id, Friends.current_friends, Friends.friend_requests_sent, Friends.friend_requests_received)
+    )
+    rows = result.all()
+    if not rows:
+        return 0
+    user_ids = set((await db.execute(select(User.id))).scalars())
+
+    accepted = {}  # (low, high) -> edge; the list order does not say who asked
+    pending = {}   # (requester, recipient) -> edge
+    for user_id, current, sent, received in rows:
+        for friend_id in current or []:
+            pair = (min(user_id, friend_id), max(user_id, friend_id))
+            accepted[pair] = {"user_id": pair[0], "other_id": pair[1], "state": FriendState.accepted}
+        for requester, recipient in [(user_id, t) for t in sent or []] + [(s, user_id) for s in received or []]:
+            pending[(requester, recipient)] = {"user_id": requester, "other_id": recipient, "state": FriendState.pending}
+
+    edges = list(accepted.values()) + [
+        edge for (a, b), edge in pending.items()
+        if (min(a, b), max(a, b)) not in accepted and ((b, a) not in pending or a < b)  # one edge per pair
+    ]
+    edges = [
+        {**edge, "created_at": datetime.utcnow()}
+        for edge in edges
+        if edge["user_id"] in user_ids and edge["other_id"] in user_ids and edge["user_id"] != edge["other_id"]
+    ]
+    if edges:
+        await db.execute(insert(FriendEdge), edges)
+    await db.execute(delete(Friends))
+    return len(edges)
+
+
+async def search_users(
+    db: AsyncSession,
+    query: str,
+    current_user_id: int,
+    limit: int = 20,
+    offset: int = 0,
+    boost_friends: bool = True,
+) -> List[FriendResponse]:
+    """Search for users by username or leetcode_username, best matches first"""
     
     if len(query) < 2:
         raise HTTPException(status_code=400, detail="Search query must be at least 2 characters")
     
-    # Search for users (excluding current user)
-    result = await db.execute(
-        select(User).where(
-            (User.email.ilike(f"%{query}%") | User.leetcode_username.ilike(f"%{query}%"))
-            & (User.id != current_user_id)
-        ).limit(20)
-    )
-    users = result.scalars().all()
-    
-    return [
-        FriendResponse(
-            user_id=user.id,
-            username=user.username,
-            leetcode_username=user.leetcode_username or "",
-            user_elo=user.user_elo
-        )
-        for user in users
-    ]
+    # Ranked ids from the in-memory trigram index (excluding current user)
+    await user_search_index.sync(db)
+    boost = await get_friend_ids(db, current_user_id) if boost_friends else ()
+    ids = user_search_index.search(query, limit=limit, offset=offset, exclude=current_user_id, boost=boost)
+    
+    # Current details for just this page, in rank order
+    users = await UserLoader(db, columns=FRIEND_COLUMNS).get_many(ids)
+    return [to_friend_response(users[user_id]) for user_id in ids if user_id in users]
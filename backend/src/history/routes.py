@@ -1,15 +1,32 @@
 # backend/src/history/routes.py
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from src.database.database import get_db
+from typing import Literal, Optional
+from src.database.database import get_read_db
 
-from .service import calculate_user_stats
+from .schemas import RatingSeriesResponse, UserStatsResponse
+from .service import calculate_user_stats, get_rating_series, HISTORY_PAGE_SIZE, HISTORY_PAGE_SIZE_MAX
 
 router = APIRouter(prefix="/history")
 
-@router.get("/{user_id}")
-async def get_user_stats(user_id: int, db: AsyncSession = Depends(get_db)):
-    stats = await calculate_user_stats(db, user_id)
+@router.get("/{user_id}", response_model=UserStatsResponse)
+async def get_user_stats(
+    user_id: int,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_PAGE_SIZE_MAX),
+    cursor: Optional[int] = Query(None, description="next_cursor from the previous page"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Lifetime stats plus one page of matches, newest first"""
+    stats = await calculate_user_stats(db, user_id, limit=limit, cursor=cursor)
     return stats
 
-
+@router.get("/{user_id}/rating", response_model=RatingSeriesResponse)
+async def get_user_rating_series(
+    user_id: int,
+    limit: int = Query(100, ge=1, le=1000),
+    bucket: Optional[Literal["day"]] = None,
+    days: int = Query(90, ge=1, le=3650),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """ELO chart data: the last `limit` points, or one point per day with bucket=day"""
+    return await get_rating_series(db, user_id, limit=limit, bucket=bucket, days=days)
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, ConfigDict
-from typing import Literal, List
+from typing import Literal, List, Optional
+from datetime import datetime
 
 # -----------------------------
 # Base schema (shared fields)
@@ -18,9 +19,11 @@ class MatchBase(BaseModel):
 # Schema for a recent match summary
 # -----------------------------
 class RecentMatch(BaseModel):
+    match_id: int
     outcome: Literal["win", "lose"]
     rating_change: int
     question: str
+    opponent: Optional[str] = None  # Opponent's LeetCode username
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -31,6 +34,23 @@ class UserStatsResponse(BaseModel):
     matches_won: int
     win_rate: float
     win_streak: int
-    recent_matches: List[RecentMatch]
+    recent_matches: List[RecentMatch]  # One page, newest first
+    next_cursor: Optional[int] = None  # Pass as ?cursor= for the next page; None on the last page
 
     model_config = ConfigDict(from_attributes=True)
+
+# -----------------------------
+# Schemas for the rating chart
+# -----------------------------
+class RatingPoint(BaseModel):
+    ts: datetime
+    elo: int
+    delta: int  # Net change since the previous point
+    match_id: int  # Last match in the point (the bucket's last match when bucketed)
+
+    model_config = ConfigDict(from_attributes=True)
+
+class RatingSeriesResponse(BaseModel):
+    user_id: int
+    bucket: Optional[Literal["day"]] = None
+    points: List[RatingPoint]
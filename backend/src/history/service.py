@@ -1,23 +1,51 @@
 # backend/src/history/service.py
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_, Enum
-from src.database.models import MatchHistory
-from src.history.schemas import UserStatsResponse, RecentMatch
+from sqlalchemy import select
+from datetime import datetime, timedelta
+from typing import Optional
+import os
+from src.database.models import MatchHistory, MatchParticipant, RatingHistory, User, UserStats
+from src.history.schemas import UserStatsResponse, RecentMatch, RatingPoint, RatingSeriesResponse
 
+# Matches per history page (clients may ask for up to HISTORY_PAGE_SIZE_MAX)
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+HISTORY_PAGE_SIZE_MAX = int(os.getenv("HISTORY_PAGE_SIZE_MAX", "100"))
 
-async def calculate_user_stats(db: AsyncSession, user_id: int) -> UserStatsResponse:
-    # Fetch all matches involving the user
-    result = await db.execute(
-        select(MatchHistory)
-        .where(or_(
-            MatchHistory.winner_id == user_id,
-            MatchHistory.loser_id == user_id
-        ))
-        .order_by(MatchHistory.match_id)  # oldest -> newest
-    )
-    matches = result.scalars().all()
 
-    if not matches:
+async def fetch_match_page(
+    db: AsyncSession, user_id: int, limit: int, cursor: Optional[int] = None, with_match: bool = False
+):
+    """
+    One page of a user's settled matches, newest first, in a single query:
+    (MatchParticipant, opponent username) rows from a match_participants
+    range scan below `cursor`. Callers that need match columns (runtimes,
+    duration) pass with_match=True to join MatchHistory and get
+    (MatchParticipant, MatchHistory, opponent username). Returns (rows, next_cursor).
+    """
+    columns = (MatchParticipant, MatchHistory, User.leetcode_username) if with_match else (MatchParticipant, User.leetcode_username)
+    query = select(*columns)
+    if with_match:
+        query = query.join(MatchHistory, MatchHistory.match_id == MatchParticipant.match_id)
+    query = query.outerjoin(User, User.id == MatchParticipant.opponent_id).where(MatchParticipant.user_id == user_id)
+    if cursor is not None:
+        query = query.where(MatchParticipant.match_id < cursor)
+    result = await db.execute(query.order_by(MatchParticipant.match_id.desc()).limit(limit + 1))
+    rows = result.all()
+    next_cursor = rows[limit - 1][0].match_id if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+async def calculate_user_stats(
+    db: AsyncSession,
+    user_id: int,
+    limit: int = HISTORY_PAGE_SIZE,
+    cursor: Optional[int] = None,
+) -> UserStatsResponse:
+    # Aggregates are maintained at settlement: one primary-key read
+    stats = await db.get(UserStats, user_id)
+    total_matches = (stats.wins + stats.losses) if stats else 0
+
+    if not total_matches:
         return UserStatsResponse(
             matches_won=0,
             win_rate=0.0,
@@ -25,47 +53,63 @@ async def calculate_user_stats(db: AsyncSession, user_id: int) -> UserStatsRespo
             recent_matches=[]
         )
 
-    total_matches = len(matches)
-    wins = 0
+    # One page of match summaries, newest first; pass next_cursor back for the next page
+    rows, next_cursor = await fetch_match_page(db, user_id, limit, cursor)
+    recent_matches = [
+        RecentMatch(
+            match_id=participant.match_id,
+            outcome="win" if participant.outcome == "win" else "lose",
+            rating_change=participant.elo_delta,
+            question=participant.problem_slug,
+            opponent=opponent_username,
+        )
+        for participant, opponent_username in rows
+    ]
 
-    # Count wins (handles both user perspectives)
-    for m in matches:
-        if (m.winner_id == user_id):
-            wins += 1
+    return UserStatsResponse(
+        matches_won=stats.wins,
+        win_rate=round((stats.wins / total_matches) * 100, 2),
+        win_streak=stats.current_streak,
+        recent_matches=recent_matches,
+        next_cursor=next_cursor,
+    )
 
-    # Compute win rate
-    win_rate = round((wins / total_matches) * 100, 2)
 
-    # Compute win streak (from most recent backwards)
-    streak = 0
-    for m in reversed(matches):
-        if (m.winner_id == user_id):
-            streak += 1
-        else:
-            break
+async def get_rating_series(
+    db: AsyncSession,
+    user_id: int,
+    limit: int = 100,
+    bucket: Optional[str] = None,
+    days: int = 90,
+) -> RatingSeriesResponse:
+    """
+    Rating chart points, oldest first, from one (user_id, ts) index range scan.
 
-    # ✅ Build match summaries for *all* matches (not just last 5)
-    all_matches = []
-    for m in matches:
-        if m.winner_id == user_id:
-            outcome = "win"
-            rating_change = m.elo_change
-        else:
-            outcome = "lose"
-            rating_change = -m.elo_change
+    Without a bucket: the user's last `limit` points. With bucket="day": one
+    point per day for the last `days` days (that day's closing rating and net
+    change), capped to the last `limit` days that had matches.
+    """
+    query = select(
+        RatingHistory.ts, RatingHistory.elo_after, RatingHistory.delta, RatingHistory.match_id
+    ).where(RatingHistory.user_id == user_id)
 
-        all_matches.append(
-            RecentMatch(
-                outcome=outcome,
-                rating_change=rating_change,
-                question=m.leetcode_problem
-            )
-        )
+    if bucket != "day":
+        result = await db.execute(query.order_by(RatingHistory.ts.desc(), RatingHistory.id.desc()).limit(limit))
+        rows = list(reversed(result.all()))
+        return RatingSeriesResponse(user_id=user_id, points=[
+            RatingPoint(ts=ts, elo=elo, delta=delta, match_id=match_id) for ts, elo, delta, match_id in rows
+        ])
 
-    # ✅ Return full stats with all matches included
-    return UserStatsResponse(
-        matches_won=wins,
-        win_rate=win_rate,
-        win_streak=streak,
-        recent_matches=all_matches  # this now contains ALL matches
+    since = datetime.utcnow() - timedelta(days=days)
+    result = await db.execute(
+        query.where(RatingHistory.ts >= since).order_by(RatingHistory.ts, RatingHistory.id)
     )
+    by_day = {}  # date -> RatingPoint, insertion-ordered oldest -> newest
+    for ts, elo, delta, match_id in result:
+        day = ts.date()
+        point = by_day.get(day)
+        net = delta + (point.delta if point else 0)
+        by_day[day] = RatingPoint(
+            ts=datetime(day.year, day.month, day.day), elo=elo, delta=net, match_id=match_id
+        )
+    return RatingSeriesResponse(user_id=user_id, bucket="day", points=list(by_day.values())[-limit:])
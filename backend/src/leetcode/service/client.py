@@ -1,8 +1,10 @@
 # src/leetcode/service/client.py
+import os
 import httpx
 
 class LeetCodeGraphQLClient:
-    BASE_URL = "https://leetcode.com/graphql"
+    # Point at scripts/leetcode_stub.py for local load tests
+    BASE_URL = os.getenv("LEETCODE_GRAPHQL_URL", "https://leetcode.com/graphql")
 
     @staticmethod
     async def query(query: str, variables: dict = None):
@@ -2,7 +2,7 @@ from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
-from src.database.database import init_db
+from src.database.database import init_db, AsyncSessionLocal
 from src.matchmaking.routes import router as matchmaking_router
 from src.matchmaking.websocket_routes import router as websocket_router
 from src.results.routes import router as result_router
@@ -15,6 +15,11 @@ from src.profile.routes import router as profile_router
 from src.settings.routes import router as settings_router
 from src.friends.routes import router as friends_router
 from src.leetcode.routes import router as leetcode_router
+from src.matchmaking.metrics import loop_lag_monitor
+from src.matchmaking.websocket_manager import websocket_manager
+from src.matchmaking.outbox import settlement_outbox
+from src.users.leaderboard import leaderboard
+from src.users.search import user_search_index
 
 # --- Lifespan event (startup/shutdown) ---
 @asynccontextmanager
@@ -22,7 +27,22 @@ async def lifespan(app: FastAPI):
     await init_db()  # Run database initialization
     from src.leetcode.service.leetcode_service import LeetCodeService
     await LeetCodeService.load_cache()  # Load topic map cache
+    async with AsyncSessionLocal() as db:
+        indexed = await user_search_index.load(db)  # Friend search
+        print(f"🔎 Indexed {indexed} users for search")
+        try:
+            seeded = await leaderboard.seed_if_short(db)  # Redis sorted set behind /api/leaderboard
+            if seeded:
+                print(f"🏆 Seeded leaderboard with {seeded} users")
+        except Exception as e:
+            print(f"⚠️ Leaderboard not seeded, /api/leaderboard reads the users table: {e}")
+    loop_lag_monitor.start()  # Event-loop lag probe for /matchmaking/metrics
+    websocket_manager.start_sweeper()  # Server heartbeats + idle connection eviction
+    settlement_outbox.start()  # Replays unwritten settlements, then drains new ones (SETTLEMENT_MODE=outbox)
     yield
+    await websocket_manager.stop_sweeper()
+    await settlement_outbox.stop()
+    await loop_lag_monitor.stop()
 
 # --- FastAPI app instance ---
 app = FastAPI(lifespan=lifespan)
@@ -0,0 +1,123 @@
+# src/matchmaking/connection.py
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Callable, Optional
+from fastapi import WebSocket
+from .protocol import JSON_CODEC, Frame
+
+# Outbound messages buffered per socket before the overflow policy kicks in
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "64"))
+# "drop_oldest": discard the oldest droppable message (timer ticks, pongs), disconnect if none
+# "disconnect": close the socket as soon as the queue is full
+OVERFLOW_POLICY = os.getenv("WS_OVERFLOW_POLICY", "drop_oldest")
+# A single send that takes longer than this marks the socket as stuck
+SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+
+# Server sends {"type": "ping"} this often; clients answer with any message (normally "pong")
+HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "30"))
+# Connections silent for longer than this are evicted by the sweeper
+IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "90"))
+
+DROPPABLE_TYPES = {"timer_update", "ping", "pong"}
+
+
+class ClientConnection:
+    """
+    One matchmaking socket with a bounded outbound queue drained by its own writer task.
+
+    Senders call enqueue() and never wait on the network, so one slow client
+    cannot hold up the timer loop or the other player's notifications.
+    """
+
+    def __init__(
+        self,
+        user_id: int,
+        websocket: WebSocket,
+        on_close: Optional[Callable[["ClientConnection"], None]] = None,
+        codec=JSON_CODEC,
+        max_queue: int = SEND_QUEUE_SIZE,
+        overflow_policy: str = OVERFLOW_POLICY,
+        send_timeout: float = SEND_TIMEOUT,
+    ):
+        self.user_id = user_id
+        self.websocket = websocket
+        self.on_close = on_close
+        self.codec = codec  # Negotiated wire encoding (see protocol.py)
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy
+        self.send_timeout = send_timeout
+        self.outbox = deque()  # (message_type, encoded frame)
+        self.dropped = 0
+        self.closed = False
+        self.last_seen = time.monotonic()
+        self._wakeup = asyncio.Event()
+        self._writer_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._writer_task = asyncio.create_task(self._writer())
+
+    def touch(self):
+        """Record that the client sent something; keeps the sweeper away."""
+        self.last_seen = time.monotonic()
+
+    def enqueue(self, message: dict) -> bool:
+        """Queue a message for this client. Returns False if the connection is (now) closed."""
+        return self.enqueue_frame(message.get("type"), self.codec.encode(message))
+
+    def enqueue_frame(self, message_type: str, frame: Frame) -> bool:
+        """Queue an already-encoded frame (shared between recipients by broadcasts)."""
+        if self.closed:
+            return False
+
+        if len(self.outbox) >= self.max_queue:
+            if self.overflow_policy != "drop_oldest" or not self._drop_oldest():
+                print(f"⚠️ Send queue full for user {self.user_id}, disconnecting")
+                self.close()
+                return False
+
+        self.outbox.append((message_type, frame))
+        self._wakeup.set()
+        return True
+
+    def _drop_oldest(self) -> bool:
+        for index, (message_type, _) in enumerate(self.outbox):
+            if message_type in DROPPABLE_TYPES:
+                del self.outbox[index]
+                self.dropped += 1
+                return True
+        return False
+
+    async def _writer(self):
+        try:
+            while True:
+                while not self.outbox:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                _, frame = self.outbox.popleft()
+                send = self.websocket.send_bytes(frame) if isinstance(frame, bytes) else self.websocket.send_text(frame)
+                await asyncio.wait_for(send, self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Failed to send message to user {self.user_id}: {e}")
+            self.close()
+
+    def close(self):
+        """Stop the writer, drop queued messages and close the socket in the background."""
+        if self.closed:
+            return
+        self.closed = True
+        self.outbox.clear()
+        if self._writer_task and self._writer_task is not asyncio.current_task():
+            self._writer_task.cancel()
+        asyncio.create_task(self._close_socket())
+        if self.on_close:
+            self.on_close(self)
+
+    async def _close_socket(self):
+        try:
+            await asyncio.wait_for(self.websocket.close(), self.send_timeout)
+        except Exception:
+            pass  # Already closed or unreachable
@@ -0,0 +1,349 @@
+# src/matchmaking/elo_replay.py
+"""
+Offline Elo replay over the full match history.
+
+Streams settled matches in match_id order and recomputes every rating from
+scratch with the same formula as EloService, optionally for many parameter
+sets at once (what-if sweeps). Ratings live in a (parameter sets x users)
+NumPy matrix; consecutive matches that share no player are applied as one
+vectorized step, so the Python loop only runs once per run of independent
+matches rather than once per match and parameter set.
+
+    python -m src.matchmaking.elo_replay
+    python -m src.matchmaking.elo_replay --sweep provisional_k=32,40,48 --sweep resignation_penalty=0,2
+    python -m src.matchmaking.elo_replay --write        # store recomputed ratings (single parameter set only)
+
+--write rewrites users.user_elo and every stored per-match rating
+(match_history, match_participants, rating_history) in one transaction, so
+history charts and profiles agree with the users table afterwards.
+
+Resignations are read from match_history.resignation, so the penalty is
+replayed only where the loser actually resigned.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from dataclasses import dataclass, asdict, fields, replace
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select, update, bindparam
+
+from ..database.models import User, MatchHistory, MatchParticipant, RatingHistory, LIVE_MATCH_STATUSES
+from .elo_service import EloService, EXPECTED_SCORE_CLAMP
+from .settlement import settled_predicate
+
+STREAM_CHUNK_SIZE = 50_000
+WRITE_BATCH_SIZE = 1_000
+
+
+@dataclass(frozen=True)
+class EloParams:
+    default_k: float = EloService.DEFAULT_K_FACTOR
+    provisional_k: float = EloService.PROVISIONAL_K_FACTOR
+    experienced_k: float = EloService.EXPERIENCED_K_FACTOR
+    provisional_games: int = EloService.PROVISIONAL_GAMES
+    high_rating_threshold: float = EloService.HIGH_RATING_THRESHOLD
+    resignation_penalty: float = EloService.RESIGNATION_PENALTY
+    initial_rating: float = 1200  # User.user_elo default
+
+
+def _independent_runs(winners: List[int], losers: List[int]) -> Iterable[Tuple[int, int]]:
+    """Split matches into maximal consecutive runs in which no player appears twice."""
+    start, seen = 0, set()
+    for i, (winner, loser) in enumerate(zip(winners, losers)):
+        if winner in seen or loser in seen:
+            yield start, i
+            start, seen = i, set()
+        seen.add(winner)
+        seen.add(loser)
+    if start < len(winners):
+        yield start, len(winners)
+
+
+class EloReplay:
+    """Replays matches for one or more EloParams at once."""
+
+    def __init__(self, params: Sequence[EloParams]):
+        self.params = list(params)
+
+        def column(name):
+            return np.array([getattr(p, name) for p in self.params], dtype=np.float64)[:, None]
+
+        self._default_k = column("default_k")
+        self._provisional_k = column("provisional_k")
+        self._experienced_k = column("experienced_k")
+        self._provisional_games = column("provisional_games")
+        self._high_rating = column("high_rating_threshold")
+        self._penalty = column("resignation_penalty")
+        self._initial = column("initial_rating")
+
+        self.index: Dict[int, int] = {}  # user_id -> column
+        self.user_ids: List[int] = []
+        self.ratings = np.empty((len(self.params), 0))
+        self.games = np.empty(0)
+        self.matches = 0
+
+    def _columns(self, user_ids: Iterable[int]) -> np.ndarray:
+        columns = []
+        for user_id in user_ids:
+            column = self.index.get(user_id)
+            if column is None:
+                column = self.index[user_id] = len(self.user_ids)
+                self.user_ids.append(user_id)
+            columns.append(column)
+
+        if len(self.user_ids) > self.ratings.shape[1]:
+            capacity = max(len(self.user_ids), 2 * self.ratings.shape[1], 1024)
+            ratings = np.repeat(self._initial, capacity, axis=1)
+            ratings[:, :self.ratings.shape[1]] = self.ratings
+            games = np.zeros(capacity)
+            games[:self.games.size] = self.games
+            self.ratings, self.games = ratings, games
+        return np.asarray(columns, dtype=np.int64)
+
+    def _k_factor(self, ratings: np.ndarray, games: np.ndarray) -> np.ndarray:
+        """EloService.get_k_factor for a (params x matches) block."""
+        return np.where(
+            games < self._provisional_games,
+            self._provisional_k,
+            np.where(ratings >= self._high_rating, self._experienced_k, self._default_k),
+        )
+
+    def _apply(self, winners: np.ndarray, losers: np.ndarray, resigned: np.ndarray) -> np.ndarray:
+        """One vectorized step; no player may appear twice in the block."""
+        winner_ratings = self.ratings[:, winners]
+        loser_ratings = self.ratings[:, losers]
+        winner_games = self.games[winners]
+        loser_games = self.games[losers]
+
+        # Clamped like EloService's expected-score lookup table
+        difference = np.clip(loser_ratings - winner_ratings, -EXPECTED_SCORE_CLAMP, EXPECTED_SCORE_CLAMP)
+        winner_expected = 1 / (1 + np.power(10.0, difference / 400))
+        loser_expected = 1 / (1 + np.power(10.0, -difference / 400))
+        # np.rint rounds half to even, like the round() in EloService
+        winner_change = np.rint(self._k_factor(winner_ratings, winner_games) * (1.0 - winner_expected))
+        loser_change = np.rint(self._k_factor(loser_ratings, loser_games) * (0.0 - loser_expected))
+        loser_change -= self._penalty * resigned
+
+        self.ratings[:, winners] = winner_ratings + winner_change
+        self.ratings[:, losers] = loser_ratings + loser_change
+        self.games[winners] += 1
+        self.games[losers] += 1
+        # Per-match outcome under the first parameter set: changes and ratings after
+        return np.stack([winner_change[0], loser_change[0], self.ratings[0, winners], self.ratings[0, losers]])
+
+    def feed(self, winner_ids: Sequence[int], loser_ids: Sequence[int], resigned: Sequence[bool]) -> np.ndarray:
+        """
+        Replay a chunk of matches, in match_id order. Returns a 4 x matches
+        array for the first parameter set: winner change, loser change,
+        winner rating after and loser rating after.
+        """
+        winners = self._columns(winner_ids)
+        losers = self._columns(loser_ids)
+        resigned = np.asarray(resigned, dtype=np.float64)
+        steps = [
+            self._apply(winners[start:end], losers[start:end], resigned[start:end])
+            for start, end in _independent_runs(winners.tolist(), losers.tolist())
+        ]
+        self.matches += len(winners)
+        return np.concatenate(steps, axis=1) if steps else np.empty((4, 0))
+
+    def ratings_for(self, param_index: int = 0) -> Dict[int, int]:
+        row = self.ratings[param_index, :len(self.user_ids)]
+        return {user_id: int(rating) for user_id, rating in zip(self.user_ids, row)}
+
+
+async def stream_matches(db, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Settled matches as (match_ids, winner_ids, loser_ids, resigned) chunks in match_id order."""
+    result = await db.stream(
+        select(MatchHistory.match_id, MatchHistory.winner_id, MatchHistory.loser_id, MatchHistory.resignation)
+        .where(settled_predicate())
+        .order_by(MatchHistory.match_id)
+        .execution_options(yield_per=chunk_size)
+    )
+    async for rows in result.partitions(chunk_size):
+        yield (
+            [row[0] for row in rows],
+            [row[1] for row in rows],
+            [row[2] for row in rows],
+            [bool(row[3]) for row in rows],
+        )
+
+
+@dataclass(slots=True)
+class ReplayedMatch:
+    """One settled match as the first parameter set replays it."""
+    match_id: int
+    winner_id: int
+    loser_id: int
+    winner_change: int
+    loser_change: int
+    winner_elo: int  # Ratings after the match
+    loser_elo: int
+
+
+async def replay_history(
+    db, params: Sequence[EloParams], chunk_size: int = STREAM_CHUNK_SIZE, record: bool = False,
+) -> Tuple[EloReplay, List[ReplayedMatch]]:
+    """Replay every settled match. With `record`, also returns each match's replayed outcome (for --write)."""
+    engine = EloReplay(params)
+    replayed = []
+    async for match_ids, winners, losers, resigned in stream_matches(db, chunk_size):
+        outcomes = engine.feed(winners, losers, resigned)
+        if record:
+            replayed.extend(
+                ReplayedMatch(match_id, winner_id, loser_id, *map(int, outcome))
+                for match_id, winner_id, loser_id, outcome in zip(match_ids, winners, losers, outcomes.T)
+            )
+    return engine, replayed
+
+
+async def write_replay(db, engine: EloReplay, replayed: List[ReplayedMatch], batch_size: int = WRITE_BATCH_SIZE) -> int:
+    """
+    Store the first parameter set's replay: users.user_elo plus every derived
+    rating (match_history ratings and changes, match_participants and
+    rating_history rows), and the starting ratings of still-live matches.
+    user_stats holds no ratings and is left as is. Executemany UPDATEs in
+    batches; the caller commits once, so a failure leaves nothing half-written.
+    Returns users written.
+    """
+    users = User.__table__
+    matches = MatchHistory.__table__
+    participants = MatchParticipant.__table__
+    points = RatingHistory.__table__
+
+    async def executemany(statement, rows):
+        for start in range(0, len(rows), batch_size):
+            await db.execute(statement, rows[start:start + batch_size])
+
+    ratings = engine.ratings_for(0)
+    await executemany(
+        update(users).where(users.c.user_id == bindparam("uid")).values(user_elo=bindparam("elo")),
+        [{"uid": uid, "elo": elo} for uid, elo in ratings.items()],
+    )
+    await executemany(
+        update(matches).where(matches.c.match_id == bindparam("mid")).values(
+            winner_elo=bindparam("w_elo"), loser_elo=bindparam("l_elo"),
+            winner_elo_change=bindparam("w_change"), loser_elo_change=bindparam("l_change"),
+            elo_change=bindparam("change"),  # Backward-compatible abs(loser change), as settlement writes it
+        ),
+        [
+            {"mid": m.match_id, "w_elo": m.winner_elo, "l_elo": m.loser_elo,
+             "w_change": m.winner_change, "l_change": m.loser_change, "change": abs(m.loser_change)}
+            for m in replayed
+        ],
+    )
+    sides = [
+        {"uid": user_id, "mid": m.match_id, "change": change, "elo": elo}
+        for m in replayed
+        for user_id, change, elo in ((m.winner_id, m.winner_change, m.winner_elo), (m.loser_id, m.loser_change, m.loser_elo))
+    ]
+    for table in (participants, points):
+        delta = table.c.elo_delta if table is participants else table.c.delta
+        await executemany(
+            update(table)
+            .where(table.c.user_id == bindparam("uid"), table.c.match_id == bindparam("mid"))
+            .values({delta: bindparam("change"), table.c.elo_after: bindparam("elo")}),
+            sides,
+        )
+
+    # Live matches hold their players' starting ratings, which settlement rates from
+    for column, player in ((matches.c.winner_elo, matches.c.winner_id), (matches.c.loser_elo, matches.c.loser_id)):
+        await db.execute(
+            update(matches)
+            .where(matches.c.status.in_(LIVE_MATCH_STATUSES))
+            .values({column: select(users.c.user_elo).where(users.c.user_id == player).scalar_subquery()})
+        )
+    return len(ratings)
+
+
+def summarize(engine: EloReplay, current: Dict[int, int]) -> List[dict]:
+    """Distribution of replayed ratings per parameter set, and how far they are from the live ones."""
+    count = len(engine.user_ids)
+    live = np.array([current.get(user_id, 0) for user_id in engine.user_ids], dtype=np.float64)
+    reports = []
+    for i, params in enumerate(engine.params):
+        row = engine.ratings[i, :count]
+        diff = np.abs(row - live) if count else np.zeros(1)
+        reports.append({
+            "params": asdict(params),
+            "users": count,
+            "mean": round(float(row.mean()), 1) if count else 0.0,
+            "std": round(float(row.std()), 1) if count else 0.0,
+            **{f"p{p}": float(np.percentile(row, p)) if count else 0.0 for p in (1, 50, 99)},
+            "vs_current": {
+                "mean_abs_diff": round(float(diff.mean()), 2),
+                "max_abs_diff": float(diff.max()),
+                "changed_users": int((diff > 0).sum()),
+            },
+        })
+    return reports
+
+
+def _number(text: str):
+    value = float(text)
+    return int(value) if value.is_integer() else value
+
+
+def parse_sweeps(sweeps: Sequence[str]) -> List[EloParams]:
+    """["provisional_k=32,40", "resignation_penalty=0,2"] -> the cartesian product of EloParams."""
+    names = {f.name for f in fields(EloParams)}
+    axes = []
+    for sweep in sweeps:
+        name, _, values = sweep.partition("=")
+        if name not in names or not values:
+            raise ValueError(f"Bad --sweep {sweep!r}; expected one of {sorted(names)} as name=v1,v2")
+        axes.append([(name, _number(v)) for v in values.split(",")])
+    return [replace(EloParams(), **dict(combo)) for combo in itertools.product(*axes)]
+
+
+async def run(args) -> List[dict]:
+    from ..database.database import AsyncSessionLocal
+
+    params = parse_sweeps(args.sweep)
+    if args.write and len(params) != 1:
+        raise SystemExit("--write needs exactly one parameter set")
+
+    async with AsyncSessionLocal() as db:
+        started = time.perf_counter()
+        engine, replayed = await replay_history(db, params, args.chunk_size, record=args.write)
+        elapsed = time.perf_counter() - started
+        current = dict((await db.execute(select(User.id, User.user_elo))).all())
+        reports = summarize(engine, current)
+        for report in reports:
+            report["matches"] = engine.matches
+            report["replay_seconds"] = round(elapsed, 3)
+
+        if args.write:
+            try:
+                written = await write_replay(db, engine, replayed, args.batch_size)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                print("❌ Replay not written; ratings are unchanged")
+                raise
+            print(f"✅ Wrote recomputed ratings for {written} users and {len(replayed)} matches")
+            from ..users.leaderboard import leaderboard
+            try:
+                drift = await leaderboard.reconcile(db)
+                print(f"✅ Updated {len(drift)} leaderboard entries")
+            except Exception as e:
+                print(f"⚠️ Leaderboard not updated, run scripts/reconcile.py leaderboard: {e}")
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay match history with current or what-if Elo parameters")
+    parser.add_argument("--sweep", action="append", default=[], help="name=v1,v2,...; repeat for a grid")
+    parser.add_argument("--chunk-size", type=int, default=STREAM_CHUNK_SIZE)
+    parser.add_argument("--batch-size", type=int, default=WRITE_BATCH_SIZE)
+    parser.add_argument("--write", action="store_true", help="store the recomputed ratings in users.user_elo and match history")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
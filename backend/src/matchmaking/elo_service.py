@@ -1,27 +1,38 @@
 # src/matchmaking/elo_service.py
 import math
 
+# Expected scores are looked up by rating difference, clamped to +/-EXPECTED_SCORE_CLAMP.
+# At 2000 points the expected score is ~1e-5, so no rounded rating change is affected.
+EXPECTED_SCORE_CLAMP = 2000
+_EXPECTED_SCORES = tuple(
+    1 / (1 + math.pow(10, difference / 400))
+    for difference in range(-EXPECTED_SCORE_CLAMP, EXPECTED_SCORE_CLAMP + 1)
+)
+
 class EloService:
     # K-factor determines how much ratings change per game
     # Higher K-factor = more volatile ratings
     DEFAULT_K_FACTOR = 32  # Standard for most competitive games
     PROVISIONAL_K_FACTOR = 40  # Higher K for new players (first 30 games)
     EXPERIENCED_K_FACTOR = 16  # Lower K for highly rated players (2400+)
+    PROVISIONAL_GAMES = 30  # Games before a player stops being provisional
+    HIGH_RATING_THRESHOLD = 2400  # Rating from which EXPERIENCED_K_FACTOR applies
+    RESIGNATION_PENALTY = 2  # Extra points a resigning player loses
     
     @staticmethod
     def calculate_expected_score(player_rating: int, opponent_rating: int) -> float:
-        rating_difference = opponent_rating - player_rating
-        expected_score = 1 / (1 + math.pow(10, rating_difference / 400))
-        return expected_score
+        rating_difference = round(opponent_rating - player_rating)
+        rating_difference = max(-EXPECTED_SCORE_CLAMP, min(EXPECTED_SCORE_CLAMP, rating_difference))
+        return _EXPECTED_SCORES[rating_difference + EXPECTED_SCORE_CLAMP]
     
     @staticmethod
     def get_k_factor(player_rating: int, games_played: int = None) -> int:
         # Use higher K-factor for provisional players (first 30 games)
-        if games_played is not None and games_played < 30:
+        if games_played is not None and games_played < EloService.PROVISIONAL_GAMES:
             return EloService.PROVISIONAL_K_FACTOR
         
         # Use lower K-factor for highly rated players
-        if player_rating >= 2400:
+        if player_rating >= EloService.HIGH_RATING_THRESHOLD:
             return EloService.EXPERIENCED_K_FACTOR
         
         return EloService.DEFAULT_K_FACTOR
@@ -64,9 +75,9 @@ class EloService:
             loser_rating, winner_rating, loser_score, loser_games_played
         )
         
-        # Apply resignation penalty: loser loses an additional 2 points
+        # Apply resignation penalty: loser loses additional points
         if is_resignation:
-            loser_change -= 2
+            loser_change -= EloService.RESIGNATION_PENALTY
         
         return winner_change, loser_change
     
@@ -76,18 +87,43 @@ class EloService:
         opponent_rating: int,
         player_games_played: int = None
     ) -> dict:
+        # Same formula as calculate_rating_change, with one lookup for both outcomes
         expected_score = EloService.calculate_expected_score(player_rating, opponent_rating)
-        
-        win_change = EloService.calculate_rating_change(
-            player_rating, opponent_rating, 1.0, player_games_played
-        )
-        loss_change = EloService.calculate_rating_change(
-            player_rating, opponent_rating, 0.0, player_games_played
-        )
+        k_factor = EloService.get_k_factor(player_rating, player_games_played)
+        win_change = round(k_factor * (1.0 - expected_score))
+        loss_change = round(k_factor * (0.0 - expected_score))
         
         return {
             "win_probability": round(expected_score * 100, 1),
             "rating_change_on_win": win_change,
             "rating_change_on_loss": loss_change,
             "expected_score": expected_score
-        }
\ No newline at end of file
+        }
+
+    @staticmethod
+    def get_match_preview(player1, player2, player1_elo: int = None, player2_elo: int = None) -> dict:
+        """
+        /match-rating-preview payload for two players (User rows or UserSnapshots).
+
+        player1_elo/player2_elo are the ratings the match started with; they
+        default to the players' current ratings.
+        """
+        player1_elo = player1.user_elo if player1_elo is None else player1_elo
+        player2_elo = player2.user_elo if player2_elo is None else player2_elo
+
+        def side(player, rating, opponent_rating):
+            preview = EloService.get_rating_change_preview(rating, opponent_rating, player.games_played)
+            return {
+                "id": player.id,
+                "username": player.leetcode_username or player.email,
+                "current_elo": player.user_elo,
+                "games_played": player.games_played,
+                "win_probability": preview["win_probability"],
+                "rating_change_on_win": preview["rating_change_on_win"],
+                "rating_change_on_loss": preview["rating_change_on_loss"],
+            }
+
+        return {
+            "player1": side(player1, player1_elo, player2_elo),
+            "player2": side(player2, player2_elo, player1_elo),
+        }
@@ -4,6 +4,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from ..database.models import User
 from ..matchmaking.service import create_match_record
+from ..matchmaking.pairing import DEFAULT_ELO_WINDOW
 
 MATCHMAKING_KEY = "matchmaking_queue"
 REDIS_URL = "redis://localhost:6379"  # Use Elasticache endpoint in production
@@ -31,7 +32,7 @@ class MatchmakingManager:
         redis = await self.connect()
 
         # Look for nearby players within ±100 ELO
-        candidates = await redis.zrangebyscore(MATCHMAKING_KEY, elo - 100, elo + 100)
+        candidates = await redis.zrangebyscore(MATCHMAKING_KEY, elo - DEFAULT_ELO_WINDOW, elo + DEFAULT_ELO_WINDOW)
 
         for opp_id in candidates:
             opp_id = int(opp_id)
@@ -0,0 +1,85 @@
+# src/matchmaking/metrics.py
+import asyncio
+import os
+import resource
+import sys
+import time
+from collections import deque
+from typing import Optional
+
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))  # seconds between probes
+LOOP_LAG_SAMPLES = int(os.getenv("LOOP_LAG_SAMPLES", "3000"))     # ~5 minutes at the default interval
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of an unsorted sequence (0.0 for an empty one)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process; falls back to peak RSS off Linux."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS and kilobytes on Linux
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up a sleeping probe task."""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, max_samples: int = LOOP_LAG_SAMPLES):
+        self.interval = interval
+        self.samples = deque(maxlen=max_samples)
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+    def snapshot(self) -> dict:
+        samples = list(self.samples)
+        return {
+            "samples": len(samples),
+            "p50_ms": round(percentile(samples, 50) * 1000, 3),
+            "p99_ms": round(percentile(samples, 99) * 1000, 3),
+            "max_ms": round(self.max_lag * 1000, 3),
+        }
+
+
+# Global monitor, started from the app lifespan
+loop_lag_monitor = LoopLagMonitor()
+
+
+def process_snapshot() -> dict:
+    return {
+        "timestamp": time.time(),
+        "rss_bytes": current_rss_bytes(),
+        "event_loop_lag": loop_lag_monitor.snapshot(),
+    }
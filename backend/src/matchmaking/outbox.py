@@ -0,0 +1,292 @@
+# src/matchmaking/outbox.py
+"""
+Deferred settlement writes (SETTLEMENT_MODE=outbox).
+
+In outbox mode the WebSocket manager decides a result from the in-memory
+match state, records the winner there and pushes match_completed at once.
+The DB write is appended to a JSONL outbox file (fsynced before the players
+are told) and a background writer drains it in batches, retrying with
+backoff while the DB is unavailable. write_settlement() skips matches that
+are already settled, so each match is written exactly once even when the
+outbox is replayed after a crash. The file is truncated whenever every
+record in it has been committed.
+
+After SETTLEMENT_OUTBOX_ISOLATE_AFTER failed flushes in a row the writer
+retries the failing batch one record at a time, so one bad record cannot
+hold back every settlement behind it. A record that still fails while the
+DB answers a probe query is moved to the dead-letter file
+(SETTLEMENT_OUTBOX_DEAD_LETTER_PATH, same JSONL format, so it can be
+replayed once fixed by appending it to the outbox).
+
+The default SETTLEMENT_MODE=sync keeps settling on the request path. The
+outbox file is replayed on startup in either mode.
+"""
+import asyncio
+import json
+import os
+from dataclasses import dataclass, asdict, replace
+from datetime import datetime
+from typing import Dict, List, Optional
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from .settlement import SettlementResult, settle_match, write_settlement
+
+SETTLEMENT_MODE = os.getenv("SETTLEMENT_MODE", "sync")  # sync | outbox
+OUTBOX_PATH = os.getenv("SETTLEMENT_OUTBOX_PATH", "settlement_outbox.jsonl")
+OUTBOX_BATCH_SIZE = int(os.getenv("SETTLEMENT_OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_RETRY_MAX = float(os.getenv("SETTLEMENT_OUTBOX_RETRY_MAX", "30"))  # longest wait between retries, seconds
+OUTBOX_ISOLATE_AFTER = int(os.getenv("SETTLEMENT_OUTBOX_ISOLATE_AFTER", "3"))  # failed flushes before writing records one by one
+OUTBOX_DEAD_LETTER_PATH = os.getenv("SETTLEMENT_OUTBOX_DEAD_LETTER_PATH", "settlement_outbox.dead.jsonl")
+
+
+def _append(path: str, line: str):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+@dataclass
+class PendingSettlement:
+    """A decided result plus everything write_settlement() needs to store it."""
+    result: SettlementResult
+    match_seconds: int = 0
+    problem_slug: Optional[str] = None
+    winner_runtime: int = -1
+    winner_memory: float = -1.0
+    settled_at: Optional[datetime] = None
+
+    def to_json(self) -> str:
+        record = asdict(self)
+        record["settled_at"] = self.settled_at.isoformat() if self.settled_at else None
+        return json.dumps(record)
+
+    @classmethod
+    def from_json(cls, line: str) -> "PendingSettlement":
+        record = json.loads(line)
+        record["result"] = SettlementResult(**record["result"])
+        if record["settled_at"]:
+            record["settled_at"] = datetime.fromisoformat(record["settled_at"])
+        return cls(**record)
+
+
+class SettlementOutbox:
+    def __init__(
+        self,
+        path: str = OUTBOX_PATH,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        retry_max: float = OUTBOX_RETRY_MAX,
+        session_factory=None,
+        isolate_after: int = OUTBOX_ISOLATE_AFTER,
+        dead_letter_path: str = OUTBOX_DEAD_LETTER_PATH,
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.retry_max = retry_max
+        self._session_factory = session_factory
+        self.isolate_after = isolate_after
+        self.dead_letter_path = dead_letter_path
+        self.pending: Dict[int, PendingSettlement] = {}  # match_id -> record, in append order
+        self.written = 0
+        self.failed_attempts = 0
+        self.consecutive_failures = 0  # Failed flushes since the last committed batch
+        self.dead_lettered = 0
+        self._file_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def get(self, match_id: int) -> Optional[SettlementResult]:
+        """The result of a match whose write is still pending, as a replay."""
+        record = self.pending.get(match_id)
+        return replace(record.result, already_settled=True) if record else None
+
+    def pending_match_ids(self) -> List[int]:
+        return list(self.pending)
+
+    def _append_line(self, line: str):
+        _append(self.path, line)
+
+    async def add(self, record: PendingSettlement):
+        """Durably append a record; returns once it would survive a crash."""
+        match_id = record.result.match_id
+        if match_id in self.pending:
+            return
+        # Pending before the fsync, so settle() answers from it while the write is in flight
+        self.pending[match_id] = record
+        try:
+            async with self._file_lock:
+                await asyncio.to_thread(self._append_line, record.to_json())
+        except OSError:
+            self.pending.pop(match_id, None)
+            raise
+        self._wakeup.set()
+
+    def load(self) -> int:
+        """Read records left by a previous run into `pending`. Returns how many were found."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return 0
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                record = PendingSettlement.from_json(line)
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"⚠️ Skipping unreadable settlement outbox line: {e}")  # e.g. torn final write
+                continue
+            self.pending.setdefault(record.result.match_id, record)
+        return len(self.pending)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            replayed = self.load()
+            if replayed:
+                print(f"📬 Replaying {replayed} deferred settlements from {self.path}")
+                self._wakeup.set()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the writer after one last attempt to drain the outbox."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"⚠️ {len(self.pending)} settlements left in {self.path} for the next start: {e}")
+
+    async def _run(self):
+        delay = 0.5
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                delay = 0.5
+            except Exception as e:
+                self.failed_attempts += 1
+                print(f"❌ Settlement outbox write failed ({len(self.pending)} pending), retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.retry_max)
+                self._wakeup.set()
+
+    async def flush(self):
+        """
+        Write every pending record, one transaction per batch. Raises if the DB
+        fails; once isolate_after flushes in a row have failed, the batch is
+        written record by record and records that fail alone are dead-lettered.
+        """
+        while self.pending:
+            batch = list(self.pending.values())[:self.batch_size]
+            try:
+                if self.consecutive_failures >= self.isolate_after:
+                    for record in batch:
+                        await self._write_isolated(record)
+                else:
+                    await self._write(batch)
+                    self._written(batch)
+            except Exception:
+                self.consecutive_failures += 1
+                raise
+            self.consecutive_failures = 0
+
+            async with self._file_lock:
+                if not self.pending:
+                    await asyncio.to_thread(self._truncate)  # Everything in the file is committed or dead-lettered
+
+    async def _write(self, batch: List[PendingSettlement]):
+        async with self._session() as db:
+            for record in batch:
+                await write_settlement(
+                    db, record.result,
+                    match_seconds=record.match_seconds,
+                    problem_slug=record.problem_slug,
+                    winner_runtime=record.winner_runtime,
+                    winner_memory=record.winner_memory,
+                    settled_at=record.settled_at,
+                )
+            await db.commit()
+
+    def _written(self, batch: List[PendingSettlement]):
+        for record in batch:
+            self.pending.pop(record.result.match_id, None)
+        self.written += len(batch)
+
+    async def _write_isolated(self, record: PendingSettlement):
+        """Write one record on its own; if it fails while the DB is reachable, dead-letter it."""
+        try:
+            await self._write([record])
+        except Exception as e:
+            if not await self._db_reachable():
+                raise  # The DB is down, not the record; keep it and back off
+            await asyncio.to_thread(_append, self.dead_letter_path, record.to_json())
+            self.pending.pop(record.result.match_id, None)
+            self.dead_lettered += 1
+            print(f"❌ Moved settlement of match {record.result.match_id} to {self.dead_letter_path}: {e}")
+            return
+        self._written([record])
+
+    async def _db_reachable(self) -> bool:
+        try:
+            async with self._session() as db:
+                await db.execute(text("SELECT 1"))
+            return True
+        except Exception:
+            return False
+
+    def _truncate(self):
+        with open(self.path, "w", encoding="utf-8"):
+            pass
+
+    def _session(self):
+        if self._session_factory is None:
+            from ..database.database import AsyncSessionLocal
+            self._session_factory = AsyncSessionLocal
+        return self._session_factory()
+
+    def snapshot(self) -> dict:
+        return {
+            "mode": SETTLEMENT_MODE,
+            "pending": len(self.pending),
+            "written": self.written,
+            "failed_attempts": self.failed_attempts,
+            "dead_lettered": self.dead_lettered,
+        }
+
+
+async def settle(db: AsyncSession, match_id: int, user_id: int, **kwargs) -> SettlementResult:
+    """
+    settle_match(), but answers from the live match state or the outbox once
+    a result was decided there, so the match is never settled twice. A
+    result settled here is recorded in the live match state (stopping its
+    timer), and the WebSocket manager defers to it while it is in flight.
+    """
+    from .websocket_manager import websocket_manager
+
+    timer_data = websocket_manager.match_timers.get(match_id)
+    recorded = (timer_data or {}).get("result") or settlement_outbox.get(match_id)
+    if recorded:
+        if user_id not in (recorded.winner_id, recorded.loser_id):
+            raise HTTPException(status_code=400, detail="User not in this match")
+        return replace(recorded, already_settled=True)
+
+    if timer_data is not None:
+        timer_data["settling"] = timer_data.get("settling", 0) + 1  # settle_in_memory() must not decide meanwhile
+    try:
+        result = await settle_match(db, match_id, user_id, **kwargs)
+    finally:
+        if timer_data is not None:
+            timer_data["settling"] -= 1
+    websocket_manager.record_settled(match_id, result)
+    return result
+
+
+# Global outbox, started from the app lifespan
+settlement_outbox = SettlementOutbox()
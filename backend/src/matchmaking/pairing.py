@@ -0,0 +1,125 @@
+# src/matchmaking/pairing.py
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+
+DEFAULT_ELO_WINDOW = 100  # Players within ±100 ELO can be matched
+
+
+class PairingStrategy(ABC):
+    """
+    Decides which two queued players should be matched.
+
+    The queue is a dict of user_id -> entry (at least {"elo", "joined_at"}) in
+    join order. Used live by WebSocketManager and offline by the simulator.
+    """
+    name = "base"
+    # Strategies whose decision depends on wait time must be re-run on a timer,
+    # not only when somebody joins
+    time_dependent = False
+
+    @abstractmethod
+    def find_pair(self, queue: Dict[int, dict], now: float, newcomer: int = None) -> Optional[Tuple[int, int]]:
+        """
+        Return (user1_id, user2_id) or None.
+
+        `newcomer` is a hint that the queue had no compatible pair before that
+        user joined, so only pairs involving the newcomer need checking.
+        """
+
+
+class FixedWindowPairing(PairingStrategy):
+    """First queued pair (FIFO) whose ELO difference is within a fixed window."""
+    name = "fixed"
+
+    def __init__(self, window: int = DEFAULT_ELO_WINDOW):
+        self.window = window
+
+    def find_pair(self, queue, now, newcomer=None):
+        if newcomer is not None and newcomer in queue:
+            newcomer_elo = queue[newcomer]["elo"]
+            for user_id, entry in queue.items():
+                if user_id != newcomer and abs(entry["elo"] - newcomer_elo) <= self.window:
+                    return user_id, newcomer
+            return None
+
+        items = list(queue.items())
+        for i in range(len(items)):
+            for j in range(i + 1, len(items)):
+                if abs(items[i][1]["elo"] - items[j][1]["elo"]) <= self.window:
+                    return items[i][0], items[j][0]
+        return None
+
+
+class ExpandingWindowPairing(PairingStrategy):
+    """Window grows with time in queue; a pair needs both players' windows to allow it."""
+    name = "expanding"
+    time_dependent = True
+
+    def __init__(self, base_window: int = DEFAULT_ELO_WINDOW, growth_per_second: float = 10, max_window: int = 400):
+        self.base_window = base_window
+        self.growth_per_second = growth_per_second
+        self.max_window = max_window
+
+    def window(self, entry: dict, now: float) -> float:
+        waited = max(0.0, now - entry["joined_at"])
+        return min(self.max_window, self.base_window + self.growth_per_second * waited)
+
+    def find_pair(self, queue, now, newcomer=None):
+        if newcomer is not None and newcomer in queue:
+            newcomer_elo = queue[newcomer]["elo"]
+            newcomer_window = self.window(queue[newcomer], now)
+            for user_id, entry in queue.items():
+                if user_id != newcomer and abs(entry["elo"] - newcomer_elo) <= min(newcomer_window, self.window(entry, now)):
+                    return user_id, newcomer
+            return None
+
+        # Timer pass: every window may have grown, so walk the queue in ELO order.
+        # A player's partners lie within its own window, so each scan stops at the
+        # first rating beyond it: O(n log n + pairs within reach), not O(n^2).
+        position = {user_id: i for i, user_id in enumerate(queue)}
+        ranked = sorted(queue.items(), key=lambda item: item[1]["elo"])
+        windows = [self.window(entry, now) for _, entry in ranked]
+        best = None
+        for i, (id1, entry1) in enumerate(ranked):
+            for j in range(i + 1, len(ranked)):
+                id2, entry2 = ranked[j]
+                gap = entry2["elo"] - entry1["elo"]
+                if gap > windows[i]:
+                    break
+                if gap <= windows[j]:
+                    # Same answer as a FIFO scan: the compatible pair that queued first
+                    pair = tuple(sorted((position[id1], position[id2])))
+                    if best is None or pair < best:
+                        best = pair
+        if best is None:
+            return None
+        order = list(queue)
+        return order[best[0]], order[best[1]]
+
+
+class ClosestEloPairing(PairingStrategy):
+    """Within the fixed window, pair the newcomer with the closest rating instead of the oldest."""
+    name = "closest"
+
+    def __init__(self, window: int = DEFAULT_ELO_WINDOW):
+        self.window = window
+
+    def find_pair(self, queue, now, newcomer=None):
+        candidates = [newcomer] if newcomer is not None and newcomer in queue else list(queue)
+        best = None
+        for user_id in candidates:
+            elo = queue[user_id]["elo"]
+            for other_id, entry in queue.items():
+                if other_id == user_id:
+                    continue
+                gap = abs(entry["elo"] - elo)
+                if gap <= self.window and (best is None or gap < best[0]):
+                    best = (gap, other_id, user_id)
+        return (best[1], best[2]) if best else None
+
+
+PAIRING_STRATEGIES = {
+    FixedWindowPairing.name: FixedWindowPairing,
+    ExpandingWindowPairing.name: ExpandingWindowPairing,
+    ClosestEloPairing.name: ClosestEloPairing,
+}
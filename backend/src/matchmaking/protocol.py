@@ -0,0 +1,143 @@
+# src/matchmaking/protocol.py
+"""
+Wire encodings for the matchmaking socket.
+
+Clients pick an encoding at connect time through the WebSocket subprotocol
+header (`new WebSocket(url, ["lolc.msgpack.v1"])`). Without one, the socket
+speaks plain JSON text frames exactly as older frontends expect.
+
+The MessagePack encoding sends binary frames and replaces the "type" string
+with a small integer under "t" (see MESSAGE_TYPE_CODES). permessage-deflate
+compression is negotiated separately by the ASGI server: uvicorn accepts it
+whenever the client offers it (`--ws-per-message-deflate`, on by default).
+"""
+import json
+from typing import Union
+
+try:
+    import orjson  # Fast JSON backend; optional
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+try:
+    import msgpack  # Binary encoding; optional
+except ImportError:  # pragma: no cover - depends on the environment
+    msgpack = None
+
+Frame = Union[str, bytes]
+
+# Stable codes for binary clients. Append new types; never renumber.
+MESSAGE_TYPE_CODES = {
+    "connected": 1,
+    "queue_joined": 2,
+    "queue_left": 3,
+    "match_found": 4,
+    "timer_update": 5,
+    "match_completed": 6,
+    "error": 7,
+    "submission_invalid": 8,
+    "ping": 9,
+    "pong": 10,
+    "join_queue": 11,
+    "leave_queue": 12,
+    "submit_solution": 13,
+    "resign_match": 14,
+    "match_resumed": 15,
+    "resume_failed": 16,
+}
+MESSAGE_TYPE_NAMES = {code: name for name, code in MESSAGE_TYPE_CODES.items()}
+
+
+def encode_message(message: dict) -> str:
+    """Serialize a WebSocket message to a compact JSON text frame."""
+    if orjson is not None:
+        return orjson.dumps(message, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(message, separators=(",", ":"))
+
+
+def patch_frame(frame: str, extra: dict) -> str:
+    """
+    Add top-level fields to an already-encoded JSON object frame.
+
+    Lets a large shared payload (e.g. match_found with the problem) be
+    serialized once while each recipient still gets its own small fields.
+    """
+    if not extra:
+        return frame
+    patch = encode_message(extra)
+    if frame == "{}":
+        return patch
+    return f"{frame[:-1]},{patch[1:]}"
+
+
+class JsonCodec:
+    """Default encoding: JSON text frames with string message types."""
+    name = "json"
+    subprotocol = None
+    binary = False
+
+    def encode(self, message: dict) -> str:
+        return encode_message(message)
+
+    def decode(self, data: Frame) -> dict:
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+
+    def patch(self, frame: str, extra: dict) -> str:
+        return patch_frame(frame, extra)
+
+
+class MsgpackCodec:
+    """Compact encoding: MessagePack binary frames with integer message types under "t"."""
+    name = "msgpack"
+    subprotocol = "lolc.msgpack.v1"
+    binary = True
+
+    def encode(self, message: dict) -> bytes:
+        message_type = message.get("type")
+        if message_type in MESSAGE_TYPE_CODES:
+            message = {"t": MESSAGE_TYPE_CODES[message_type], **{k: v for k, v in message.items() if k != "type"}}
+        return msgpack.packb(message, use_bin_type=True)
+
+    def decode(self, data: Frame) -> dict:
+        message = msgpack.unpackb(data, raw=False) if isinstance(data, bytes) else json.loads(data)
+        if "t" in message and "type" not in message:
+            code = message.pop("t")
+            message["type"] = MESSAGE_TYPE_NAMES.get(code, code)
+        return message
+
+    def patch(self, frame: bytes, extra: dict) -> bytes:
+        """Append map entries by rewriting the map header, without re-encoding the body."""
+        if not extra:
+            return frame
+        entries = b"".join(msgpack.packb(k, use_bin_type=True) + msgpack.packb(v, use_bin_type=True) for k, v in extra.items())
+        header = frame[0]
+        if 0x80 <= header <= 0x8f and (header & 0x0f) + len(extra) <= 0x0f:
+            return bytes([header + len(extra)]) + frame[1:] + entries
+        if header == 0xde:
+            size = int.from_bytes(frame[1:3], "big") + len(extra)
+            if size <= 0xffff:
+                return b"\xde" + size.to_bytes(2, "big") + frame[3:] + entries
+        return msgpack.packb({**msgpack.unpackb(frame, raw=False), **extra}, use_bin_type=True)
+
+
+JSON_CODEC = JsonCodec()
+MSGPACK_CODEC = MsgpackCodec() if msgpack is not None else None
+
+CODECS_BY_SUBPROTOCOL = {
+    codec.subprotocol: codec for codec in (MSGPACK_CODEC,) if codec is not None
+}
+
+
+def negotiate_codec(offered_subprotocols) -> tuple:
+    """
+    Pick the first offered subprotocol we support.
+
+    Returns (codec, subprotocol to accept with); JSON and None when nothing matches.
+    """
+    for subprotocol in offered_subprotocols or []:
+        codec = CODECS_BY_SUBPROTOCOL.get(subprotocol)
+        if codec is not None:
+            return codec, subprotocol
+    return JSON_CODEC, None
@@ -1,32 +1,22 @@
 # src/matchmaking/routes.py
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_, func
+from sqlalchemy import select
 from ..database.database import get_db
-from ..database.models import User, MatchHistory
+from ..database.models import User, MatchHistory, MatchStatus
 from ..matchmaking.manager import MatchmakingManager
 from ..matchmaking.manager import MATCHMAKING_KEY
+from ..users.leaderboard import leaderboard
 from ..matchmaking.schemas import QueueResponse, MatchResponse
+from ..matchmaking.service import get_live_match
 from ..matchmaking.elo_service import EloService
-from ..leetcode.schemas import Problem
+from ..matchmaking.user_context import user_contexts
+from ..matchmaking.settlement import parse_submission_stats
+from ..matchmaking.outbox import settle
 
 router = APIRouter(tags=["Matchmaking"])
 manager = MatchmakingManager()
 
-async def get_user_games_played(user_id: int, db: AsyncSession) -> int:
-    """Get the total number of completed games for a user."""
-    result = await db.execute(
-        select(func.count(MatchHistory.match_id))
-        .where(
-            or_(
-                MatchHistory.winner_id == user_id,
-                MatchHistory.loser_id == user_id
-            )
-        )
-        .where(MatchHistory.elo_change != 0)  # Only count completed matches
-    )
-    return result.scalar() or 0
-
 @router.post("/queue/{user_id}", response_model=QueueResponse)
 async def join_queue(user_id: int, db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(User).where(User.id == user_id))
@@ -50,7 +40,7 @@ async def join_queue(user_id: int, db: AsyncSession = Depends(get_db)):
             match_id=match["match_id"],
             opponent=match["opponent"],
             opponent_elo=match["opponent_elo"],
-            problem=problem.dict() if problem else {}
+            problem=problem.model_dump() if problem else {}
         )
         return QueueResponse(status="matched", match=match_response)
     
@@ -74,35 +64,10 @@ async def get_match_status(user_id: int, db: AsyncSession = Depends(get_db)):
         # User is still in queue, so no match yet
         return QueueResponse(status="waiting", match=None)
     
-    # User is not in queue, check if they have a recent match with "TBD" problem
-    # Look for any recent match with TBD status (active match)
-    recent_match_result = await db.execute(
-        select(MatchHistory)
-        .where(
-            or_(
-                MatchHistory.winner_id == user_id,
-                MatchHistory.loser_id == user_id
-            )
-        )
-        .where(MatchHistory.leetcode_problem == "TBD")  # Active match indicator
-        .order_by(MatchHistory.match_id.desc())
-        .limit(1)
-    )
-    match = recent_match_result.scalar_one_or_none()
+    # User is not in queue, check if they have a live match
+    match = await get_live_match(db, user_id)
     
     if match:
-        # Check if match is completed (elo_change != 0 means completed)
-        if match.elo_change != 0:
-            # Match is completed, determine if user won or lost
-            user_won = match.winner_id == user_id
-            return QueueResponse(status="completed", match=MatchResponse(
-                match_id=match.match_id,
-                opponent="",  # Not needed for completed status
-                opponent_elo=0,
-                problem=manager.problem.dict() if manager.problem else Problem(),
-                result="won" if user_won else "lost"
-            ))
-        
         # Match is still active
         opponent_id = match.loser_id if match.winner_id == user_id else match.winner_id
         opponent_result = await db.execute(select(User).where(User.id == opponent_id))
@@ -115,7 +80,7 @@ async def get_match_status(user_id: int, db: AsyncSession = Depends(get_db)):
                     match_id=match.match_id,
                     opponent=opponent.email,
                     opponent_elo=opponent.user_elo,
-                    problem=manager.problem.dict() if manager.problem else {}
+                    problem=manager.problem.model_dump() if manager.problem else {}
                 )
             )
     
@@ -124,268 +89,88 @@ async def get_match_status(user_id: int, db: AsyncSession = Depends(get_db)):
 @router.post("/submit/{match_id}/{user_id}")
 async def submit_solution(match_id: int, user_id: int, db: AsyncSession = Depends(get_db)):
     """Handle when a user submits their solution and wins the match"""
-    
-    # Find the match
-    match_result = await db.execute(
-        select(MatchHistory).where(MatchHistory.match_id == match_id)
-    )
-    match = match_result.scalar_one_or_none()
-    
-    if not match:
-        raise HTTPException(status_code=404, detail="Match not found")
-    
-    # Check if match is already completed
-    if match.elo_change != 0:
-        raise HTTPException(status_code=400, detail="Match already completed")
-    
-    # Determine winner and loser
-    if match.winner_id == user_id:
-        winner_id = match.winner_id
-        loser_id = match.loser_id
-    elif match.loser_id == user_id:
-        winner_id = match.loser_id
-        loser_id = match.winner_id
-        # Swap winner/loser in the match record
-        match.winner_id = winner_id
-        match.loser_id = loser_id
-    else:
-        raise HTTPException(status_code=400, detail="User not in this match")
-    
-    # Get winner's LeetCode username to fetch submission data
-    winner_result = await db.execute(select(User).where(User.id == winner_id))
-    winner = winner_result.scalar_one_or_none()
-    loser_result = await db.execute(select(User).where(User.id == loser_id))
-    loser = loser_result.scalar_one_or_none()
-    
-    if not winner or not loser:
-        raise HTTPException(status_code=404, detail="Player data not found")
-    
-    # Get winner's recent submission for runtime and memory data
     from ..leetcode.service.leetcode_service import LeetCodeService
+    from ..matchmaking.websocket_manager import websocket_manager
+
+    # Runtime and memory come from the winner's latest submission (fetched before any row is locked)
+    leetcode_username = (await db.execute(select(User.leetcode_username).where(User.id == user_id))).scalar_one_or_none()
     try:
-        if winner.leetcode_username:
-            recent_submission = await LeetCodeService.get_recent_user_submission(winner.leetcode_username)
-            if recent_submission:
-                # Parse runtime (remove "ms" and convert to int)
-                try:
-                    winner_runtime = int(recent_submission.runtime.replace(" ms", "").replace("ms", "")) if recent_submission.runtime else -1
-                except (ValueError, AttributeError):
-                    winner_runtime = -1
-                
-                # Parse memory (remove "MB" and convert to float)
-                try:
-                    winner_memory = float(recent_submission.memory.replace(" MB", "").replace("MB", "")) if recent_submission.memory else -1.0
-                except (ValueError, AttributeError):
-                    winner_memory = -1.0
-            else:
-                winner_runtime = -1
-                winner_memory = -1.0
-        else:
-            winner_runtime = -1
-            winner_memory = -1.0
+        recent_submission = await LeetCodeService.get_recent_user_submission(leetcode_username) if leetcode_username else None
     except Exception as e:
         print(f"Error getting winner submission data: {e}")
-        winner_runtime = -1
-        winner_memory = -1.0
-    
-    # Set match duration (fallback - WebSocket should handle this)
-    match.match_seconds = 0  # Default for REST API submissions
-    
-    # Get games played for both players for Elo calculation
-    winner_games_played = await get_user_games_played(winner_id, db)
-    loser_games_played = await get_user_games_played(loser_id, db)
-    
-    # Use original ELOs from match record for consistent calculation
-    original_winner_elo = match.winner_elo if match.winner_id == winner_id else match.loser_elo
-    original_loser_elo = match.loser_elo if match.winner_id == winner_id else match.winner_elo
-    
-    # Calculate ELO changes using original match ELOs
-    winner_elo_change, loser_elo_change = EloService.calculate_match_rating_changes(
-        winner_rating=original_winner_elo,
-        loser_rating=original_loser_elo,
-        winner_games_played=winner_games_played,
-        loser_games_played=loser_games_played,
-        is_resignation=False
+        recent_submission = None
+    winner_runtime, winner_memory = parse_submission_stats(recent_submission)
+
+    problem = websocket_manager.match_problems.get(match_id)
+    result = await settle(
+        db, match_id, user_id,
+        match_seconds=0,  # Default for REST API submissions (WebSocket sends the real duration)
+        problem_slug=problem.slug if problem else None,
+        winner_runtime=winner_runtime,
+        winner_memory=winner_memory,
     )
-    
-    # Store all ELO changes accurately
-    match.elo_change = abs(loser_elo_change)  # Keep for backward compatibility
-    match.winner_elo_change = winner_elo_change  # New: Actual winner gain
-    match.loser_elo_change = loser_elo_change    # New: Actual loser loss (negative)
-    
-    # Update user ELOs
-    winner.user_elo += winner_elo_change
-    loser.user_elo += loser_elo_change  # This will be negative
-    match.winner_elo = winner.user_elo
-    match.loser_elo = loser.user_elo
-    
-    # Set runtime and memory data
-    match.winner_runtime = winner_runtime
-    match.loser_runtime = -1  # Loser gets -1 for runtime
-    match.winner_memory = winner_memory
-    match.loser_memory = -1.0  # Loser gets -1 for memory
-    
-    await db.commit()
-    
+    user_contexts.record_result(result)
+    leaderboard.record_result(result)
+
     return {
         "status": "completed", 
-        "winner_id": winner_id, 
-        "winner_elo_change": winner_elo_change,
-        "loser_elo_change": loser_elo_change,
-        "elo_change": abs(loser_elo_change)  # For backward compatibility
+        "winner_id": result.winner_id, 
+        "winner_elo_change": result.winner_elo_change,
+        "loser_elo_change": result.loser_elo_change,
+        "elo_change": abs(result.loser_elo_change)  # For backward compatibility
     }
 
 @router.post("/resign/{match_id}/{user_id}")
 async def resign_match(match_id: int, user_id: int, db: AsyncSession = Depends(get_db)):
     """Handle when a user resigns from a match"""
-    
-    # Find the match
-    match_result = await db.execute(
-        select(MatchHistory).where(MatchHistory.match_id == match_id)
-    )
-    match = match_result.scalar_one_or_none()
-    
-    if not match:
-        raise HTTPException(status_code=404, detail="Match not found")
-    
-    # Check if match is already completed
-    if match.elo_change != 0:
-        raise HTTPException(status_code=400, detail="Match already completed")
-    
-    # Determine winner and loser (resigning user loses)
-    if match.winner_id == user_id:
-        # User was winner, now becomes loser
-        winner_id = match.loser_id
-        loser_id = match.winner_id
-        match.winner_id = winner_id
-        match.loser_id = loser_id
-    elif match.loser_id == user_id:
-        # User was loser, stays loser
-        winner_id = match.winner_id
-        loser_id = match.loser_id
-    else:
-        raise HTTPException(status_code=400, detail="User not in this match")
-    
-    # Get the problem for this match and update the leetcode_problem field
     from ..matchmaking.websocket_manager import websocket_manager
+
     problem = websocket_manager.match_problems.get(match_id)
-    if problem:
-        try:
-            problem_slug = problem.slug if hasattr(problem, 'slug') else str(problem.get('slug', 'unknown'))
-            match.leetcode_problem = problem_slug
-            print(f"📝 Updated resigned match {match_id} with problem slug: {problem_slug}")
-        except Exception as e:
-            print(f"⚠️ Error getting problem slug for resigned match {match_id}: {e}")
-            match.leetcode_problem = "unknown"
-    else:
+    if not problem:
         print(f"⚠️ Warning: No problem found for resigned match {match_id}")
-        match.leetcode_problem = "unknown"
-    
-    # Set match duration (fallback - WebSocket should handle this)
-    match.match_seconds = 0  # Default for REST API resignations
-    
-    # Get user objects and games played for Elo calculation
-    winner_result = await db.execute(select(User).where(User.id == winner_id))
-    winner = winner_result.scalar_one_or_none()
-    loser_result = await db.execute(select(User).where(User.id == loser_id))
-    loser = loser_result.scalar_one_or_none()
-    
-    if not winner or not loser:
-        raise HTTPException(status_code=404, detail="Player data not found")
-    
-    # Get games played for both players for Elo calculation
-    winner_games_played = await get_user_games_played(winner_id, db)
-    loser_games_played = await get_user_games_played(loser_id, db)
-    
-    # Use original ELOs from match record for consistent calculation
-    original_winner_elo = match.winner_elo if match.winner_id == winner_id else match.loser_elo
-    original_loser_elo = match.loser_elo if match.winner_id == winner_id else match.winner_elo
-    
-    # Calculate ELO changes using original match ELOs with resignation penalty
-    winner_elo_change, loser_elo_change = EloService.calculate_match_rating_changes(
-        winner_rating=original_winner_elo,
-        loser_rating=original_loser_elo,
-        winner_games_played=winner_games_played,
-        loser_games_played=loser_games_played,
-        is_resignation=True
+    result = await settle(
+        db, match_id, user_id,
+        resignation=True,
+        match_seconds=0,  # Default for REST API resignations
+        problem_slug=problem.slug if problem else None,
     )
-    
-    # Store all ELO changes accurately
-    match.elo_change = abs(loser_elo_change)  # Keep for backward compatibility
-    match.winner_elo_change = winner_elo_change  # New: Actual winner gain
-    match.loser_elo_change = loser_elo_change    # New: Actual loser loss (negative)
-    
-    # Update user ELOs
-    winner.user_elo += winner_elo_change
-    loser.user_elo += loser_elo_change  # This will be negative
-    match.winner_elo = winner.user_elo
-    match.loser_elo = loser.user_elo
-    
-    # Set runtime and memory data for resignation (both get -1 since no valid submission)
-    match.winner_runtime = -1
-    match.loser_runtime = -1
-    match.winner_memory = -1.0
-    match.loser_memory = -1.0
-    
-    await db.commit()
-    
+    user_contexts.record_result(result)
+    leaderboard.record_result(result)
+
     return {
         "status": "completed", 
-        "winner_id": winner_id, 
-        "loser_id": loser_id,
+        "winner_id": result.winner_id, 
+        "loser_id": result.loser_id,
         "resignation": True,
-        "winner_elo_change": winner_elo_change,
-        "loser_elo_change": loser_elo_change
+        "winner_elo_change": result.winner_elo_change,
+        "loser_elo_change": result.loser_elo_change
     }
 
 @router.get("/rating-preview/{user_id}/{opponent_id}")
 async def get_rating_preview(user_id: int, opponent_id: int, db: AsyncSession = Depends(get_db)):
     """Get a preview of potential rating changes before a match"""
     
-    # Get both users
-    user_result = await db.execute(select(User).where(User.id == user_id))
-    user = user_result.scalar_one_or_none()
-    
-    opponent_result = await db.execute(select(User).where(User.id == opponent_id))
-    opponent = opponent_result.scalar_one_or_none()
+    # Connected players are served from their snapshots; others are read from the DB
+    user = user_contexts.get(user_id) or await db.get(User, user_id)
+    opponent = user_contexts.get(opponent_id) or await db.get(User, opponent_id)
     
     if not user or not opponent:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Get games played for both players
-    user_games_played = await get_user_games_played(user_id, db)
-    opponent_games_played = await get_user_games_played(opponent_id, db)
-    
-    # Get rating change previews for both players
-    user_preview = EloService.get_rating_change_preview(
-        user.user_elo, opponent.user_elo, user_games_played
-    )
-    opponent_preview = EloService.get_rating_change_preview(
-        opponent.user_elo, user.user_elo, opponent_games_played
-    )
-    
-    return {
-        "user": {
-            "id": user_id,
-            "current_elo": user.user_elo,
-            "games_played": user_games_played,
-            "win_probability": user_preview["win_probability"],
-            "rating_change_on_win": user_preview["rating_change_on_win"],
-            "rating_change_on_loss": user_preview["rating_change_on_loss"]
-        },
-        "opponent": {
-            "id": opponent_id,
-            "current_elo": opponent.user_elo,
-            "games_played": opponent_games_played,
-            "win_probability": opponent_preview["win_probability"],
-            "rating_change_on_win": opponent_preview["rating_change_on_win"],
-            "rating_change_on_loss": opponent_preview["rating_change_on_loss"]
-        }
-    }
+    preview = EloService.get_match_preview(user, opponent)
+    for side in preview.values():
+        del side["username"]
+    return {"user": preview["player1"], "opponent": preview["player2"]}
 
 @router.get("/match-rating-preview/{match_id}")
 async def get_match_rating_preview(match_id: int, db: AsyncSession = Depends(get_db)):
     """Get rating preview for both players in a match"""
+    from ..matchmaking.websocket_manager import websocket_manager
+
+    # Live matches: computed once at match creation
+    cached = websocket_manager.get_match_preview(match_id)
+    if cached:
+        return cached
     
     # Find the match
     match_result = await db.execute(
@@ -397,52 +182,15 @@ async def get_match_rating_preview(match_id: int, db: AsyncSession = Depends(get
         raise HTTPException(status_code=404, detail="Match not found")
     
     # Get both players
-    user1_result = await db.execute(select(User).where(User.id == match.winner_id))
-    user1 = user1_result.scalar_one_or_none()
-    
-    user2_result = await db.execute(select(User).where(User.id == match.loser_id))
-    user2 = user2_result.scalar_one_or_none()
+    user1 = await db.get(User, match.winner_id)
+    user2 = await db.get(User, match.loser_id)
     
     if not user1 or not user2:
         raise HTTPException(status_code=404, detail="Player data not found")
     
-    # Get games played for both players
-    user1_games_played = await get_user_games_played(match.winner_id, db)
-    user2_games_played = await get_user_games_played(match.loser_id, db)
-    
     # Use the original ELOs stored in the match record (at match start time)
     # This ensures preview matches actual calculation
-    original_user1_elo = match.winner_elo if match.winner_id == user1.id else match.loser_elo
-    original_user2_elo = match.loser_elo if match.winner_id == user1.id else match.winner_elo
-    
-    # Get rating change previews using original match ELOs
-    user1_preview = EloService.get_rating_change_preview(
-        original_user1_elo, original_user2_elo, user1_games_played
-    )
-    user2_preview = EloService.get_rating_change_preview(
-        original_user2_elo, original_user1_elo, user2_games_played
-    )
-    
-    return {
-        "player1": {
-            "id": user1.id,
-            "username": user1.leetcode_username or user1.email,
-            "current_elo": user1.user_elo,
-            "games_played": user1_games_played,
-            "win_probability": user1_preview["win_probability"],
-            "rating_change_on_win": user1_preview["rating_change_on_win"],
-            "rating_change_on_loss": user1_preview["rating_change_on_loss"]
-        },
-        "player2": {
-            "id": user2.id,
-            "username": user2.leetcode_username or user2.email,
-            "current_elo": user2.user_elo,
-            "games_played": user2_games_played,
-            "win_probability": user2_preview["win_probability"],
-            "rating_change_on_win": user2_preview["rating_change_on_win"],
-            "rating_change_on_loss": user2_preview["rating_change_on_loss"]
-        }
-    }
+    return EloService.get_match_preview(user1, user2, match.winner_elo, match.loser_elo)
 
 @router.get("/result/{match_id}")
 async def get_match_result(match_id: int, db: AsyncSession = Depends(get_db)):
@@ -457,7 +205,7 @@ async def get_match_result(match_id: int, db: AsyncSession = Depends(get_db)):
     if not match:
         raise HTTPException(status_code=404, detail="Match not found")
     
-    if match.elo_change == 0:
+    if match.status != MatchStatus.completed:
         raise HTTPException(status_code=400, detail="Match not completed yet")
     
     # Get winner and loser info
@@ -1,8 +1,9 @@
 # src/matchmaking/service.py
 from sqlalchemy.ext.asyncio import AsyncSession
-from ..database.models import MatchHistory
+from ..database.models import MatchHistory, MatchParticipant, MatchStatus, LIVE_MATCH_STATUSES
 from ..database.models import User
 from ..leetcode.service.leetcode_service import LeetCodeService
+from .outbox import settlement_outbox
 
 TOPIC_MAPPING = [
     "array",
@@ -80,35 +81,58 @@ TOPIC_MAPPING = [
 
 async def get_completed_problems(db: AsyncSession, user_id: int) -> set:
     """Get all problem slugs that a user has completed"""
-    from sqlalchemy import select, or_
-    
-    # Get all matches where user was winner or loser (excluding TBD matches)
+    from sqlalchemy import select
+
+    # One range scan of the user's match_participants rows
     result = await db.execute(
-        select(MatchHistory.leetcode_problem).where(
-            or_(
-                MatchHistory.winner_id == user_id,
-                MatchHistory.loser_id == user_id
-            )
-        ).where(MatchHistory.leetcode_problem != "TBD")
+        select(MatchParticipant.problem_slug).where(MatchParticipant.user_id == user_id).distinct()
     )
     
     completed = {row[0] for row in result.fetchall()}
     return completed
 
 
+async def get_live_match(db: AsyncSession, user_id: int):
+    """The user's newest pending/active match, or None (one index seek per side)."""
+    from sqlalchemy import select
+
+    candidates = []
+    for player_column in (MatchHistory.winner_id, MatchHistory.loser_id):
+        result = await db.execute(
+            select(MatchHistory)
+            .where(player_column == user_id)
+            .where(MatchHistory.status.in_(LIVE_MATCH_STATUSES))
+            .order_by(MatchHistory.match_id.desc())
+            .limit(1)
+        )
+        candidates.extend(result.scalars())
+    return max(candidates, key=lambda match: match.match_id, default=None)
+
+
 async def create_match_record(db: AsyncSession, user: User, opponent: User):
-    from sqlalchemy import or_, delete
+    from sqlalchemy import select, update
 
     
-    # Clean up any existing TBD records for both users
-    await db.execute(
-        delete(MatchHistory).where(
-            or_(
-                MatchHistory.winner_id.in_([user.id, opponent.id]),
-                MatchHistory.loser_id.in_([user.id, opponent.id])
-            )
-        ).where(MatchHistory.leetcode_problem == "TBD")
-    )
+    # Live records left behind by both users can no longer be played: mark them abandoned
+    # (except finished matches whose settlement is still waiting in the outbox)
+    unwritten = settlement_outbox.pending_match_ids()
+    abandoned = []
+    for player_column in (MatchHistory.winner_id, MatchHistory.loser_id):
+        stale = (
+            select(MatchHistory.match_id)
+            .where(player_column.in_([user.id, opponent.id]))
+            .where(MatchHistory.status.in_(LIVE_MATCH_STATUSES))
+        )
+        if unwritten:
+            stale = stale.where(MatchHistory.match_id.notin_(unwritten))
+        abandoned.extend((await db.execute(stale)).scalars())
+    if abandoned:
+        await db.execute(
+            update(MatchHistory)
+            .where(MatchHistory.match_id.in_(abandoned))
+            .where(MatchHistory.status.in_(LIVE_MATCH_STATUSES))
+            .values(status=MatchStatus.abandoned)
+        )
 
     shared_topics = list(set(user.topics or []) & set(opponent.topics or []))
     shared_difficulty = list(set(user.difficulty or []) & set(opponent.difficulty or []))
@@ -171,7 +195,8 @@ async def create_match_record(db: AsyncSession, user: User, opponent: User):
     match = MatchHistory(
         winner_id=user.id,  # Temporary - will be updated when match completes
         loser_id=opponent.id,  # Temporary - will be updated when match completes
-        leetcode_problem="TBD",  # Indicates active/pending match
+        leetcode_problem="TBD",  # Set at settlement
+        status=MatchStatus.active,
         elo_change=0,
         winner_elo_change=0,  # New: Will be set when match completes
         loser_elo_change=0,   # New: Will be set when match completes
@@ -188,4 +213,5 @@ async def create_match_record(db: AsyncSession, user: User, opponent: User):
     await db.commit()
     await db.refresh(match)
     return {"match": match, 
-            "problem": problem}
+            "problem": problem,
+            "abandoned": sorted(set(abandoned))}
@@ -0,0 +1,425 @@
+# src/matchmaking/settlement.py
+"""
+Match settlement: the one place a finished match is written.
+
+REST (/submit, /resign) and WebSocket handlers all call settle_match(). It
+locks the match and both players in a single SELECT ... FOR UPDATE, works
+out the Elo changes and commits match + user rows (ratings and the
+games_played/wins/losses counters), the rating_history points and the
+match_participants rows together, so a double submit can never apply
+ratings twice.
+
+With SETTLEMENT_MODE=outbox the result is decided in memory first
+(decide_result) and persisted later by write_settlement(), which shares the
+row updates with settle_match().
+"""
+from dataclasses import dataclass, replace
+from datetime import datetime
+from typing import Dict, List, Optional
+from fastapi import HTTPException
+from sqlalchemy import select, insert, update, delete, func, literal, bindparam, DateTime
+from sqlalchemy.orm import aliased
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database.database import recent_writes
+from ..database.models import User, MatchHistory, MatchStatus, LIVE_MATCH_STATUSES, MatchParticipant, RatingHistory, UserStats
+from .elo_service import EloService
+
+
+@dataclass
+class SettlementResult:
+    match_id: int
+    winner_id: int
+    loser_id: int
+    winner_elo_change: int
+    loser_elo_change: int
+    winner_elo: int  # Ratings after the match
+    loser_elo: int
+    resignation: bool
+    already_settled: bool = False  # True when an earlier call already settled it
+
+
+def is_settled(match: MatchHistory) -> bool:
+    return match.status == MatchStatus.completed
+
+
+def settled_predicate():
+    """SQL counterpart of is_settled()."""
+    return MatchHistory.status == MatchStatus.completed
+
+
+def _counter_subqueries():
+    wins = (
+        select(func.count(MatchHistory.match_id))
+        .where(MatchHistory.winner_id == User.id)
+        .where(settled_predicate())
+        .scalar_subquery()
+    )
+    losses = (
+        select(func.count(MatchHistory.match_id))
+        .where(MatchHistory.loser_id == User.id)
+        .where(settled_predicate())
+        .scalar_subquery()
+    )
+    return wins, losses
+
+
+async def find_counter_drift(db) -> List[dict]:
+    """Users whose games_played/wins/losses disagree with match history."""
+    wins, losses = _counter_subqueries()
+    result = await db.execute(select(User.id, User.games_played, User.wins, User.losses, wins, losses))
+    drift = []
+    for user_id, games_played, stored_wins, stored_losses, actual_wins, actual_losses in result:
+        if (games_played, stored_wins, stored_losses) != (actual_wins + actual_losses, actual_wins, actual_losses):
+            drift.append({
+                "user_id": user_id,
+                "stored": {"games_played": games_played, "wins": stored_wins, "losses": stored_losses},
+                "actual": {"games_played": actual_wins + actual_losses, "wins": actual_wins, "losses": actual_losses},
+            })
+    return drift
+
+
+async def rebuild_user_counters(db) -> int:
+    """Recompute every user's counters from match history in one UPDATE. Caller commits."""
+    wins, losses = _counter_subqueries()
+    result = await db.execute(
+        update(User)
+        .values(wins=wins, losses=losses, games_played=wins + losses)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def _sides():
+    """(player, opponent, outcome, rating after, rating change) columns for each side of a match."""
+    return (
+        (MatchHistory.winner_id, MatchHistory.loser_id, "win", MatchHistory.winner_elo,
+         func.coalesce(MatchHistory.winner_elo_change, MatchHistory.elo_change)),
+        (MatchHistory.loser_id, MatchHistory.winner_id, "loss", MatchHistory.loser_elo,
+         func.coalesce(MatchHistory.loser_elo_change, -MatchHistory.elo_change)),
+    )
+
+
+async def backfill_rating_history(db, ts: Optional[datetime] = None, batch_size: int = 1000) -> int:
+    """
+    Add rating_history points for settled matches that have none (matches
+    settled before the table existed). Their real time is unknown, so the
+    points are stamped `ts` (default: now). Returns matches filled; caller commits.
+    """
+    ts = ts or datetime.utcnow()
+    has_points = select(RatingHistory.id).where(RatingHistory.match_id == MatchHistory.match_id).exists()
+    result = await db.execute(
+        select(MatchHistory.match_id).where(settled_predicate()).where(~has_points).order_by(MatchHistory.match_id)
+    )
+    match_ids = list(result.scalars())
+
+    for start in range(0, len(match_ids), batch_size):
+        batch = match_ids[start:start + batch_size]
+        for user_id, _, _, elo_after, delta in _sides():
+            await db.execute(insert(RatingHistory).from_select(
+                ["user_id", "match_id", "ts", "elo_after", "delta"],
+                select(user_id, MatchHistory.match_id, literal(ts, DateTime), elo_after, delta)
+                .where(MatchHistory.match_id.in_(batch)),
+            ))
+    return len(match_ids)
+
+
+async def backfill_match_participants(db) -> int:
+    """Add match_participants rows missing for settled matches. Returns rows added; caller commits."""
+    added = 0
+    for user_id, opponent_id, outcome, elo_after, delta in _sides():
+        present = (
+            select(MatchParticipant.match_id)
+            .where(MatchParticipant.user_id == user_id)
+            .where(MatchParticipant.match_id == MatchHistory.match_id)
+            .exists()
+        )
+        result = await db.execute(insert(MatchParticipant).from_select(
+            ["user_id", "match_id", "opponent_id", "outcome", "elo_delta", "elo_after", "problem_slug"],
+            select(user_id, MatchHistory.match_id, opponent_id, literal(outcome), delta, elo_after, MatchHistory.leetcode_problem)
+            .where(settled_predicate())
+            .where(~present),
+        ))
+        added += result.rowcount
+    return added
+
+
+USER_STATS_FIELDS = ("wins", "losses", "current_streak", "best_streak", "last_match_id", "total_seconds")
+USER_STATS_BATCH_SIZE = 1000
+
+
+async def compute_user_stats(db) -> Dict[int, dict]:
+    """Every user's user_stats values, recomputed from one ordered scan of match_participants."""
+    result = await db.stream(
+        select(MatchParticipant.user_id, MatchParticipant.match_id, MatchParticipant.outcome, MatchHistory.match_seconds)
+        .join(MatchHistory, MatchHistory.match_id == MatchParticipant.match_id)
+        .order_by(MatchParticipant.user_id, MatchParticipant.match_id)
+    )
+    stats = {}
+    async for user_id, match_id, outcome, match_seconds in result:
+        row = stats.get(user_id)
+        if row is None:
+            row = stats[user_id] = UserStats(user_id=user_id, wins=0, losses=0, current_streak=0, best_streak=0, total_seconds=0)
+        _record_match(row, outcome == "win", match_id, match_seconds)
+    return {user_id: {field: getattr(row, field) for field in USER_STATS_FIELDS} for user_id, row in stats.items()}
+
+
+async def find_user_stats_drift(db) -> List[int]:
+    """Users whose user_stats row (or its absence) disagrees with match history."""
+    expected = await compute_user_stats(db)
+    result = await db.execute(select(UserStats.user_id, *(getattr(UserStats, f) for f in USER_STATS_FIELDS)))
+    stored = {row[0]: dict(zip(USER_STATS_FIELDS, row[1:])) for row in result}
+    return sorted(user_id for user_id in expected.keys() | stored.keys() if expected.get(user_id) != stored.get(user_id))
+
+
+async def rebuild_user_stats(db) -> int:
+    """Rewrite user_stats (and the users.winstreak mirror) from match history. Caller commits."""
+    expected = await compute_user_stats(db)
+    await db.execute(delete(UserStats))
+    await db.execute(update(User).values(winstreak=0).execution_options(synchronize_session=False))
+    rows = [{"user_id": user_id, **values} for user_id, values in expected.items()]
+    users = User.__table__
+    set_streak = update(users).where(users.c.user_id == bindparam("uid")).values(winstreak=bindparam("streak"))
+    for start in range(0, len(rows), USER_STATS_BATCH_SIZE):
+        batch = rows[start:start + USER_STATS_BATCH_SIZE]
+        await db.execute(insert(UserStats), batch)
+        streaks = [{"uid": row["user_id"], "streak": row["current_streak"]} for row in batch if row["current_streak"]]
+        if streaks:
+            await db.execute(set_streak, streaks)
+    return len(rows)
+
+
+def _recorded_result(match: MatchHistory) -> SettlementResult:
+    return SettlementResult(
+        match_id=match.match_id,
+        winner_id=match.winner_id,
+        loser_id=match.loser_id,
+        winner_elo_change=match.winner_elo_change,
+        loser_elo_change=match.loser_elo_change,
+        winner_elo=match.winner_elo,
+        loser_elo=match.loser_elo,
+        resignation=match.resignation,
+        already_settled=True,
+    )
+
+
+def decide_result(
+    match_id: int,
+    user_id: int,
+    starting_elo: Dict[int, int],
+    games_played: Dict[int, int],
+    resignation: bool = False,
+) -> SettlementResult:
+    """
+    Work out a settlement without touching the DB.
+
+    `starting_elo` and `games_played` are keyed by both players' ids and hold
+    their ratings at match creation and their games before this match.
+    `user_id` is the winner (submission) or the loser (resignation).
+    """
+    other_id = next(player_id for player_id in starting_elo if player_id != user_id)
+    winner_id, loser_id = (other_id, user_id) if resignation else (user_id, other_id)
+    winner_elo_change, loser_elo_change = EloService.calculate_match_rating_changes(
+        winner_rating=starting_elo[winner_id],
+        loser_rating=starting_elo[loser_id],
+        winner_games_played=games_played[winner_id],
+        loser_games_played=games_played[loser_id],
+        is_resignation=resignation,
+    )
+    return SettlementResult(
+        match_id=match_id,
+        winner_id=winner_id,
+        loser_id=loser_id,
+        winner_elo_change=winner_elo_change,
+        loser_elo_change=loser_elo_change,
+        winner_elo=starting_elo[winner_id] + winner_elo_change,
+        loser_elo=starting_elo[loser_id] + loser_elo_change,
+        resignation=resignation,
+    )
+
+
+async def _lock_match(db: AsyncSession, match_id: int):
+    """The match and both players, locked with one SELECT ... FOR UPDATE (None if unknown)."""
+    Player1 = aliased(User)
+    Player2 = aliased(User)
+    result = await db.execute(
+        select(MatchHistory, Player1, Player2)
+        .join(Player1, Player1.id == MatchHistory.winner_id)
+        .join(Player2, Player2.id == MatchHistory.loser_id)
+        .where(MatchHistory.match_id == match_id)
+        .with_for_update()
+    )
+    return result.one_or_none()
+
+
+async def _apply_result(
+    db: AsyncSession,
+    match: MatchHistory,
+    players: Dict[int, User],
+    result: SettlementResult,
+    match_seconds: int,
+    problem_slug: Optional[str],
+    winner_runtime: int,
+    winner_memory: float,
+    settled_at: datetime,
+):
+    """Write `result` into the locked match and user rows plus the derived tables. Caller commits."""
+    winner, loser = players[result.winner_id], players[result.loser_id]
+    winner.user_elo += result.winner_elo_change
+    loser.user_elo += result.loser_elo_change  # This will be negative
+    winner.games_played += 1
+    winner.wins += 1
+    loser.games_played += 1
+    loser.losses += 1
+
+    match.winner_id = result.winner_id
+    match.loser_id = result.loser_id
+    match.elo_change = abs(result.loser_elo_change)  # Keep for backward compatibility
+    match.winner_elo_change = result.winner_elo_change
+    match.loser_elo_change = result.loser_elo_change
+    match.winner_elo = winner.user_elo
+    match.loser_elo = loser.user_elo
+    match.match_seconds = match_seconds
+    match.leetcode_problem = problem_slug or "unknown"
+    # Resignations have no valid submission, so both sides get -1
+    match.winner_runtime = -1 if result.resignation else winner_runtime
+    match.winner_memory = -1.0 if result.resignation else winner_memory
+    match.loser_runtime = -1
+    match.loser_memory = -1.0
+    match.resignation = result.resignation
+    match.status = MatchStatus.completed
+    match.completed_at = settled_at
+
+    # Rating trail for charts and per-user history rows, written in the same transaction
+    db.add_all([
+        RatingHistory(user_id=winner.id, match_id=match.match_id, ts=settled_at, elo_after=winner.user_elo, delta=result.winner_elo_change),
+        RatingHistory(user_id=loser.id, match_id=match.match_id, ts=settled_at, elo_after=loser.user_elo, delta=result.loser_elo_change),
+        MatchParticipant(
+            user_id=winner.id, match_id=match.match_id, opponent_id=loser.id, outcome="win",
+            elo_delta=result.winner_elo_change, elo_after=winner.user_elo, problem_slug=match.leetcode_problem,
+        ),
+        MatchParticipant(
+            user_id=loser.id, match_id=match.match_id, opponent_id=winner.id, outcome="loss",
+            elo_delta=result.loser_elo_change, elo_after=loser.user_elo, problem_slug=match.leetcode_problem,
+        ),
+    ])
+
+    # Aggregates; both users' rows are already locked, so their stats rows are ours too
+    stats = await _user_stats_rows(db, [winner.id, loser.id])
+    for player, won in ((winner, True), (loser, False)):
+        player_stats = stats[player.id]
+        _record_match(player_stats, won, match.match_id, match_seconds)
+        player.winstreak = player_stats.current_streak
+
+    # Their profile/history reads stay on the primary while the replica catches up
+    recent_writes.mark(user_ids=(winner.id, loser.id), match_id=match.match_id)
+
+
+async def _user_stats_rows(db: AsyncSession, user_ids: List[int]) -> Dict[int, UserStats]:
+    """user_stats rows for `user_ids`, creating empty ones for users without a row."""
+    result = await db.execute(select(UserStats).where(UserStats.user_id.in_(user_ids)))
+    rows = {row.user_id: row for row in result.scalars()}
+    for user_id in user_ids:
+        if user_id not in rows:
+            rows[user_id] = UserStats(user_id=user_id, wins=0, losses=0, current_streak=0, best_streak=0, total_seconds=0)
+            db.add(rows[user_id])
+    return rows
+
+
+def _record_match(stats, won: bool, match_id: int, match_seconds: int):
+    """Fold one match into a UserStats row (or anything with the same fields)."""
+    if won:
+        stats.wins += 1
+        stats.current_streak += 1
+        stats.best_streak = max(stats.best_streak, stats.current_streak)
+    else:
+        stats.losses += 1
+        stats.current_streak = 0
+    stats.last_match_id = match_id
+    stats.total_seconds += max(match_seconds or 0, 0)
+
+
+async def settle_match(
+    db: AsyncSession,
+    match_id: int,
+    user_id: int,
+    resignation: bool = False,
+    match_seconds: int = 0,
+    problem_slug: Optional[str] = None,
+    winner_runtime: int = -1,
+    winner_memory: float = -1.0,
+) -> SettlementResult:
+    """
+    Settle `match_id` with `user_id` as the winner (submission) or the loser (resignation).
+
+    Idempotent: settling an already-settled match returns what was recorded.
+    Raises HTTPException for unknown matches and users who did not play in it.
+    """
+    row = await _lock_match(db, match_id)
+    if not row:
+        raise HTTPException(status_code=404, detail="Match not found")
+    match, player1, player2 = row
+
+    if is_settled(match):
+        recorded = _recorded_result(match)
+        await db.rollback()  # Release the row locks
+        return recorded
+
+    if match.status == MatchStatus.abandoned:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Match was abandoned")
+
+    players = {player1.id: player1, player2.id: player2}
+    if user_id not in players:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="User not in this match")
+
+    # Ratings at match creation, keyed by player (the row's winner/loser are placeholders until now);
+    # K-factor selection reads the maintained counters (before this match)
+    result = decide_result(
+        match_id, user_id,
+        starting_elo={match.winner_id: match.winner_elo, match.loser_id: match.loser_elo},
+        games_played={player.id: player.games_played for player in players.values()},
+        resignation=resignation,
+    )
+    await _apply_result(db, match, players, result, match_seconds, problem_slug, winner_runtime, winner_memory, datetime.utcnow())
+    await db.commit()
+    return replace(result, winner_elo=match.winner_elo, loser_elo=match.loser_elo)  # Ratings as stored
+
+
+async def write_settlement(
+    db: AsyncSession,
+    result: SettlementResult,
+    match_seconds: int = 0,
+    problem_slug: Optional[str] = None,
+    winner_runtime: int = -1,
+    winner_memory: float = -1.0,
+    settled_at: Optional[datetime] = None,
+) -> bool:
+    """
+    Persist a result decided earlier (see outbox.py). Exactly once per match:
+    returns False without writing if the match is already settled or gone.
+    Caller commits.
+    """
+    row = await _lock_match(db, result.match_id)
+    if not row:
+        print(f"⚠️ Match {result.match_id} no longer exists; dropping its deferred settlement")
+        return False
+    match, player1, player2 = row
+    if match.status not in LIVE_MATCH_STATUSES:
+        return False  # Already written (e.g. outbox replayed after a crash) or abandoned
+    players = {player1.id: player1, player2.id: player2}
+    await _apply_result(db, match, players, result, match_seconds, problem_slug, winner_runtime, winner_memory, settled_at or datetime.utcnow())
+    return True
+
+
+def parse_submission_stats(submission) -> tuple:
+    """(runtime ms, memory MB) from a LeetCode submission, -1 where unavailable."""
+    try:
+        runtime = int(submission.runtime.replace(" ms", "").replace("ms", "")) if submission and submission.runtime else -1
+    except (ValueError, AttributeError):
+        runtime = -1
+    try:
+        memory = float(submission.memory.replace(" MB", "").replace("MB", "")) if submission and submission.memory else -1.0
+    except (ValueError, AttributeError):
+        memory = -1.0
+    return runtime, memory
@@ -0,0 +1,181 @@
+# src/matchmaking/simulator.py
+"""
+Offline discrete-event simulator for matchmaking pairing strategies.
+
+Feeds synthetic arrivals through the same PairingStrategy classes the live
+WebSocketManager uses and reports wait-time percentiles, the ELO-gap
+distribution and throughput. Runs are deterministic for a given seed.
+
+    python -m src.matchmaking.simulator --strategies fixed expanding closest --arrivals 1000000
+"""
+import argparse
+import json
+import math
+import time
+from typing import Optional
+
+import numpy as np
+
+from .pairing import PAIRING_STRATEGIES, PairingStrategy
+
+ARRIVAL_PROCESSES = ("poisson", "diurnal")
+RATING_DISTRIBUTIONS = ("normal", "bimodal")
+GAP_BUCKETS = [25, 50, 75, 100, 150, 200, 300, 400]  # inclusive upper bounds
+
+
+def sample_arrivals(rng: np.random.Generator, count: int, rate: float, process: str = "poisson") -> np.ndarray:
+    """Arrival timestamps (seconds) for `count` players arriving at `rate` per second."""
+    if process == "poisson":
+        return np.cumsum(rng.exponential(1 / rate, count))
+    if process == "diurnal":
+        # Thinned Poisson process: rate swings between 0.2x and 1.8x over a 24h cycle
+        peak = rate * 1.8
+        accepted = np.empty(0)
+        while accepted.size < count:
+            batch = max(count, 1024)
+            start = accepted[-1] if accepted.size else 0.0
+            times = start + np.cumsum(rng.exponential(1 / peak, batch))
+            intensity = rate * (1 + 0.8 * np.sin(2 * math.pi * times / 86400))
+            accepted = np.concatenate([accepted, times[rng.random(batch) < intensity / peak]])
+        return accepted[:count]
+    raise ValueError(f"Unknown arrival process: {process}")
+
+
+def sample_ratings(rng: np.random.Generator, count: int, mean: float, sd: float, distribution: str = "normal") -> np.ndarray:
+    """Integer ELO ratings clipped to [400, 3000]."""
+    if distribution == "normal":
+        ratings = rng.normal(mean, sd, count)
+    elif distribution == "bimodal":
+        # New players clustered at the starting rating plus an established population
+        newcomers = rng.random(count) < 0.4
+        ratings = np.where(newcomers, rng.normal(1200, sd / 4, count), rng.normal(mean + sd, sd, count))
+    else:
+        raise ValueError(f"Unknown rating distribution: {distribution}")
+    return np.clip(np.rint(ratings), 400, 3000).astype(np.int64)
+
+
+def simulate(
+    strategy: PairingStrategy,
+    arrivals: int = 100_000,
+    rate: float = 5.0,
+    elo_mean: float = 1200,
+    elo_sd: float = 200,
+    process: str = "poisson",
+    distribution: str = "normal",
+    max_wait: Optional[float] = 600,
+    tick: float = 1.0,
+    seed: int = 0,
+) -> dict:
+    """
+    Run one simulation and return its report.
+
+    Time-dependent strategies are re-evaluated every `tick` seconds while
+    players are waiting; players who wait longer than `max_wait` abandon.
+    """
+    rng = np.random.default_rng(seed)
+    arrival_times = sample_arrivals(rng, arrivals, rate, process).tolist()
+    ratings = sample_ratings(rng, arrivals, elo_mean, elo_sd, distribution).tolist()
+
+    queue = {}
+    waits, gaps = [], []
+    abandoned = 0
+    next_tick = tick
+
+    def abandon_expired(now):
+        nonlocal abandoned
+        # The queue is in join order, so expired players are always at the front
+        while queue:
+            user_id = next(iter(queue))
+            if now - queue[user_id]["joined_at"] <= max_wait:
+                break
+            del queue[user_id]
+            abandoned += 1
+
+    def pair_all(now, newcomer=None):
+        while True:
+            pair = strategy.find_pair(queue, now, newcomer)
+            if not pair:
+                return
+            first, second = queue.pop(pair[0]), queue.pop(pair[1])
+            waits.append(now - first["joined_at"])
+            waits.append(now - second["joined_at"])
+            gaps.append(abs(first["elo"] - second["elo"]))
+            if newcomer is not None:
+                return  # the newcomer is gone; nothing else changed
+
+    started = time.perf_counter()
+    for user_id, (now, elo) in enumerate(zip(arrival_times, ratings)):
+        if strategy.time_dependent:
+            while queue and next_tick <= now:
+                if max_wait is not None:
+                    abandon_expired(next_tick)
+                pair_all(next_tick)
+                next_tick += tick
+        next_tick = max(next_tick, math.ceil(now / tick) * tick)
+
+        if max_wait is not None:
+            abandon_expired(now)
+        queue[user_id] = {"elo": elo, "joined_at": now}
+        pair_all(now, newcomer=user_id)
+    wall_seconds = time.perf_counter() - started
+
+    sim_seconds = arrival_times[-1] if arrival_times else 0.0
+    waits_arr = np.asarray(waits) if waits else np.zeros(1)
+    gaps_arr = np.asarray(gaps) if gaps else np.zeros(1)
+    counts = np.bincount(np.searchsorted(GAP_BUCKETS, np.asarray(gaps, dtype=np.int64)), minlength=len(GAP_BUCKETS) + 1)
+    labels = [f"<={GAP_BUCKETS[0]}"] + [f"{low + 1}-{high}" for low, high in zip(GAP_BUCKETS, GAP_BUCKETS[1:])] + [f">{GAP_BUCKETS[-1]}"]
+
+    return {
+        "strategy": strategy.name,
+        "arrivals": arrivals,
+        "matches": len(gaps),
+        "matched_ratio": round(2 * len(gaps) / arrivals, 4) if arrivals else 0.0,
+        "abandoned": abandoned,
+        "still_queued": len(queue),
+        "throughput_matches_per_s": round(len(gaps) / sim_seconds, 4) if sim_seconds else 0.0,
+        "wait_s": {f"p{p}": round(float(np.percentile(waits_arr, p)), 3) for p in (50, 90, 95, 99)},
+        "elo_gap": {
+            "mean": round(float(gaps_arr.mean()), 2),
+            **{f"p{p}": float(np.percentile(gaps_arr, p)) for p in (50, 90, 99)},
+            "histogram": {label: int(c) for label, c in zip(labels, counts)},
+        },
+        "wall_seconds": round(wall_seconds, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare matchmaking pairing strategies offline")
+    parser.add_argument("--strategies", nargs="+", default=list(PAIRING_STRATEGIES), choices=list(PAIRING_STRATEGIES))
+    parser.add_argument("--arrivals", type=int, default=100_000)
+    parser.add_argument("--rate", type=float, default=5.0, help="arrivals per second")
+    parser.add_argument("--process", default="poisson", choices=ARRIVAL_PROCESSES)
+    parser.add_argument("--distribution", default="normal", choices=RATING_DISTRIBUTIONS)
+    parser.add_argument("--elo-mean", type=float, default=1200)
+    parser.add_argument("--elo-sd", type=float, default=200)
+    parser.add_argument("--window", type=int, help="override the ELO window of fixed/closest strategies")
+    parser.add_argument("--max-wait", type=float, default=600, help="seconds before a player abandons")
+    parser.add_argument("--tick", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    reports = []
+    for name in args.strategies:
+        strategy_cls = PAIRING_STRATEGIES[name]
+        strategy = strategy_cls(args.window) if args.window and name != "expanding" else strategy_cls()
+        reports.append(simulate(
+            strategy,
+            arrivals=args.arrivals,
+            rate=args.rate,
+            elo_mean=args.elo_mean,
+            elo_sd=args.elo_sd,
+            process=args.process,
+            distribution=args.distribution,
+            max_wait=args.max_wait,
+            tick=args.tick,
+            seed=args.seed,
+        ))
+    print(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
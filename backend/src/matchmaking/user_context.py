@@ -0,0 +1,94 @@
+# src/matchmaking/user_context.py
+from dataclasses import dataclass, replace
+from typing import Dict, FrozenSet, Optional
+from sqlalchemy import select
+from ..database.models import User
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """
+    The slice of a User the matchmaking socket needs, loaded once per connection.
+
+    Quacks like User for create_match_record (id, email, user_elo, topics,
+    difficulty, repeating_questions), so hot handlers never re-query it.
+    """
+    id: int
+    email: str
+    user_elo: int
+    leetcode_username: Optional[str]
+    repeating_questions: bool
+    topics: FrozenSet[str]
+    difficulty: FrozenSet[str]
+    games_played: int = 0
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserSnapshot":
+        return cls(
+            id=user.id,
+            email=user.email,
+            user_elo=user.user_elo,
+            leetcode_username=user.leetcode_username,
+            repeating_questions=bool(user.repeating_questions),
+            topics=frozenset(str(t) for t in (user.topics or [])),
+            difficulty=frozenset(str(d) for d in (user.difficulty or [])),
+            games_played=user.games_played or 0,
+        )
+
+
+class UserContextRegistry:
+    """
+    Snapshots for users with an open matchmaking socket.
+
+    The WebSocketManager adds one on connect and drops it on disconnect.
+    Code that changes ELO or settings calls refresh()/update_elo()/
+    record_result() so the cached copy never goes stale; users without a
+    socket are ignored.
+    """
+
+    def __init__(self):
+        self._snapshots: Dict[int, UserSnapshot] = {}
+
+    def get(self, user_id: int) -> Optional[UserSnapshot]:
+        return self._snapshots.get(user_id)
+
+    def put(self, snapshot: UserSnapshot):
+        self._snapshots[snapshot.id] = snapshot
+
+    def discard(self, user_id: int):
+        self._snapshots.pop(user_id, None)
+
+    def refresh(self, user: User):
+        """Invalidation hook: replace a connected user's snapshot from a fresh User row."""
+        if user.id in self._snapshots:
+            self._snapshots[user.id] = UserSnapshot.from_user(user)
+
+    def update_elo(self, user_id: int, user_elo: int):
+        snapshot = self._snapshots.get(user_id)
+        if snapshot:
+            self._snapshots[user_id] = replace(snapshot, user_elo=user_elo)
+
+    def record_result(self, result):
+        """Apply a SettlementResult: new ratings and one more game for both players."""
+        if result.already_settled:
+            return
+        for user_id, user_elo in ((result.winner_id, result.winner_elo), (result.loser_id, result.loser_elo)):
+            snapshot = self._snapshots.get(user_id)
+            if snapshot:
+                self._snapshots[user_id] = replace(snapshot, user_elo=user_elo, games_played=snapshot.games_played + 1)
+
+    def __len__(self):
+        return len(self._snapshots)
+
+
+async def load_user_snapshot(user_id: int) -> Optional[UserSnapshot]:
+    """One DB round trip at connect time."""
+    from ..database.database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(User).where(User.id == user_id))
+        user = result.scalar_one_or_none()
+        return UserSnapshot.from_user(user) if user else None
+
+
+# Global registry shared by the socket handlers and the services that invalidate it
+user_contexts = UserContextRegistry()
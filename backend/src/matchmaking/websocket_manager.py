@@ -1,74 +1,183 @@
 # src/matchmaking/websocket_manager.py
-import json
 import asyncio
-from typing import Dict, Set
-from fastapi import WebSocket
+from typing import Dict, Optional, Set
+from fastapi import WebSocket, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, or_
-from ..database.models import User, MatchHistory
+from sqlalchemy import select
+from ..database.models import User
 from .manager import MatchmakingManager
 from .service import create_match_record
+from .pairing import FixedWindowPairing
+from .connection import ClientConnection, HEARTBEAT_INTERVAL, IDLE_TIMEOUT
+from .protocol import JSON_CODEC
+from .user_context import UserSnapshot, user_contexts
 from .elo_service import EloService
+from .settlement import decide_result, parse_submission_stats
+from .outbox import SETTLEMENT_MODE, PendingSettlement, settle, settlement_outbox
+from ..users.leaderboard import leaderboard
+from dataclasses import replace
+from datetime import datetime
+import os
+import secrets
 import time
 
+# Sockets handled per sweeper step before yielding to the event loop
+SWEEP_BATCH_SIZE = int(os.getenv("WS_SWEEP_BATCH_SIZE", "500"))
+
 class WebSocketManager:
     def __init__(self):
         # Store active connections by user_id
-        self.active_connections: Dict[int, WebSocket] = {}
+        self.active_connections: Dict[int, ClientConnection] = {}
         # Store users waiting in queue
-        self.queue: Dict[int, dict] = {}  # user_id -> {elo, websocket}
+        self.queue: Dict[int, dict] = {}  # user_id -> {elo, websocket (connection), joined_at}
         # Store match problems by match_id
         self.match_problems: Dict[int, dict] = {}
         # Store match timers by match_id
-        self.match_timers: Dict[int, dict] = {}  # match_id -> {start_time, players, status}
+        self.match_timers: Dict[int, dict] = {}  # match_id -> {start_time, players, status, opponents, resume_tokens}
+        # Resume tokens handed out in match_found: token -> (match_id, user_id)
+        self.resume_tokens: Dict[str, tuple] = {}
         self.matchmaking_manager = MatchmakingManager()
-
-    async def get_user_games_played(self, user_id: int, db: AsyncSession) -> int:
-        """Get the total number of completed games for a user."""
-        result = await db.execute(
-            select(func.count(MatchHistory.match_id))
-            .where(
-                or_(
-                    MatchHistory.winner_id == user_id,
-                    MatchHistory.loser_id == user_id
-                )
-            )
-            .where(MatchHistory.elo_change != 0)  # Only count completed matches
-        )
-        return result.scalar() or 0
-
-    async def connect(self, websocket: WebSocket, user_id: int):
-        """Store WebSocket connection (already accepted in route)"""
-        self.active_connections[user_id] = websocket
+        # Decides who gets paired; scripts can compare alternatives with src.matchmaking.simulator
+        self.pairing = FixedWindowPairing()
+        # Heartbeat / idle eviction task (started from the app lifespan)
+        self._sweeper_task: asyncio.Task = None
+        self.evicted_idle = 0
+
+    async def connect(self, websocket: WebSocket, user_id: int, codec=JSON_CODEC, snapshot: UserSnapshot = None):
+        """Store WebSocket connection (already accepted in route) and start its writer"""
+        previous = self.active_connections.get(user_id)
+        if previous:
+            previous.close()  # Replaced by a newer socket for the same user
+
+        connection = ClientConnection(user_id, websocket, on_close=self._connection_closed, codec=codec)
+        connection.start()
+        self.active_connections[user_id] = connection
+        if snapshot:
+            user_contexts.put(snapshot)  # Lives as long as the connection
         print(f"🔌 User {user_id} connected via WebSocket")
 
-    def disconnect(self, user_id: int):
+    def disconnect(self, user_id: int, websocket: WebSocket = None):
         """Remove user from connections and queue"""
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-        if user_id in self.queue:
-            del self.queue[user_id]
+        connection = self.active_connections.get(user_id)
+        if connection and websocket is not None and connection.websocket is not websocket:
+            return  # A newer socket already replaced this one
+        if connection:
+            connection.close()
+        self.active_connections.pop(user_id, None)
+        self.queue.pop(user_id, None)
+        user_contexts.discard(user_id)
         print(f"🔌 User {user_id} disconnected")
 
-    async def send_to_user(self, user_id: int, message: dict):
-        """Send message to specific user"""
-        if user_id in self.active_connections:
+    def _connection_closed(self, connection: ClientConnection):
+        """Called when a connection's writer gives up (dead, stuck or overflowing socket)"""
+        if self.active_connections.get(connection.user_id) is connection:
+            del self.active_connections[connection.user_id]
+            self.queue.pop(connection.user_id, None)
+            user_contexts.discard(connection.user_id)
+
+    def touch(self, user_id: int):
+        """Mark a user's connection as alive (called for every inbound message)"""
+        connection = self.active_connections.get(user_id)
+        if connection:
+            connection.touch()
+
+    def start_sweeper(self, interval: float = HEARTBEAT_INTERVAL, idle_timeout: float = IDLE_TIMEOUT):
+        if self._sweeper_task is None:
+            self._sweeper_task = asyncio.create_task(self._sweep_loop(interval, idle_timeout))
+
+    async def stop_sweeper(self):
+        if self._sweeper_task:
+            self._sweeper_task.cancel()
+            try:
+                await self._sweeper_task
+            except asyncio.CancelledError:
+                pass
+            self._sweeper_task = None
+
+    async def _sweep_loop(self, interval: float, idle_timeout: float):
+        while True:
+            await asyncio.sleep(interval)
             try:
-                await self.active_connections[user_id].send_text(json.dumps(message))
+                await self.sweep(idle_timeout)
             except Exception as e:
-                print(f"❌ Failed to send message to user {user_id}: {e}")
-                # Remove dead connection
-                if user_id in self.active_connections:
-                    del self.active_connections[user_id]
+                print(f"❌ Connection sweep failed: {e}")
+
+    async def sweep(self, idle_timeout: float = IDLE_TIMEOUT, batch_size: int = SWEEP_BATCH_SIZE) -> int:
+        """
+        Evict connections silent for longer than `idle_timeout`, drop queue
+        entries without a live connection and ping everyone else.
+
+        Works through the connections in batches, yielding between them so a
+        large sweep never stalls match timers. Returns the number evicted.
+        """
+        cutoff = time.monotonic() - idle_timeout
+        user_ids = list(self.active_connections)
+        evicted = 0
+        ping_frames = {}  # codec name -> encoded ping
+
+        for start in range(0, len(user_ids), batch_size):
+            for user_id in user_ids[start:start + batch_size]:
+                connection = self.active_connections.get(user_id)
+                if connection is None:
+                    continue
+                if connection.last_seen < cutoff:
+                    connection.close()  # _connection_closed removes it from the queue too
+                    evicted += 1
+                    continue
+                codec = connection.codec
+                if codec.name not in ping_frames:
+                    ping_frames[codec.name] = codec.encode({"type": "ping"})
+                connection.enqueue_frame("ping", ping_frames[codec.name])
+            await asyncio.sleep(0)
+
+        # Queue entries whose socket is gone can never play; don't pair anyone with them
+        stale = [
+            uid for uid, entry in self.queue.items()
+            if entry["websocket"] is None or self.active_connections.get(uid) is not entry["websocket"]
+        ]
+        for user_id in stale:
+            del self.queue[user_id]
 
-    async def join_queue(self, user_id: int, user_elo: int, db: AsyncSession):
+        if evicted:
+            self.evicted_idle += evicted
+            print(f"🧹 Evicted {evicted} idle WebSocket connections")
+        return evicted
+
+    async def send_to_user(self, user_id: int, message: dict):
+        """Queue a message for a specific user; never waits on the network"""
+        connection = self.active_connections.get(user_id)
+        if connection:
+            connection.enqueue(message)
+
+    async def broadcast(self, user_ids, message: dict, per_user: Dict[int, dict] = None):
+        """
+        Send one message to many users, serializing the shared payload once per encoding.
+
+        `per_user` maps user_id -> small extra top-level fields for that
+        recipient only (e.g. their opponent), patched onto the shared frame.
+        """
+        frames = {}  # codec name -> encoded shared frame
+        message_type = message.get("type")
+        for user_id in user_ids:
+            connection = self.active_connections.get(user_id)
+            if not connection:
+                continue
+            codec = connection.codec
+            if codec.name not in frames:
+                frames[codec.name] = codec.encode(message)
+            frame = frames[codec.name]
+            extra = per_user.get(user_id) if per_user else None
+            connection.enqueue_frame(message_type, codec.patch(frame, extra) if extra else frame)
+
+    async def join_queue(self, user_id: int, user_elo: int):
         """Add user to matchmaking queue"""
         print(f"🚀 User {user_id} joining queue with ELO {user_elo}")
         
         # Add to queue
         self.queue[user_id] = {
             "elo": user_elo,
-            "websocket": self.active_connections.get(user_id)
+            "websocket": self.active_connections.get(user_id),
+            "joined_at": time.time()
         }
 
         # Send queue joined confirmation
@@ -78,7 +187,7 @@ class WebSocketManager:
         })
 
         # Try to find a match
-        await self.try_match_players(db)
+        await self.try_match_players()
 
     async def leave_queue(self, user_id: int):
         """Remove user from queue"""
@@ -90,38 +199,45 @@ class WebSocketManager:
             })
             print(f"🚪 User {user_id} left queue")
 
-    async def try_match_players(self, db: AsyncSession):
-        """Try to match players in queue"""
+    async def try_match_players(self):
+        """Try to match players in queue; only opens a DB session once a pair is found"""
         if len(self.queue) < 2:
             return
 
-        # Get two players from queue (simple FIFO for now)
-        queue_items = list(self.queue.items())
-        
-        for i in range(len(queue_items)):
-            for j in range(i + 1, len(queue_items)):
-                user1_id, user1_data = queue_items[i]
-                user2_id, user2_data = queue_items[j]
-                
-                # Check ELO compatibility (±100)
-                elo_diff = abs(user1_data["elo"] - user2_data["elo"])
-                if elo_diff <= 100:
-                    await self.create_match(user1_id, user2_id, db)
-                    return
+        pair = self.pairing.find_pair(self.queue, time.time())
+        if pair:
+            from ..database.database import AsyncSessionLocal
+            async with AsyncSessionLocal() as db:
+                await self.create_match(pair[0], pair[1], db)
+
+    async def get_user_snapshot(self, user_id: int, db: AsyncSession):
+        """Connection snapshot if the user is connected, otherwise a DB read"""
+        snapshot = user_contexts.get(user_id)
+        if snapshot:
+            return snapshot
+        result = await db.execute(select(User).where(User.id == user_id))
+        user = result.scalar_one_or_none()
+        return UserSnapshot.from_user(user) if user else None
+
+    def requeue(self, user_id: int, user_elo: int):
+        """Put a user back in the queue after a failed match creation"""
+        self.queue[user_id] = {
+            "elo": user_elo,
+            "websocket": self.active_connections.get(user_id),
+            "joined_at": time.time()
+        }
 
     async def create_match(self, user1_id: int, user2_id: int, db: AsyncSession):
         """Create a match between two users"""
+        user1 = user2 = None
         try:
             # Remove both from queue
             self.queue.pop(user1_id, None)
             self.queue.pop(user2_id, None)
 
-            # Get user data from database
-            user1_result = await db.execute(select(User).where(User.id == user1_id))
-            user1 = user1_result.scalar_one_or_none()
-            
-            user2_result = await db.execute(select(User).where(User.id == user2_id))
-            user2 = user2_result.scalar_one_or_none()
+            # User data comes from the connection snapshots (DB only as a fallback)
+            user1 = await self.get_user_snapshot(user1_id, db)
+            user2 = await self.get_user_snapshot(user2_id, db)
 
             if not user1 or not user2:
                 print(f"❌ Failed to get user data for match")
@@ -132,47 +248,51 @@ class WebSocketManager:
             if not match_record:
                 print(f"❌ Failed to create match record between {user1.email} and {user2.email}")
                 # Re-add users to queue
-                self.queue[user1_id] = {"elo": user1.user_elo, "websocket": self.active_connections.get(user1_id)}
-                self.queue[user2_id] = {"elo": user2.user_elo, "websocket": self.active_connections.get(user2_id)}
+                self.requeue(user1_id, user1.user_elo)
+                self.requeue(user2_id, user2.user_elo)
                 return
             
             match = match_record["match"]
             problem = match_record["problem"]
+            for match_id in match_record.get("abandoned", ()):
+                self.abandon_match(match_id)
 
             # Store problem for this match
             self.match_problems[match.match_id] = problem
 
             print(f"✅ Match created: {match.match_id} between {user1.email} and {user2.email}")
 
+            # Per-player details kept in memory so a reconnecting player can be restored without the DB
+            opponents = {
+                user1_id: {"username": user2.leetcode_username or user2.email, "elo": user2.user_elo},
+                user2_id: {"username": user1.leetcode_username or user1.email, "elo": user1.user_elo},
+            }
+            resume_tokens = {user1_id: secrets.token_urlsafe(16), user2_id: secrets.token_urlsafe(16)}
+            for player_id, token in resume_tokens.items():
+                self.resume_tokens[token] = (match.match_id, player_id)
+
             # Initialize match timer
             self.match_timers[match.match_id] = {
+                # Rating previews at the match's starting ratings, served by /match-rating-preview
+                "preview": EloService.get_match_preview(user1, user2),
+                # Starting ratings and games played, enough to settle without the DB (outbox mode)
+                "ratings": {user1_id: (user1.user_elo, user1.games_played), user2_id: (user2.user_elo, user2.games_played)},
                 "start_time": None,  # Will be set when countdown ends
                 "players": [user1_id, user2_id],
-                "status": "countdown",  # countdown -> active -> completed
-                "countdown": 3
+                "status": "countdown",  # countdown -> start -> active -> completed
+                "countdown": 3,
+                "opponents": opponents,
+                "resume_tokens": resume_tokens,
             }
 
-            # Notify both players
-            match_data = {
+            # Notify both players: the problem payload is encoded once, opponents are per-player patches
+            await self.broadcast([user1_id, user2_id], {
                 "type": "match_found",
                 "match_id": match.match_id,
-                "problem": problem.dict(),
-            }
-
-            await self.send_to_user(user1_id, {
-                **match_data,
-                "opponent": {
-                    "username": user2.leetcode_username or user2.email,
-                    "elo": user2.user_elo
-                }
-            })
-
-            await self.send_to_user(user2_id, {
-                **match_data,
-                "opponent": {
-                    "username": user1.leetcode_username or user1.email,
-                    "elo": user1.user_elo
-                }
+                "problem": problem.model_dump(),
+            }, per_user={
+                player_id: {"opponent": opponents[player_id], "resume_token": resume_tokens[player_id]}
+                for player_id in (user1_id, user2_id)
             })
 
             # Start countdown timer for this match
@@ -181,27 +301,21 @@ class WebSocketManager:
         except Exception as e:
             print(f"❌ Error creating match: {e}")
             # Re-add users to queue if match creation failed
-            self.queue[user1_id] = {"elo": user1.user_elo, "websocket": self.active_connections.get(user1_id)}
-            self.queue[user2_id] = {"elo": user2.user_elo, "websocket": self.active_connections.get(user2_id)}
+            if user1 and user2:
+                self.requeue(user1_id, user1.user_elo)
+                self.requeue(user2_id, user2.user_elo)
 
     async def submit_solution(self, match_id: int, user_id: int, db: AsyncSession, frontend_seconds: int = 0):
         """Handle solution submission with LeetCode validation"""
-        from sqlalchemy import select
-        from ..database.models import MatchHistory
         from ..leetcode.service.leetcode_service import LeetCodeService
 
-        # Find the match
-        match_result = await db.execute(
-            select(MatchHistory).where(MatchHistory.match_id == match_id)
-        )
-        match = match_result.scalar_one_or_none()
-
-        if not match or match.elo_change != 0:
-            return False
+        timer_data = self.match_timers.get(match_id)
+        if timer_data and timer_data["status"] == "completed":
+            # Double submit: settlement is idempotent and just replays the recorded result
+            return await self.finish_match(match_id, user_id, db, frontend_seconds, resignation=False)
 
         # Get the user who submitted
-        user_result = await db.execute(select(User).where(User.id == user_id))
-        user = user_result.scalar_one_or_none()
+        user = await self.get_user_snapshot(user_id, db)
         
         if not user or not user.leetcode_username:
             await self.send_to_user(user_id, {
@@ -249,265 +363,125 @@ class WebSocketManager:
             })
             return False
 
-        # Store original ELOs before any swapping
-        original_user1_elo = match.winner_elo  # Original first user's ELO
-        original_user2_elo = match.loser_elo   # Original second user's ELO
-        original_user1_id = match.winner_id    # Original first user's ID
-        original_user2_id = match.loser_id     # Original second user's ID
-
-        # Determine winner and loser (submitting user wins)
-        if match.winner_id == user_id:
-            winner_id = match.winner_id
-            loser_id = match.loser_id
-        elif match.loser_id == user_id:
-            winner_id = match.loser_id
-            loser_id = match.winner_id
-            # Swap winner/loser in the match record
-            match.winner_id = winner_id
-            match.loser_id = loser_id
-        else:
-            return False
+        return await self.finish_match(match_id, user_id, db, frontend_seconds, resignation=False, submission=recent_submission)
 
+    async def resign_match(self, match_id: int, user_id: int, db: AsyncSession, frontend_seconds: int = 0):
+        """Handle match resignation"""
+        return await self.finish_match(match_id, user_id, db, frontend_seconds, resignation=True)
+
+    async def finish_match(
+        self,
+        match_id: int,
+        user_id: int,
+        db: AsyncSession,
+        frontend_seconds: int = 0,
+        resignation: bool = False,
+        submission=None,
+    ) -> bool:
+        """Settle the match (or queue it in the outbox), stop its timer and notify the players"""
         # Use frontend timer value if provided, otherwise calculate from server
+        timer_data = self.match_timers.get(match_id)
         if frontend_seconds > 0:
-            match.match_seconds = frontend_seconds
-            print(f"⏱️ Match {match_id} duration (from frontend): {frontend_seconds} seconds")
+            match_seconds = frontend_seconds
+        elif timer_data and timer_data.get("start_time"):
+            match_seconds = int(time.time() - timer_data["start_time"])
         else:
-            # Fallback to server calculation
-            timer_data = self.match_timers.get(match_id)
-            if timer_data and timer_data.get("start_time"):
-                match_duration = int(time.time() - timer_data["start_time"])
-                match.match_seconds = match_duration
-                print(f"⏱️ Match {match_id} duration (server calculated): {match_duration} seconds")
-            else:
-                match.match_seconds = 0
-                print(f"⚠️ No timer data found for match {match_id}")
-
-        # Update match with problem slug
-        problem = self.match_problems.get(match_id)
-        if problem:
-            match.leetcode_problem = problem.slug
+            match_seconds = 0
+            print(f"⚠️ No timer data found for match {match_id}")
 
-        # Get runtime and memory data from the winner's submission
+        problem = self.match_problems.get(match_id)
+        winner_runtime, winner_memory = parse_submission_stats(submission)
         try:
-            if recent_submission:
-                # Parse runtime (remove "ms" and convert to int)
-                try:
-                    winner_runtime = int(recent_submission.runtime.replace(" ms", "").replace("ms", "")) if recent_submission.runtime else -1
-                except (ValueError, AttributeError):
-                    winner_runtime = -1
-                
-                # Parse memory (remove "MB" and convert to float)
-                try:
-                    winner_memory = float(recent_submission.memory.replace(" MB", "").replace("MB", "")) if recent_submission.memory else -1.0
-                except (ValueError, AttributeError):
-                    winner_memory = -1.0
-            else:
-                winner_runtime = -1
-                winner_memory = -1.0
-        except Exception as e:
-            print(f"Error parsing submission data: {e}")
-            winner_runtime = -1
-            winner_memory = -1.0
-
-        # Get user data and calculate ELO changes
-        winner_result = await db.execute(select(User).where(User.id == winner_id))
-        winner = winner_result.scalar_one_or_none()
-        loser_result = await db.execute(select(User).where(User.id == loser_id))
-        loser = loser_result.scalar_one_or_none()
-
-        if winner and loser:
-            # Get games played for both players for Elo calculation
-            winner_games_played = await self.get_user_games_played(winner_id, db)
-            loser_games_played = await self.get_user_games_played(loser_id, db)
-            
-            # Use correct original ELOs based on actual user IDs, not swapped match record
-            if winner_id == original_user1_id:
-                # Winner was originally the first user
-                original_winner_elo = original_user1_elo
-                original_loser_elo = original_user2_elo
-            else:
-                # Winner was originally the second user
-                original_winner_elo = original_user2_elo
-                original_loser_elo = original_user1_elo
-            
-            # Calculate ELO changes using correct original ELOs
-            winner_elo_change, loser_elo_change = EloService.calculate_match_rating_changes(
-                winner_rating=original_winner_elo,
-                loser_rating=original_loser_elo,
-                winner_games_played=winner_games_played,
-                loser_games_played=loser_games_played,
-                is_resignation=False
-            )
-            
-            # Store all ELO changes accurately
-            match.elo_change = abs(loser_elo_change)  # Keep for backward compatibility
-            match.winner_elo_change = winner_elo_change  # New: Actual winner gain
-            match.loser_elo_change = loser_elo_change    # New: Actual loser loss (negative)
-            
-            # Update user ELOs
-            winner.user_elo += winner_elo_change
-            loser.user_elo += loser_elo_change  # This will be negative
-            match.winner_elo = winner.user_elo
-            match.loser_elo = loser.user_elo
-
-        # Set runtime and memory data
-        match.winner_runtime = winner_runtime
-        match.loser_runtime = -1  # Loser gets -1 for runtime
-        match.winner_memory = winner_memory
-        match.loser_memory = -1.0  # Loser gets -1 for memory
-
-        await db.commit()
+            result = None
+            if SETTLEMENT_MODE == "outbox" and timer_data and "ratings" in timer_data:
+                result = await self.settle_in_memory(
+                    match_id, user_id, timer_data, resignation, match_seconds,
+                    problem.slug if problem else None, winner_runtime, winner_memory,
+                )
+            if result is None:
+                result = await settle(
+                    db, match_id, user_id,
+                    resignation=resignation,
+                    match_seconds=match_seconds,
+                    problem_slug=problem.slug if problem else None,
+                    winner_runtime=winner_runtime,
+                    winner_memory=winner_memory,
+                )
+        except HTTPException as e:
+            print(f"❌ Could not settle match {match_id} for user {user_id}: {e.detail}")
+            return False
 
-        # Stop the timer
+        # Keep the connection snapshots in step with the new ratings
+        user_contexts.record_result(result)
+        leaderboard.record_result(result)
         self.stop_match_timer(match_id)
 
-        # Notify both players
-        await self.send_to_user(winner_id, {
-            "type": "match_completed",
-            "result": "won",
-            "match_id": match_id,
-            "elo_change": f"+{winner_elo_change}"
-        })
-
-        await self.send_to_user(loser_id, {
-            "type": "match_completed", 
-            "result": "lost",
-            "match_id": match_id,
-            "elo_change": f"{loser_elo_change}"  # Already negative
-        })
-
-        print(f"🏆 Match {match_id} completed. Winner: {winner_id}, Loser: {loser_id}")
-        return True
+        won = {"type": "match_completed", "result": "won", "match_id": match_id, "elo_change": f"+{result.winner_elo_change}"}
+        lost = {"type": "match_completed", "result": "lost", "match_id": match_id, "elo_change": f"{result.loser_elo_change}"}  # Already negative
+        if result.resignation:
+            won["reason"] = "opponent_resigned"
+            lost["reason"] = "resigned"
 
-    async def resign_match(self, match_id: int, user_id: int, db: AsyncSession, frontend_seconds: int = 0):
-        """Handle match resignation"""
-        from sqlalchemy import select
-        from ..database.models import MatchHistory
+        if result.already_settled:
+            # Only the caller is told again; the opponent already has the result
+            await self.send_to_user(user_id, won if user_id == result.winner_id else lost)
+            return True
 
-        # Find the match
-        match_result = await db.execute(
-            select(MatchHistory).where(MatchHistory.match_id == match_id)
-        )
-        match = match_result.scalar_one_or_none()
-
-        if not match or match.elo_change != 0:
-            return False
+        await self.send_to_user(result.winner_id, won)
+        await self.send_to_user(result.loser_id, lost)
 
-        # Store original ELOs before any swapping
-        original_user1_elo = match.winner_elo  # Original first user's ELO
-        original_user2_elo = match.loser_elo   # Original second user's ELO
-        original_user1_id = match.winner_id    # Original first user's ID
-        original_user2_id = match.loser_id     # Original second user's ID
-
-        # Determine winner and loser (resigning user loses)
-        if match.winner_id == user_id:
-            # User was winner, now becomes loser
-            winner_id = match.loser_id
-            loser_id = match.winner_id
-            match.winner_id = winner_id
-            match.loser_id = loser_id
-        elif match.loser_id == user_id:
-            # User was loser, stays loser
-            winner_id = match.winner_id
-            loser_id = match.loser_id
+        if result.resignation:
+            print(f"🏳️ Match {match_id} ended by resignation after {match_seconds}s. Winner: {result.winner_id}, Loser: {result.loser_id}")
         else:
-            return False
-
-        # Use frontend timer value if provided, otherwise calculate from server
-        if frontend_seconds > 0:
-            match.match_seconds = frontend_seconds
-            print(f"⏱️ Match {match_id} resigned after (from frontend): {frontend_seconds} seconds")
-        else:
-            # Fallback to server calculation
-            timer_data = self.match_timers.get(match_id)
-            if timer_data and timer_data.get("start_time"):
-                match_duration = int(time.time() - timer_data["start_time"])
-                match.match_seconds = match_duration
-                print(f"⏱️ Match {match_id} resigned after (server calculated): {match_duration} seconds")
-            else:
-                match.match_seconds = 0
-                print(f"⚠️ No timer data found for resigned match {match_id}")
-
-        # Update match with problem slug
-        problem = self.match_problems.get(match_id)
-        if problem:
-            match.leetcode_problem = problem.slug
-
-        # Get user data and calculate ELO changes for resignation
-        winner_result = await db.execute(select(User).where(User.id == winner_id))
-        winner = winner_result.scalar_one_or_none()
-        loser_result = await db.execute(select(User).where(User.id == loser_id))
-        loser = loser_result.scalar_one_or_none()
-
-        if winner and loser:
-            # Get games played for both players for Elo calculation
-            winner_games_played = await self.get_user_games_played(winner_id, db)
-            loser_games_played = await self.get_user_games_played(loser_id, db)
-            
-            # Use correct original ELOs based on actual user IDs, not swapped match record
-            if winner_id == original_user1_id:
-                # Winner was originally the first user
-                original_winner_elo = original_user1_elo
-                original_loser_elo = original_user2_elo
-            else:
-                # Winner was originally the second user
-                original_winner_elo = original_user2_elo
-                original_loser_elo = original_user1_elo
-            
-            # Calculate ELO changes using correct original ELOs
-            winner_elo_change, loser_elo_change = EloService.calculate_match_rating_changes(
-                winner_rating=original_winner_elo,
-                loser_rating=original_loser_elo,
-                winner_games_played=winner_games_played,
-                loser_games_played=loser_games_played,
-                is_resignation=True
-            )
-            
-            # Store all ELO changes accurately
-            match.elo_change = abs(loser_elo_change)  # Keep for backward compatibility
-            match.winner_elo_change = winner_elo_change  # New: Actual winner gain
-            match.loser_elo_change = loser_elo_change    # New: Actual loser loss (negative)
-            
-            # Update user ELOs
-            winner.user_elo += winner_elo_change
-            loser.user_elo += loser_elo_change  # This will be negative
-            match.winner_elo = winner.user_elo
-            match.loser_elo = loser.user_elo
-
-        # Set runtime and memory data for resignation (both get -1 since no valid submission)
-        match.winner_runtime = -1
-        match.loser_runtime = -1
-        match.winner_memory = -1.0
-        match.loser_memory = -1.0
-
-        await db.commit()
-
-        # Notify both players
-        await self.send_to_user(winner_id, {
-            "type": "match_completed",
-            "result": "won",
-            "match_id": match_id,
-            "elo_change": f"+{winner_elo_change}",
-            "reason": "opponent_resigned"
-        })
-
-        await self.send_to_user(loser_id, {
-            "type": "match_completed", 
-            "result": "lost",
-            "match_id": match_id,
-            "elo_change": f"{loser_elo_change}",  # Already negative
-            "reason": "resigned"
-        })
-
-        print(f"🏳️ Match {match_id} ended by resignation. Winner: {winner_id}, Loser: {loser_id}")
-        
-        # Stop the timer for this match
-        if match_id in self.match_timers:
-            self.match_timers[match_id]["status"] = "completed"
-        
+            print(f"🏆 Match {match_id} completed after {match_seconds}s. Winner: {result.winner_id}, Loser: {result.loser_id}")
         return True
 
+    async def settle_in_memory(
+        self,
+        match_id: int,
+        user_id: int,
+        timer_data: dict,
+        resignation: bool,
+        match_seconds: int,
+        problem_slug,
+        winner_runtime: int,
+        winner_memory: float,
+    ):
+        """
+        Outbox mode: decide the result from the match state and queue its DB write.
+
+        The first call records the result in the match state; later calls
+        replay it. Returns None if the outbox cannot take the record, so the
+        caller settles synchronously instead.
+        """
+        recorded = timer_data.get("result")
+        if recorded:
+            return replace(recorded, already_settled=True)
+        if user_id not in timer_data["ratings"]:
+            raise HTTPException(status_code=400, detail="User not in this match")
+        if timer_data.get("abandoned"):
+            raise HTTPException(status_code=400, detail="Match was abandoned")
+        if timer_data.get("settling"):
+            return None  # A synchronous settlement (e.g. REST) is in flight; the DB decides
+
+        ratings = timer_data["ratings"]
+        result = decide_result(
+            match_id, user_id,
+            starting_elo={player_id: elo for player_id, (elo, _) in ratings.items()},
+            games_played={player_id: games for player_id, (_, games) in ratings.items()},
+            resignation=resignation,
+        )
+        timer_data["result"] = result  # Set before awaiting, so a concurrent submit sees it
+        try:
+            await settlement_outbox.add(PendingSettlement(
+                result, match_seconds, problem_slug, winner_runtime, winner_memory, datetime.utcnow(),
+            ))
+        except OSError as e:
+            print(f"❌ Settlement outbox unavailable, settling match {match_id} synchronously: {e}")
+            timer_data.pop("result", None)
+            return None
+        return result
+
     async def run_match_timer(self, match_id: int):
         """Run the synchronized timer for a match"""
         if match_id not in self.match_timers:
@@ -521,26 +495,28 @@ class WebSocketManager:
             for countdown in [3, 2, 1]:
                 if timer_data["status"] != "countdown":
                     return
+                timer_data["countdown"] = countdown
                 
                 # Send countdown to both players
-                for player_id in players:
-                    await self.send_to_user(player_id, {
-                        "type": "timer_update",
-                        "phase": "countdown",
-                        "countdown": countdown
-                    })
+                await self.broadcast(players, {
+                    "type": "timer_update",
+                    "phase": "countdown",
+                    "countdown": countdown
+                })
                 
                 await asyncio.sleep(1)
 
             # Send "START!" message
-            for player_id in players:
-                await self.send_to_user(player_id, {
-                    "type": "timer_update",
-                    "phase": "start",
-                    "message": "START!"
-                })
+            timer_data["status"] = "start"
+            await self.broadcast(players, {
+                "type": "timer_update",
+                "phase": "start",
+                "message": "START!"
+            })
             
             await asyncio.sleep(1)
+            if timer_data["status"] != "start":
+                return  # Ended (e.g. resigned) during START!
 
             # Start match timer
             timer_data["status"] = "active"
@@ -551,12 +527,11 @@ class WebSocketManager:
             start_timestamp = timer_data["start_time"]
             
             # Send match start time to both players for client-side calculation
-            for player_id in players:
-                await self.send_to_user(player_id, {
-                    "type": "timer_update",
-                    "phase": "active",
-                    "start_timestamp": start_timestamp
-                })
+            await self.broadcast(players, {
+                "type": "timer_update",
+                "phase": "active",
+                "start_timestamp": start_timestamp
+            })
             
             # Keep timer alive but don't send continuous updates
             while timer_data["status"] == "active":
@@ -565,10 +540,63 @@ class WebSocketManager:
         except Exception as e:
             print(f"❌ Timer error for match {match_id}: {e}")
         finally:
-            # Clean up timer data
+            # Clean up timer data and the match's resume tokens
             if match_id in self.match_timers:
+                for token in self.match_timers[match_id].get("resume_tokens", {}).values():
+                    self.resume_tokens.pop(token, None)
                 del self.match_timers[match_id]
 
+    async def resume_match(self, user_id: int, token: str) -> bool:
+        """
+        Restore a reconnecting player into their live match from in-memory state.
+
+        Sends match_resumed with the problem, opponent and current timer phase
+        (plus start_timestamp once active), or resume_failed if the token is
+        unknown, belongs to someone else or the match is over. No DB access.
+        """
+        match_id, token_user_id = self.resume_tokens.get(token, (None, None))
+        timer_data = self.match_timers.get(match_id)
+        problem = self.match_problems.get(match_id)
+        if token_user_id != user_id or not timer_data or timer_data["status"] == "completed" or not problem:
+            await self.send_to_user(user_id, {"type": "resume_failed", "message": "Match is no longer active"})
+            return False
+
+        message = {
+            "type": "match_resumed",
+            "match_id": match_id,
+            "problem": problem.model_dump(),
+            "opponent": timer_data["opponents"][user_id],
+            "resume_token": token,
+            "phase": timer_data["status"],
+        }
+        if timer_data["status"] == "countdown":
+            message["countdown"] = timer_data["countdown"]
+        if timer_data["start_time"] is not None:
+            message["start_timestamp"] = timer_data["start_time"]
+        await self.send_to_user(user_id, message)
+        print(f"🔁 User {user_id} resumed match {match_id}")
+        return True
+
+    def get_match_preview(self, match_id: int) -> Optional[dict]:
+        """Cached rating preview for a live match (None once it is over)."""
+        timer_data = self.match_timers.get(match_id)
+        return timer_data.get("preview") if timer_data else None
+
+    def record_settled(self, match_id: int, result):
+        """Record a result settled outside the in-memory path in the live match state and stop its timer."""
+        timer_data = self.match_timers.get(match_id)
+        if timer_data is None:
+            return
+        timer_data.setdefault("result", replace(result, already_settled=False))
+        self.stop_match_timer(match_id)
+
+    def abandon_match(self, match_id: int):
+        """A live match that was abandoned in the DB: it can no longer be settled from memory."""
+        timer_data = self.match_timers.get(match_id)
+        if timer_data and not timer_data.get("result"):
+            timer_data["abandoned"] = True
+            self.stop_match_timer(match_id)
+
     def stop_match_timer(self, match_id: int):
         """Stop the timer for a match"""
         if match_id in self.match_timers:
@@ -1,14 +1,30 @@
 # src/matchmaking/websocket_routes.py
-import json
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from ..database.database import get_db
-from ..database.models import User
+from ..database.database import get_db, db_pool_metrics
 from .websocket_manager import websocket_manager
+from .metrics import process_snapshot
+from .outbox import settlement_outbox
+from ..users.leaderboard import leaderboard
+from .protocol import negotiate_codec
+from .user_context import load_user_snapshot, user_contexts
 
 router = APIRouter()
 
+@router.get("/metrics")
+async def matchmaking_metrics():
+    """Process and socket-server health numbers (used by scripts/load_test.py)"""
+    return {
+        **process_snapshot(),
+        "active_connections": len(websocket_manager.active_connections),
+        "queue_size": len(websocket_manager.queue),
+        "active_matches": len(websocket_manager.match_timers),
+        "evicted_idle_connections": websocket_manager.evicted_idle,
+        "settlement_outbox": settlement_outbox.snapshot(),
+        "db_pool": db_pool_metrics(),
+        "leaderboard": leaderboard.snapshot(),
+    }
+
 @router.websocket("/ws/test")
 async def test_websocket(websocket: WebSocket):
     """Simple WebSocket test endpoint"""
@@ -25,12 +41,16 @@ async def websocket_endpoint(websocket: WebSocket, user_id: int):
     """WebSocket endpoint for matchmaking"""
     
     try:
-        # Accept connection first
-        await websocket.accept()
-        print(f"🔌 WebSocket connection accepted for user {user_id}")
+        # Accept connection first, agreeing on a wire encoding (JSON unless the client offers another)
+        codec, subprotocol = negotiate_codec(websocket.scope.get("subprotocols"))
+        await websocket.accept(subprotocol=subprotocol)
+        print(f"🔌 WebSocket connection accepted for user {user_id} ({codec.name})")
+        
+        # Load the user once; message handlers below read this snapshot instead of the DB
+        snapshot = await load_user_snapshot(user_id)
         
         # Connect user to manager
-        await websocket_manager.connect(websocket, user_id)
+        await websocket_manager.connect(websocket, user_id, codec, snapshot)
         
         # Send connection confirmation
         await websocket_manager.send_to_user(user_id, {
@@ -38,28 +58,33 @@ async def websocket_endpoint(websocket: WebSocket, user_id: int):
             "message": "WebSocket connected successfully"
         })
         
+        # Reconnecting mid-match: restore from the in-memory match state
+        resume_token = websocket.query_params.get("resume_token")
+        if resume_token:
+            await websocket_manager.resume_match(user_id, resume_token)
+        
         while True:
             # Receive messages from client
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            event = await websocket.receive()
+            if event["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(event.get("code", 1000))
+            data = event.get("bytes") if event.get("bytes") is not None else event.get("text")
+            message = codec.decode(data)
+            websocket_manager.touch(user_id)  # Any inbound message counts as a heartbeat
             print(f"📨 Received message from user {user_id}: {message}")
             
             message_type = message.get("type")
             
             if message_type == "join_queue":
-                # Get database session for this operation
-                from ..database.database import AsyncSessionLocal
-                async with AsyncSessionLocal() as db:
-                    # Get user data
-                    result = await db.execute(select(User).where(User.id == user_id))
-                    user = result.scalar_one_or_none()
-                    if user:
-                        await websocket_manager.join_queue(user_id, user.user_elo, db)
-                    else:
-                        await websocket_manager.send_to_user(user_id, {
-                            "type": "error",
-                            "message": "User not found"
-                        })
+                # ELO comes from the connection snapshot, kept current by settlement
+                user = user_contexts.get(user_id)
+                if user:
+                    await websocket_manager.join_queue(user_id, user.user_elo)
+                else:
+                    await websocket_manager.send_to_user(user_id, {
+                        "type": "error",
+                        "message": "User not found"
+                    })
                         
             elif message_type == "leave_queue":
                 await websocket_manager.leave_queue(user_id)
@@ -94,9 +119,12 @@ async def websocket_endpoint(websocket: WebSocket, user_id: int):
                 # Heartbeat to keep connection alive
                 await websocket_manager.send_to_user(user_id, {"type": "pong"})
                 
+            elif message_type == "pong":
+                pass  # Reply to a server heartbeat; touch() above already recorded it
+                
     except WebSocketDisconnect:
         print(f"🔌 WebSocket disconnected for user {user_id}")
-        websocket_manager.disconnect(user_id)
+        websocket_manager.disconnect(user_id, websocket)
     except Exception as e:
         print(f"❌ WebSocket error for user {user_id}: {e}")
-        websocket_manager.disconnect(user_id)
\ No newline at end of file
+        websocket_manager.disconnect(user_id, websocket)
\ No newline at end of file
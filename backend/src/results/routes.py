@@ -1,7 +1,9 @@
 # src/results/routes.py
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from ..database.database import get_db
+from ..database.database import get_read_db
+from ..history.service import HISTORY_PAGE_SIZE_MAX
 from .service import ResultsService
 
 router = APIRouter(prefix="/match-result", tags=["Match Results"])
@@ -9,7 +11,7 @@ router = APIRouter(prefix="/match-result", tags=["Match Results"])
 @router.get("/{match_id}")
 async def get_match_result(
     match_id: int,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get match result by match ID - publicly viewable."""
     
@@ -43,7 +45,7 @@ async def get_match_result(
 @router.get("/")
 async def list_recent_matches(
     limit: int = 10,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """List recent matches for testing purposes."""
     
@@ -58,19 +60,21 @@ async def list_recent_matches(
 @router.get("/user/{user_id}/history")
 async def get_user_match_history(
     user_id: int,
-    limit: int = 10,
-    db: AsyncSession = Depends(get_db)
+    limit: int = Query(10, ge=1, le=HISTORY_PAGE_SIZE_MAX),
+    cursor: Optional[int] = Query(None, description="next_cursor from the previous page"),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get match history for a specific user."""
+    """Get one page of match history for a specific user (newest first)."""
     
     try:
         # Use service layer to get user match history
-        history = await ResultsService.get_user_match_history(db, user_id, limit)
+        history, next_cursor = await ResultsService.get_user_match_history(db, user_id, limit, cursor)
         
         return {
             "user_id": user_id,
             "matches": history,
-            "total": len(history)
+            "total": len(history),
+            "next_cursor": next_cursor
         }
         
     except Exception as e:
@@ -79,5 +83,6 @@ async def get_user_match_history(
         return {
             "user_id": user_id,
             "matches": [],
-            "total": 0
+            "total": 0,
+            "next_cursor": None
         }
\ No newline at end of file
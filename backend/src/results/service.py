@@ -1,8 +1,10 @@
 # src/results/service.py
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from typing import Optional, List, Dict, Any
-from ..database.models import MatchHistory, User
+from typing import Optional, List, Dict, Any, Tuple
+from ..database.models import MatchHistory
+from ..history.service import fetch_match_page
+from ..users.loader import UserLoader
 
 class ResultsService:
     """Service layer for handling match results database operations."""
@@ -28,16 +30,12 @@ class ResultsService:
         if not match_history:
             return None
         
-        # Query winner and loser user details
-        winner_result = await db.execute(
-            select(User).where(User.id == match_history.winner_id)
+        # Winner and loser usernames in one query
+        users = await UserLoader(db, columns=("leetcode_username",)).get_many(
+            [match_history.winner_id, match_history.loser_id]
         )
-        winner = winner_result.scalar_one_or_none()
-        print(winner.leetcode_username)
-        loser_result = await db.execute(
-            select(User).where(User.id == match_history.loser_id)
-        )
-        loser = loser_result.scalar_one_or_none()
+        winner = users.get(match_history.winner_id)
+        loser = users.get(match_history.loser_id)
         
         # Calculate ELO before the match
         winner_elo_before = match_history.winner_elo - match_history.elo_change
@@ -95,18 +93,16 @@ class ResultsService:
         )
         matches = result.scalars().all()
         
+        # Usernames for every match in one query
+        users = UserLoader(db, columns=("leetcode_username",))
+        for match in matches:
+            users.want(match.winner_id, match.loser_id)
+        loaded = await users.load()
+        
         match_list = []
         for match in matches:
-            # Get usernames for each match
-            winner_result = await db.execute(
-                select(User).where(User.id == match.winner_id)
-            )
-            winner = winner_result.scalar_one_or_none()
-            
-            loser_result = await db.execute(
-                select(User).where(User.id == match.loser_id)
-            )
-            loser = loser_result.scalar_one_or_none()
+            winner = loaded.get(match.winner_id)
+            loser = loaded.get(match.loser_id)
             
             match_list.append({
                 "match_id": match.match_id,
@@ -125,50 +121,35 @@ class ResultsService:
         }
     
     @staticmethod
-    async def get_user_match_history(db: AsyncSession, user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+    async def get_user_match_history(
+        db: AsyncSession, user_id: int, limit: int = 10, cursor: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
         """
-        Get match history for a specific user.
+        Get one page of match history for a specific user.
         
         Args:
             db: Database session
             user_id: The user ID to get history for
             limit: Maximum number of matches to return
+            cursor: Only matches older than this match_id (the previous page's next_cursor)
             
         Returns:
-            List of matches where the user participated
+            (matches where the user participated, newest first; next_cursor or None)
         """
-        # Get matches where user was either winner or loser
-        matches_result = await db.execute(
-            select(MatchHistory)
-            .where(
-                (MatchHistory.winner_id == user_id) | 
-                (MatchHistory.loser_id == user_id)
-            )
-            .order_by(MatchHistory.match_id.desc())
-            .limit(limit)
-        )
-        
-        matches = matches_result.scalars().all()
+        rows, next_cursor = await fetch_match_page(db, user_id, limit, cursor, with_match=True)
         
         history = []
-        for match in matches:
-            # Determine if user won or lost
-            won = match.winner_id == user_id
-            opponent_id = match.loser_id if won else match.winner_id
-            
-            # Get opponent username
-            opponent_result = await db.execute(
-                select(User).where(User.id == opponent_id)
-            )
-            opponent = opponent_result.scalar_one_or_none()
+        for participant, match, opponent_username in rows:
+            won = participant.outcome == "win"
+            opponent_id = participant.opponent_id
             
             history.append({
                 "match_id": match.match_id,
                 "won": won,
                 "opponent_id": opponent_id,
-                "opponent_username": opponent.leetcode_username if opponent else f"Player{opponent_id}",
-                "elo_change": match.elo_change if won else -match.elo_change,
-                "final_elo": match.winner_elo if won else match.loser_elo,
+                "opponent_username": opponent_username or f"Player{opponent_id}",
+                "elo_change": participant.elo_delta,
+                "final_elo": participant.elo_after,
                 "problem": match.leetcode_problem,
                 "match_duration": match.match_seconds,
                 "user_runtime": match.winner_runtime if won else match.loser_runtime,
@@ -177,4 +158,4 @@ class ResultsService:
                 "opponent_memory": match.loser_memory if won else match.winner_memory
             })
         
-        return history
\ No newline at end of file
+        return history, next_cursor
\ No newline at end of file
@@ -4,6 +4,7 @@ from sqlalchemy import select
 from src.database.models import User as UserModel
 from typing import Optional
 from src.settings.schemas import UserSettingsOut, UpdateUserSettings
+from src.matchmaking.user_context import user_contexts
 
 
 async def get_settings_data(db: AsyncSession, user_id: int) -> Optional[UserSettingsOut]:
@@ -36,4 +37,5 @@ async def update_settings_data(db: AsyncSession, user_id: int, data: UpdateUserS
 
     await db.commit()
     await db.refresh(user)
+    user_contexts.refresh(user)  # Open matchmaking sockets see the new preferences
     return user
\ No newline at end of file
@@ -0,0 +1,222 @@
+# src/users/leaderboard.py
+"""
+ELO leaderboard kept in a Redis sorted set (member = user id, score =
+ELO * 2**32 - user id, so equal ratings rank by user id like the users-table
+fallback; see score()/elo_of()).
+
+Top-N pages (ZREVRANGE), a user's rank (ZREVRANK) and the window around
+them are all O(log n) however many users there are. Settlement and
+registration queue rating changes with record()/record_result(); a single
+background flush writes them with one ZADD, latest rating per user, so the
+result push never waits on Redis. If Redis is down the writes are dropped
+with a warning. A set holding fewer members than the users table (Redis was
+down at boot, or restarted without persistence) is refilled on startup, and
+reads compare ZCARD with the users table at most every
+LEADERBOARD_CHECK_SECONDS: a short set is rebuilt in the background and
+reads use the users table until it is whole again.
+`scripts/reconcile.py leaderboard` repairs any other drift.
+"""
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+import redis.asyncio as aioredis
+from sqlalchemy import select, func
+from src.database.models import User
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+REDIS_TIMEOUT = float(os.getenv("REDIS_TIMEOUT", "2"))  # seconds; reads fall back instead of hanging
+LEADERBOARD_KEY = os.getenv("LEADERBOARD_KEY", "leaderboard:elo-id")  # new name: sets under the old key hold raw ELO scores
+LEADERBOARD_BATCH_SIZE = 1000
+LEADERBOARD_CHECK_SECONDS = float(os.getenv("LEADERBOARD_CHECK_SECONDS", "60"))  # how often reads compare ZCARD with users
+DEFAULT_ELO = 1200  # users.user_elo default
+
+TIEBREAK = 2 ** 32  # user ids stay below this; scores stay exact in a double up to ELO 2**21
+
+# (rank starting at 1, user_id, elo)
+Entry = Tuple[int, int, int]
+
+
+def score(user_id: int, elo: int) -> int:
+    """Sorted-set score: ELO first, then the lower user id ranks higher (ELO desc, id asc in SQL)"""
+    return elo * TIEBREAK - user_id
+
+
+def elo_of(score: float) -> int:
+    """The ELO encoded in a sorted-set score"""
+    return (int(score) + TIEBREAK - 1) // TIEBREAK
+
+
+class Leaderboard:
+    def __init__(self, key: str = LEADERBOARD_KEY, url: str = REDIS_URL, client=None, check_seconds: float = LEADERBOARD_CHECK_SECONDS):
+        self.key = key
+        self.url = url
+        self.client = client
+        self.check_seconds = check_seconds
+        self.complete = False  # Whether the set held every user at the last check
+        self._checked_at: Optional[float] = None
+        self._rebuild_task: Optional[asyncio.Task] = None
+        self._pending: Dict[int, int] = {}  # user_id -> latest elo not yet written
+        self._flush_task: Optional[asyncio.Task] = None
+        self.dropped_writes = 0
+        self._failing = False
+
+    async def connect(self):
+        if self.client is None:
+            self.client = aioredis.from_url(
+                self.url, decode_responses=True, socket_connect_timeout=REDIS_TIMEOUT, socket_timeout=REDIS_TIMEOUT
+            )
+        return self.client
+
+    # ---- writes ----
+
+    def record(self, user_id: int, elo: int):
+        """Queue a rating for the leaderboard; written by a background flush."""
+        self._pending[user_id] = elo if elo is not None else DEFAULT_ELO
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush())
+
+    def record_result(self, result):
+        """Queue both new ratings from a SettlementResult."""
+        if result.already_settled:
+            return
+        self.record(result.winner_id, result.winner_elo)
+        self.record(result.loser_id, result.loser_elo)
+
+    async def _flush(self):
+        while self._pending:
+            batch, self._pending = self._pending, {}
+            try:
+                await self.set_ratings(batch)
+            except Exception as e:
+                self.dropped_writes += len(batch)
+                if not self._failing:  # Once per outage, not once per match
+                    print(f"⚠️ Leaderboard updates are being dropped (reconcile to repair): {e}")
+                self._failing = True
+                continue
+            if self._failing:
+                print(f"✅ Leaderboard updates resumed ({self.dropped_writes} dropped so far)")
+                self._failing = False
+
+    async def set_ratings(self, ratings: Dict[int, int]):
+        if ratings:
+            redis = await self.connect()
+            await redis.zadd(self.key, {str(user_id): score(user_id, elo) for user_id, elo in ratings.items()})
+
+    # ---- reads ----
+
+    async def size(self) -> int:
+        redis = await self.connect()
+        return await redis.zcard(self.key)
+
+    async def top(self, offset: int = 0, limit: int = 10) -> List[Entry]:
+        """One page of the ranking, best first."""
+        redis = await self.connect()
+        rows = await redis.zrevrange(self.key, offset, offset + limit - 1, withscores=True)
+        return [(offset + i + 1, int(member), elo_of(value)) for i, (member, value) in enumerate(rows)]
+
+    async def rank(self, user_id: int) -> Optional[Entry]:
+        redis = await self.connect()
+        index = await redis.zrevrank(self.key, str(user_id))
+        if index is None:
+            return None
+        value = await redis.zscore(self.key, str(user_id))
+        return (index + 1, user_id, elo_of(value))
+
+    async def around(self, user_id: int, radius: int = 5) -> List[Entry]:
+        """The user's entry with up to `radius` neighbours on each side."""
+        redis = await self.connect()
+        index = await redis.zrevrank(self.key, str(user_id))
+        if index is None:
+            return []
+        start = max(index - radius, 0)
+        return await self.top(start, index + radius - start + 1)
+
+    # ---- reconciliation ----
+
+    async def missing(self, db) -> int:
+        """How many users the set is short of (0 when it holds at least every user)."""
+        users = (await db.execute(select(func.count()).select_from(User))).scalar_one()
+        return max(users - await self.size(), 0)
+
+    async def seed_if_short(self, db) -> int:
+        """Fill the set from the users table when it holds fewer members than users. Returns users added."""
+        if not await self.missing(db):
+            self.complete = True
+            return 0
+        drift = await self.reconcile(db)
+        self.complete = True
+        return sum(1 for _, stored, _ in drift if stored is None)
+
+    async def is_complete(self, db) -> bool:
+        """
+        Whether reads can be served from the set. Compares it with the users
+        table at most every check_seconds; a short set starts a background
+        rebuild and reads fall back to the users table until it finishes.
+        Raises RedisError if Redis is unreachable.
+        """
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_seconds:
+            return self.complete
+        self._checked_at = now  # One check per interval, however many requests arrive
+        self.complete = not await self.missing(db)
+        if not self.complete and (self._rebuild_task is None or self._rebuild_task.done()):
+            print("⚠️ Leaderboard is missing users, rebuilding it from the users table")
+            self._rebuild_task = asyncio.create_task(self._rebuild())
+        return self.complete
+
+    async def _rebuild(self):
+        from src.database.database import AsyncSessionLocal
+        try:
+            async with AsyncSessionLocal() as db:
+                added = await self.seed_if_short(db)
+            print(f"🏆 Leaderboard rebuilt ({added} users added)")
+        except Exception as e:
+            print(f"⚠️ Leaderboard rebuild failed, retrying on a later read: {e}")
+        self._checked_at = None  # Re-check on the next read
+
+    async def reconcile(self, db, dry_run: bool = False) -> List[Tuple[int, Optional[int], Optional[int]]]:
+        """
+        Compare the set with users.user_elo, streaming users in batches.
+        Returns (user_id, stored, actual) for every difference (stored None:
+        missing from the set; actual None: no such user) and fixes them
+        unless dry_run.
+        """
+        redis = await self.connect()
+        drift = []
+        seen = set()
+        result = await db.stream(
+            select(User.id, User.user_elo).execution_options(yield_per=LEADERBOARD_BATCH_SIZE)
+        )
+        async for batch in result.partitions():
+            members = [str(user_id) for user_id, _ in batch]
+            values = await redis.zmscore(self.key, members)
+            fixes = {}
+            for (user_id, elo), value in zip(batch, values):
+                seen.add(user_id)
+                elo = elo if elo is not None else DEFAULT_ELO
+                if value is None or int(value) != score(user_id, elo):
+                    drift.append((user_id, None if value is None else elo_of(value), elo))
+                    fixes[user_id] = elo
+            if fixes and not dry_run:
+                await self.set_ratings(fixes)
+
+        extra = {}
+        async for member, value in redis.zscan_iter(self.key):
+            if int(member) not in seen:
+                extra[int(member)] = elo_of(value)
+        if extra:
+            # Users registered while we streamed are not extras
+            registered = set((await db.execute(select(User.id).where(User.id.in_(extra)))).scalars())
+            extra = {user_id: elo for user_id, elo in extra.items() if user_id not in registered}
+            drift.extend((user_id, elo, None) for user_id, elo in extra.items())
+            if extra and not dry_run:
+                await redis.zrem(self.key, *map(str, extra))
+        return drift
+
+    def snapshot(self) -> dict:
+        return {"pending": len(self._pending), "dropped_writes": self.dropped_writes}
+
+
+# Global leaderboard, seeded from the app lifespan
+leaderboard = Leaderboard()
@@ -0,0 +1,65 @@
+# src/users/loader.py
+"""
+Request-scoped batch loading of users.
+
+Build one UserLoader per request, tell it every user id the response needs
+(want()) and resolve them together: a single `WHERE user_id IN (...)` that
+selects only the loader's columns. Loaded users are cached for the rest of
+the request, so asking again costs nothing.
+
+    loader = UserLoader(db)
+    loader.want(match.winner_id, match.loser_id)
+    users = await loader.load()          # {user_id: row}
+    winner = users.get(match.winner_id)  # row.id, row.email, row.leetcode_username, row.user_elo
+"""
+from typing import Dict, Iterable, Optional, Sequence
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.database.models import User
+
+# What response builders read from a user; add columns per loader when needed
+DEFAULT_COLUMNS = ("id", "email", "leetcode_username", "user_elo")
+
+
+class UserLoader:
+    def __init__(self, db: AsyncSession, columns: Sequence[str] = DEFAULT_COLUMNS):
+        self.db = db
+        self.columns = tuple(columns) if "id" in columns else ("id", *columns)
+        self._wanted = set()
+        self._loaded: Dict[int, object] = {}
+        self._missing = set()
+        self.queries = 0
+
+    def want(self, *user_ids: Optional[int]) -> "UserLoader":
+        """Queue ids for the next load(); known and None ids are skipped."""
+        for user_id in user_ids:
+            if user_id is not None and user_id not in self._loaded and user_id not in self._missing:
+                self._wanted.add(user_id)
+        return self
+
+    def want_many(self, user_ids: Iterable[Optional[int]]) -> "UserLoader":
+        return self.want(*user_ids)
+
+    async def load(self) -> Dict[int, object]:
+        """Resolve every queued id with one query. Returns all users loaded so far."""
+        if self._wanted:
+            wanted, self._wanted = self._wanted, set()
+            result = await self.db.execute(
+                select(*(getattr(User, column) for column in self.columns)).where(User.id.in_(wanted))
+            )
+            self.queries += 1
+            for row in result:
+                self._loaded[row.id] = row
+            self._missing |= wanted - self._loaded.keys()
+        return self._loaded
+
+    async def get(self, user_id: int):
+        """One user (None if it does not exist); resolves anything else queued in the same query."""
+        self.want(user_id)
+        return (await self.load()).get(user_id)
+
+    async def get_many(self, user_ids: Iterable[int]) -> Dict[int, object]:
+        """The users among `user_ids` that exist, keyed by id."""
+        user_ids = list(user_ids)
+        loaded = await self.want_many(user_ids).load()
+        return {user_id: loaded[user_id] for user_id in user_ids if user_id in loaded}
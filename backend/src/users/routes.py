@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import desc, select
+from sqlalchemy import desc, select, func, or_, and_
+from redis.exceptions import RedisError
 from src.database.models import User
-from src.database.database import get_db
+from src.database.database import get_db, get_read_db
 from src.users import service, schemas
+from src.users.leaderboard import leaderboard
+from src.users.loader import UserLoader
+
+LEADERBOARD_PAGE_SIZE_MAX = 100
 
 router = APIRouter()
 
@@ -16,7 +21,7 @@ async def register_user(user: schemas.UserCreate, db: AsyncSession = Depends(get
         raise HTTPException(status_code=400, detail="User already exists or invalid input")
 
 @router.get("/users/{user_id}", response_model=schemas.UserStats)
-async def get_user_by_id(user_id: int, db: AsyncSession = Depends(get_db)):
+async def get_user_by_id(user_id: int, db: AsyncSession = Depends(get_read_db)):
     """
     Fetch email, leetcode_hash, leetcode_username, and user_elo
     for a single user by user_id.
@@ -36,30 +41,114 @@ async def get_user_by_id(user_id: int, db: AsyncSession = Depends(get_db)):
         "user_elo": user.user_elo
     }
     
-@router.get("/leaderboard")
-async def get_leaderboard(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
-        select(
-            User.id,
-            User.leetcode_username,
-            User.user_elo,
-            User.winstreak
-        ).order_by(desc(User.user_elo))
-        .limit(10)
+async def _leaderboard_rows(db: AsyncSession, entries) -> list:
+    """Leaderboard entries (rank, user_id, elo) with names and streaks from one user query"""
+    users = await UserLoader(db, columns=("leetcode_username", "winstreak")).get_many(
+        user_id for _, user_id, _ in entries
     )
-    users = result.all()
-    
-    if not users:
-        raise HTTPException(status_code=404, detail="No users found")
-
-    leaderboard = [
+    return [
         {
             "rank": rank,
-            "username": user.leetcode_username,
-            "elo": user.user_elo,
-            "winstreak": user.winstreak
+            "user_id": user_id,
+            "username": users[user_id].leetcode_username,
+            "elo": elo,
+            "winstreak": users[user_id].winstreak
         }
-        for rank, user in enumerate(users, start=1)
+        for rank, user_id, elo in entries
+        if user_id in users
     ]
 
-    return leaderboard
\ No newline at end of file
+
+async def _redis_ready(db: AsyncSession) -> bool:
+    """Whether the sorted set can answer: Redis reachable and holding every user"""
+    try:
+        return await leaderboard.is_complete(db)
+    except RedisError as e:
+        print(f"⚠️ Leaderboard unavailable, reading the users table: {e}")
+        return False
+
+
+def _ranking():
+    """The leaderboard order in SQL: ELO descending, ties by user id"""
+    return desc(User.user_elo), User.id
+
+
+async def _db_top(db: AsyncSession, offset: int, limit: int) -> list:
+    result = await db.execute(select(User.id, User.user_elo).order_by(*_ranking()).offset(offset).limit(limit))
+    return [(offset + i + 1, user_id, elo) for i, (user_id, elo) in enumerate(result)]
+
+
+async def _db_rank(db: AsyncSession, user_id: int):
+    """A user's (rank, user_id, elo) from the users table, or None"""
+    elo = (await db.execute(select(User.user_elo).where(User.id == user_id))).scalar_one_or_none()
+    if elo is None:
+        return None
+    above = await db.execute(
+        select(func.count()).select_from(User)
+        .where(or_(User.user_elo > elo, and_(User.user_elo == elo, User.id < user_id)))
+    )
+    return (above.scalar_one() + 1, user_id, elo)
+
+
+@router.get("/leaderboard")
+async def get_leaderboard(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=LEADERBOARD_PAGE_SIZE_MAX),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Top players by ELO, one page at a time"""
+    entries = None
+    if await _redis_ready(db):
+        try:
+            entries = await leaderboard.top(offset, limit)
+        except RedisError as e:
+            print(f"⚠️ Leaderboard unavailable, reading the users table: {e}")
+    if entries is None:
+        entries = await _db_top(db, offset, limit)
+    
+    if not entries:
+        raise HTTPException(status_code=404, detail="No users found")
+
+    return await _leaderboard_rows(db, entries)
+
+
+@router.get("/leaderboard/rank/{user_id}")
+async def get_leaderboard_rank(user_id: int, db: AsyncSession = Depends(get_read_db)):
+    """A user's exact rank"""
+    entry = total = None
+    if await _redis_ready(db):
+        try:
+            entry, total = await leaderboard.rank(user_id), await leaderboard.size()
+        except RedisError:
+            pass
+    if total is None:
+        entry = await _db_rank(db, user_id)
+        total = (await db.execute(select(func.count()).select_from(User))).scalar_one()
+    rows = await _leaderboard_rows(db, [entry] if entry else [])
+    if not rows:
+        raise HTTPException(status_code=404, detail="User not ranked")
+    return {**rows[0], "total": total}
+
+
+@router.get("/leaderboard/around/{user_id}")
+async def get_leaderboard_around(
+    user_id: int,
+    radius: int = Query(5, ge=0, le=50),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """The players ranked just above and below a user, and the user"""
+    entries = None
+    if await _redis_ready(db):
+        try:
+            entries = await leaderboard.around(user_id, radius)
+        except RedisError:
+            pass
+    if entries is None:
+        entry = await _db_rank(db, user_id)
+        entries = []
+        if entry:
+            start = max(entry[0] - 1 - radius, 0)
+            entries = await _db_top(db, start, entry[0] - start + radius)
+    if not entries:
+        raise HTTPException(status_code=404, detail="User not ranked")
+    return await _leaderboard_rows(db, entries)
@@ -0,0 +1,138 @@
+# src/users/search.py
+"""
+In-memory trigram index over usernames and LeetCode usernames.
+
+Every lowercased name is split into its 2- and 3-character grams, each
+mapping to the ids of users whose name contains it. A query intersects the
+posting sets of its own grams (smallest first) and confirms the substring
+match, so results match the old `ILIKE '%query%'` without a table scan.
+Emails are indexed up to the @: a shared domain would match everyone.
+
+The index is loaded at startup, updated on registration, and catches up on
+users registered through other workers with an id-range read at most every
+USER_SEARCH_SYNC_SECONDS. It only holds names: callers load the page's rows
+(e.g. with UserLoader) for anything else.
+"""
+import heapq
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import select
+from src.database.models import User
+
+USER_SEARCH_SYNC_SECONDS = float(os.getenv("USER_SEARCH_SYNC_SECONDS", "30"))
+USER_SEARCH_LOAD_BATCH = 5000
+
+# Ranking tiers: a whole-name match beats a prefix match beats a substring match
+EXACT, PREFIX, SUBSTRING = 0, 1, 2
+
+
+def _grams(name: str) -> Set[str]:
+    return {name[i:i + n] for n in (2, 3) for i in range(len(name) - n + 1)}
+
+
+class UserSearchIndex:
+    def __init__(self, sync_seconds: float = USER_SEARCH_SYNC_SECONDS):
+        self.sync_seconds = sync_seconds
+        self.names: Dict[int, Tuple[str, ...]] = {}  # user_id -> lowercased names
+        self.postings: Dict[str, Set[int]] = {}      # gram -> user ids
+        self.max_user_id = 0
+        self.loaded = False
+        self._synced_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, user_id: int, *names: Optional[str]):
+        """Index (or re-index) a user's names. Only the part of an email before the @ is searchable."""
+        if user_id in self.names:
+            self.remove(user_id)
+        lowered = tuple(dict.fromkeys(name.split("@", 1)[0].lower() for name in names if name))
+        self.names[user_id] = lowered
+        postings = self.postings
+        for name in lowered:
+            for gram in _grams(name):
+                ids = postings.get(gram)
+                if ids is None:
+                    postings[gram] = {user_id}
+                else:
+                    ids.add(user_id)
+        if user_id > self.max_user_id:
+            self.max_user_id = user_id
+
+    def remove(self, user_id: int):
+        for name in self.names.pop(user_id, ()):
+            for gram in _grams(name):
+                ids = self.postings.get(gram)
+                if ids is not None:
+                    ids.discard(user_id)
+                    if not ids:
+                        del self.postings[gram]
+
+    async def load(self, db, after_id: int = 0) -> int:
+        """Index every user with an id above `after_id`, streamed in batches. Returns how many."""
+        result = await db.stream(
+            select(User.id, User.email, User.leetcode_username)
+            .where(User.id > after_id)
+            .order_by(User.id)
+            .execution_options(yield_per=USER_SEARCH_LOAD_BATCH)
+        )
+        count = 0
+        async for user_id, email, leetcode_username in result:
+            self.add(user_id, email, leetcode_username)
+            count += 1
+        self.loaded = True
+        self._synced_at = time.monotonic()
+        return count
+
+    async def sync(self, db) -> int:
+        """Pick up users created since the last load/sync, at most once per sync_seconds."""
+        if self.loaded and time.monotonic() - self._synced_at < self.sync_seconds:
+            return 0
+        return await self.load(db, after_id=self.max_user_id)
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+        exclude: Optional[int] = None,
+        boost: Iterable[int] = (),
+    ) -> List[int]:
+        """
+        Ids of users whose name contains `query` (case-insensitive), best first:
+        exact, then prefix, then substring matches; ids in `boost` (e.g. friends)
+        lead within each tier, then shorter names.
+        """
+        query = query.lower()
+        grams = _grams(query)
+        if not grams:
+            return []
+        postings = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+        if not postings[0]:
+            return []
+        candidates = postings[0].intersection(*postings[1:])
+        boost = set(boost)
+
+        def ranked():
+            for user_id in candidates:
+                if user_id == exclude:
+                    continue
+                best = None
+                for name in self.names[user_id]:
+                    if query not in name:
+                        continue  # Grams matched out of order
+                    tier = EXACT if name == query else PREFIX if name.startswith(query) else SUBSTRING
+                    key = (tier, user_id not in boost, len(name), user_id)
+                    best = key if best is None or key < best else best
+                if best is not None:
+                    yield best
+
+        return [key[-1] for key in heapq.nsmallest(offset + limit, ranked())][offset:]
+
+    def snapshot(self) -> dict:
+        return {"users": len(self.names), "grams": len(self.postings), "loaded": self.loaded}
+
+
+# Global index, loaded from the app lifespan
+user_search_index = UserSearchIndex()
@@ -0,0 +1,83 @@
+import asyncio
+
+
+def run_with_db(scenario):
+    """Run `scenario(session)` against a throwaway in-memory SQLite schema"""
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from src.database.database import Base
+
+    async def runner():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+                return await scenario(session)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(runner())
+
+
+async def pending_match(db, elo1=1200, elo2=1250, name="p"):
+    from src.database.models import User, MatchHistory
+    users = [User(email=f"{name}{i}@x.com", hashed_password="x", user_elo=elo) for i, elo in enumerate((elo1, elo2))]
+    db.add_all(users)
+    await db.flush()
+    match = MatchHistory(
+        winner_id=users[0].id, loser_id=users[1].id, leetcode_problem="TBD", elo_change=0,
+        winner_elo_change=0, loser_elo_change=0, winner_elo=elo1, loser_elo=elo2,
+        match_seconds=0, winner_runtime=0, loser_runtime=0, winner_memory=0.0, loser_memory=0.0,
+    )
+    db.add(match)
+    await db.commit()
+    return match.match_id, users[0].id, users[1].id
+
+
+class RecordingWebSocket:
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+
+    async def send_text(self, data):
+        self.sent.append(data)
+
+    async def close(self):
+        self.closed = True
+
+
+class SortedSetRedis:
+    """The sorted-set commands the leaderboard uses, in memory (ties ordered like Redis)"""
+
+    def __init__(self):
+        self.sets = {}
+
+    def _ordered(self, key):
+        return sorted(self.sets.get(key, {}).items(), key=lambda item: (item[1], item[0]), reverse=True)
+
+    async def zadd(self, key, mapping):
+        self.sets.setdefault(key, {}).update({member: float(score) for member, score in mapping.items()})
+
+    async def zrem(self, key, *members):
+        for member in members:
+            self.sets.get(key, {}).pop(member, None)
+
+    async def zcard(self, key):
+        return len(self.sets.get(key, {}))
+
+    async def zscore(self, key, member):
+        return self.sets.get(key, {}).get(member)
+
+    async def zmscore(self, key, members):
+        return [self.sets.get(key, {}).get(member) for member in members]
+
+    async def zrevrank(self, key, member):
+        members = [m for m, _ in self._ordered(key)]
+        return members.index(member) if member in members else None
+
+    async def zrevrange(self, key, start, end, withscores=False):
+        return self._ordered(key)[start:end + 1]
+
+    async def zscan_iter(self, key):
+        for item in list(self.sets.get(key, {}).items()):
+            yield item
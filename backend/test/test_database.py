@@ -0,0 +1,107 @@
+import asyncio
+
+
+def test_sqlite_file_engine_uses_wal_and_reports_pool_metrics(tmp_path):
+    """File-backed SQLite gets WAL pragmas and the instrumented pool"""
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from src.database.pool import engine_options, install_sqlite_pragmas, pool_snapshot
+
+    url = f"sqlite+aiosqlite:///{tmp_path / 'wal.db'}"
+    assert "poolclass" not in engine_options("sqlite+aiosqlite://")
+
+    async def scenario():
+        engine = create_async_engine(url, **engine_options(url))
+        install_sqlite_pragmas(engine)
+        try:
+            async with engine.connect() as conn:
+                mode = (await conn.execute(text("PRAGMA journal_mode"))).scalar()
+                busy = pool_snapshot(engine)
+            return mode, busy, pool_snapshot(engine)
+        finally:
+            await engine.dispose()
+
+    mode, busy, idle = asyncio.run(scenario())
+    assert mode == "wal"
+    assert (busy["class"], busy["checked_out"], busy["checkouts"]) == ("InstrumentedPool", 1, 1)
+    assert (idle["checked_out"], idle["waiting"]) == (0, 0)
+
+
+def test_recent_writes_keep_reads_on_the_primary():
+    """Reads about a just-written user or match skip the replica until the window passes"""
+    from src.database.database import RecentWrites
+
+    off = RecentWrites(window=0)
+    off.mark(user_ids=(1,), match_id=7)
+    assert not off.covers({"user_id": "1"})
+
+    writes = RecentWrites(window=60)
+    writes.mark(user_ids=(1, 2), match_id=7)
+    assert writes.covers({"user_id": "2"}) and writes.covers({"match_id": "7"})
+    assert not writes.covers({"user_id": "3"}) and not writes.covers({"match_id": "abc"}) and not writes.covers({})
+    writes._until[("user", 2)] = 0  # expired
+    assert not writes.covers({"user_id": "2"})
+
+
+def test_query_executor_streams_and_batches():
+    """Raw SQL runs once on the app engine; bulk inserts batch and reads stream"""
+    from src.database.query_executor import execute_query, execute_many, stream_query
+
+    async def scenario():
+        await execute_query("CREATE TEMP TABLE qe (a INTEGER, b TEXT)", fetch=False)
+        inserted = await execute_many(
+            "INSERT INTO qe (a, b) VALUES (:a, :b)", ({"a": i, "b": str(i)} for i in range(25)), batch_size=10
+        )
+        count = await execute_query("SELECT count(*) AS n FROM qe")
+        streamed = [row async for row in stream_query("SELECT a FROM qe WHERE a >= :low ORDER BY a", {"low": 20}, chunk_size=2)]
+        await execute_query("DROP TABLE qe", fetch=False)
+        return inserted, count, streamed
+
+    inserted, count, streamed = asyncio.run(scenario())
+    assert inserted == 25 and count == [{"n": 25}]
+    assert streamed == [{"a": a} for a in range(20, 25)]
+
+
+def test_migrations_backfill_derived_tables_only_when_created():
+    """match_participants and user_stats are filled by the boot that creates them, not on every boot while empty"""
+    from sqlalchemy import delete, func, select
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from src.database.database import Base
+    from src.database.migrations import run_migrations
+    from src.database.models import MatchParticipant, UserStats
+    from src.matchmaking.settlement import settle_match
+    from .conftest import pending_match
+
+    async def scenario():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+                match_id, first, _ = await pending_match(db)
+                await settle_match(db, match_id, first)
+
+            async def counts():
+                async with engine.connect() as conn:
+                    return [(await conn.execute(select(func.count()).select_from(model))).scalar_one()
+                            for model in (MatchParticipant, UserStats)]
+
+            async with engine.begin() as conn:  # An older database without the derived tables
+                await conn.run_sync(lambda sync_conn: UserStats.__table__.drop(sync_conn))
+                await conn.run_sync(lambda sync_conn: MatchParticipant.__table__.drop(sync_conn))
+            async with engine.begin() as conn:
+                await run_migrations(conn)
+            created = await counts()
+
+            async with engine.begin() as conn:
+                await conn.execute(delete(UserStats))
+                await conn.execute(delete(MatchParticipant))
+            async with engine.begin() as conn:
+                await run_migrations(conn)
+            return created, await counts()
+        finally:
+            await engine.dispose()
+
+    created, rebooted = asyncio.run(scenario())
+    assert created == [2, 2]
+    assert rebooted == [0, 0]
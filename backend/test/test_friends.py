@@ -0,0 +1,87 @@
+import pytest
+
+from .conftest import run_with_db, pending_match
+
+
+def test_user_lookups_are_batched_per_request():
+    """Results and friends responses resolve every user they show in one query"""
+    from sqlalchemy import event
+    from src.database.models import User, MatchHistory, FriendEdge
+    from src.friends.service import get_friend_requests
+    from src.results.service import ResultsService
+
+    async def scenario(db):
+        _, first, second = await pending_match(db)
+        others = [User(email=f"o{i}@x.com", hashed_password="x", leetcode_username=f"o{i}") for i in range(4)]
+        db.add_all(others)
+        await db.flush()
+        for other in others:
+            db.add(MatchHistory(
+                winner_id=other.id, loser_id=first, leetcode_problem="two-sum", elo_change=8,
+                winner_elo=1208, loser_elo=1192, match_seconds=60,
+                winner_runtime=0, loser_runtime=0, winner_memory=0.0, loser_memory=0.0,
+            ))
+        db.add_all([
+            FriendEdge(user_id=first, other_id=others[0].id),
+            FriendEdge(user_id=first, other_id=others[1].id),
+            FriendEdge(user_id=second, other_id=first),
+        ])
+        await db.commit()
+
+        statements = []
+        event.listen(db.bind.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+        recent = await ResultsService.get_recent_matches(db, limit=10)
+        assert recent["total"] == 5 and len(statements) == 2  # matches, then one user IN (...)
+        assert [m["winner_username"] for m in recent["matches"][:2]] == ["o3", "o2"]
+
+        statements.clear()
+        requests = await get_friend_requests(db, first)
+        assert len(statements) == 3  # user check, pending edges, one IN (...) for both lists
+        assert [u.username for u in requests["sent"]] == ["o0@x.com", "o1@x.com"]
+        assert [u.user_id for u in requests["received"]] == [second]
+
+    run_with_db(scenario)
+
+
+def test_friend_edges_cover_the_request_lifecycle_and_legacy_lists():
+    """Requests, accepts, declines and removals are single edge rows; JSON lists migrate once"""
+    from fastapi import HTTPException
+    from src.database.models import User, Friends, FriendEdge
+    from src.friends import service
+
+    async def scenario(db):
+        users = [User(email=f"f{i}@x.com", hashed_password="x") for i in range(4)]
+        db.add_all(users)
+        await db.commit()
+        a, b, c, d = (user.id for user in users)
+
+        await service.send_friend_request(db, a, b)
+        await service.send_friend_request(db, c, a)
+        for sender, target in ((a, b), (b, a)):
+            with pytest.raises(HTTPException):
+                await service.send_friend_request(db, sender, target)
+        await service.accept_friend_request(db, b, a)
+        assert [f.user_id for f in await service.get_friends_list(db, b)] == [a]
+        assert [f.user_id for f in await service.get_friends_list(db, a)] == [b]
+        assert [r.user_id for r in (await service.get_friend_requests(db, a))["received"]] == [c]
+
+        await service.decline_friend_request(db, a, c)
+        with pytest.raises(HTTPException):
+            await service.cancel_friend_request(db, c, a)
+        await service.remove_friend(db, a, b)  # b asked first; either side can remove
+        assert await service.get_friend_ids(db, b) == []
+
+        db.add_all([
+            Friends(user_id=c, current_friends=[d], friend_requests_sent=[a], friend_requests_received=[]),
+            Friends(user_id=d, current_friends=[c], friend_requests_sent=[], friend_requests_received=[]),
+            Friends(user_id=a, current_friends=[999], friend_requests_sent=[], friend_requests_received=[c]),
+        ])
+        await db.commit()
+        assert await service.migrate_friend_lists(db) == 2
+        await db.commit()
+        assert await service.migrate_friend_lists(db) == 0
+        assert await service.get_friend_ids(db, d) == [c]
+        assert [r.user_id for r in (await service.get_friend_requests(db, c))["sent"]] == [a]
+
+    run_with_db(scenario)
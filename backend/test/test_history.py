@@ -0,0 +1,95 @@
+from .conftest import run_with_db, pending_match
+
+
+def test_history_services_read_match_participants():
+    """Settlement writes one participant row per side; stats, profile and history read them"""
+    from sqlalchemy import delete
+    from src.database.models import User, MatchParticipant
+    from src.history.service import calculate_user_stats
+    from src.profile.service import get_profile_data
+    from src.results.service import ResultsService
+    from src.matchmaking.settlement import settle_match, backfill_match_participants
+
+    async def scenario(db):
+        match_id, first, second = await pending_match(db)
+        (await db.get(User, second)).games_played = 50  # Different K-factors: the two changes differ in size
+        await db.commit()
+        result = await settle_match(db, match_id, second, problem_slug="two-sum")
+        assert result.winner_elo_change != -result.loser_elo_change
+
+        stats = await calculate_user_stats(db, second)
+        assert (stats.matches_won, stats.win_streak) == (1, 1)
+        assert stats.recent_matches[0].rating_change == result.winner_elo_change
+        profile = await get_profile_data(db, first)
+        assert profile["recent_matches"] == [{"outcome": "loss", "rating_change": result.loser_elo_change, "question": "two-sum"}]
+        history, next_cursor = await ResultsService.get_user_match_history(db, first)
+        assert next_cursor is None
+        assert [(h["match_id"], h["won"], h["opponent_id"], h["final_elo"], h["elo_change"]) for h in history] == [
+            (match_id, False, second, result.loser_elo, result.loser_elo_change)
+        ]
+        history, _ = await ResultsService.get_user_match_history(db, second)
+        assert history[0]["elo_change"] == result.winner_elo_change
+
+        await db.execute(delete(MatchParticipant))  # as if settled before the table existed
+        assert await backfill_match_participants(db) == 2
+        assert await backfill_match_participants(db) == 0
+        await db.commit()
+        assert (await calculate_user_stats(db, first)).recent_matches[0].rating_change == result.loser_elo_change
+
+    run_with_db(scenario)
+
+
+def test_history_pages_walk_back_with_a_cursor():
+    """Pages are newest first; next_cursor continues below the last match and is None at the end"""
+    from src.database.models import User, MatchHistory
+    from src.history.service import calculate_user_stats
+    from src.matchmaking.settlement import settle_match
+
+    async def scenario(db):
+        match_ids = []
+        first_match, first, second = await pending_match(db)
+        (await db.get(User, second)).leetcode_username = "bob"
+        for _ in range(2):
+            extra = MatchHistory(
+                winner_id=first, loser_id=second, leetcode_problem="TBD", elo_change=0,
+                winner_elo=1200, loser_elo=1250, match_seconds=0,
+                winner_runtime=0, loser_runtime=0, winner_memory=0.0, loser_memory=0.0,
+            )
+            db.add(extra)
+            await db.commit()
+            match_ids.append(extra.match_id)
+        for match_id in [first_match] + match_ids:
+            await settle_match(db, match_id, first)
+
+        page = await calculate_user_stats(db, first, limit=2)
+        assert [m.match_id for m in page.recent_matches] == [match_ids[1], match_ids[0]]
+        assert page.recent_matches[0].opponent == "bob" and page.next_cursor == match_ids[0]
+        last = await calculate_user_stats(db, first, limit=2, cursor=page.next_cursor)
+        assert [m.match_id for m in last.recent_matches] == [first_match] and last.next_cursor is None
+        assert (last.matches_won, last.win_streak) == (3, 3)
+
+    run_with_db(scenario)
+
+
+def test_rating_series_from_settlement_and_backfill():
+    """Settlement appends chart points; the backfill covers older matches; day buckets net them"""
+    from src.history.service import get_rating_series
+    from src.matchmaking.settlement import settle_match, backfill_rating_history
+    from src.database.models import RatingHistory
+    from sqlalchemy import delete
+
+    async def scenario(db):
+        first_match, first, second = await pending_match(db)
+        settled = await settle_match(db, first_match, first)
+        await db.execute(delete(RatingHistory))  # as if settled before the table existed
+        await db.commit()
+        assert await backfill_rating_history(db) == 1
+        await db.commit()
+        assert await backfill_rating_history(db) == 0
+
+        series = await get_rating_series(db, first)
+        assert [(p.elo, p.delta) for p in series.points] == [(settled.winner_elo, settled.winner_elo_change)]
+        daily = await get_rating_series(db, second, bucket="day")
+        assert len(daily.points) == 1 and daily.points[0].delta == settled.loser_elo_change
+
+    run_with_db(scenario)
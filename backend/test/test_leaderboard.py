@@ -0,0 +1,80 @@
+import asyncio
+
+from .conftest import run_with_db, SortedSetRedis
+
+
+def test_leaderboard_ranks_pages_and_reconciles():
+    """Settlement results flush to the sorted set; reconcile repairs drift against users"""
+    from src.database.models import User
+    from src.matchmaking.settlement import SettlementResult
+    from src.users.leaderboard import Leaderboard
+
+    async def scenario(db):
+        users = [User(email=f"l{i}@x.com", hashed_password="x", user_elo=1000 + 100 * i) for i in range(5)]
+        db.add_all(users)
+        await db.commit()
+        ids = [user.id for user in users]  # elo 1000 .. 1400
+        board = Leaderboard(key="test", client=SortedSetRedis())
+
+        await board.set_ratings({ids[4]: 1400})  # e.g. Redis restarted and only saw one settlement since
+        assert await board.seed_if_short(db) == 4 and await board.seed_if_short(db) == 0
+        assert await board.top(0, 2) == [(1, ids[4], 1400), (2, ids[3], 1300)]
+
+        result = SettlementResult(
+            match_id=1, winner_id=ids[0], loser_id=ids[4], winner_elo_change=16, loser_elo_change=-16,
+            winner_elo=1500, loser_elo=1384, resignation=False, already_settled=False,
+        )
+        board.record_result(result)
+        await board._flush_task
+        assert await board.rank(ids[0]) == (1, ids[0], 1500)
+        assert await board.around(ids[4], radius=1) == [(1, ids[0], 1500), (2, ids[4], 1384), (3, ids[3], 1300)]
+        assert await board.rank(999) is None and await board.around(999) == []
+
+        await board.set_ratings({999: 2000})  # a user that does not exist
+        drift = await board.reconcile(db, dry_run=True)
+        assert sorted(drift) == [(ids[0], 1500, 1000), (ids[4], 1384, 1400), (999, 2000, None)]
+        await board.reconcile(db)
+        assert await board.reconcile(db) == [] and await board.size() == 5
+
+    run_with_db(scenario)
+
+
+def test_leaderboard_reads_use_users_table_while_set_is_short(monkeypatch):
+    """A set missing users triggers a rebuild; until then the routes rank from the users table, ties included"""
+    from src.database.models import User
+    from src.users import routes
+    from src.users.leaderboard import Leaderboard
+
+    async def scenario(db):
+        ratings = [1000, 1100, 1200, 1300, 1400, 1200]  # ids[2] and ids[5] tie; the lower id ranks first
+        users = [User(email=f"r{i}@x.com", hashed_password="x", leetcode_username=f"r{i}", user_elo=elo)
+                 for i, elo in enumerate(ratings)]
+        db.add_all(users)
+        await db.commit()
+        ids = [user.id for user in users]
+        board = Leaderboard(key="test", client=SortedSetRedis())
+        rebuilds = []
+
+        async def rebuild():
+            rebuilds.append(await board.seed_if_short(db))
+        board._rebuild = rebuild
+        monkeypatch.setattr(routes, "leaderboard", board)
+        await board.set_ratings({ids[0]: 1000})  # only one user survived a Redis restart
+
+        top = await routes.get_leaderboard(offset=0, limit=2, db=db)
+        assert [(row["rank"], row["user_id"]) for row in top] == [(1, ids[4]), (2, ids[3])]
+        rank = await routes.get_leaderboard_rank(ids[0], db=db)
+        assert (rank["rank"], rank["total"]) == (6, 6)
+        around = await routes.get_leaderboard_around(ids[2], radius=1, db=db)
+        assert [(row["rank"], row["user_id"]) for row in around] == [(2, ids[3]), (3, ids[2]), (4, ids[5])]
+        from_users = await routes.get_leaderboard(offset=0, limit=6, db=db)
+
+        await asyncio.sleep(0)
+        assert rebuilds == [5] and await board.size() == 6
+        board._checked_at = None
+        assert await board.is_complete(db)
+        assert await routes.get_leaderboard(offset=0, limit=6, db=db) == from_users
+        assert await routes.get_leaderboard_around(ids[2], radius=1, db=db) == around
+        assert (await routes.get_leaderboard_rank(ids[5], db=db))["rank"] == 4
+
+    run_with_db(scenario)
@@ -0,0 +1,601 @@
+import asyncio
+import json
+
+import pytest
+
+from src.leetcode.schemas import Problem
+from src.matchmaking.connection import ClientConnection
+from src.matchmaking.protocol import JSON_CODEC, encode_message, negotiate_codec, patch_frame
+from src.matchmaking.pairing import FixedWindowPairing, ExpandingWindowPairing, ClosestEloPairing
+from src.matchmaking.simulator import simulate
+from src.matchmaking.user_context import UserSnapshot, user_contexts
+from src.matchmaking.websocket_manager import WebSocketManager
+
+from .conftest import run_with_db, pending_match, RecordingWebSocket
+
+
+def _queue(*elos):
+    return {user_id: {"elo": elo, "joined_at": 0.0} for user_id, elo in enumerate(elos, start=1)}
+
+
+def test_fixed_window_pairs_first_compatible_players():
+    """Matches the oldest compatible pair within ±100 ELO"""
+    queue = _queue(1000, 1500, 1090, 1510)
+    assert FixedWindowPairing().find_pair(queue, now=0.0) == (1, 3)
+    assert FixedWindowPairing().find_pair(queue, now=0.0, newcomer=4) == (2, 4)
+    assert FixedWindowPairing().find_pair(_queue(1000, 1101), now=0.0) is None
+
+
+def test_expanding_window_grows_with_wait_time():
+    """Players who waited long enough accept a wider ELO gap"""
+    queue = _queue(1000, 1250)
+    strategy = ExpandingWindowPairing(base_window=100, growth_per_second=10, max_window=400)
+    assert strategy.find_pair(queue, now=5.0) is None
+    assert strategy.find_pair(queue, now=15.0) == (1, 2)
+    # The timer pass returns the pair that queued first, not the closest ratings
+    queue = {1: {"elo": 1000, "joined_at": 0.0}, 3: {"elo": 1600, "joined_at": 0.0},
+             2: {"elo": 1250, "joined_at": 0.0}, 4: {"elo": 1610, "joined_at": 14.0}}
+    assert strategy.find_pair(queue, now=15.0) == (1, 2)
+    assert strategy.find_pair(queue, now=15.0, newcomer=4) == (3, 4)
+
+
+def test_closest_elo_prefers_smallest_gap():
+    """Newcomer is paired with the nearest rating, not the oldest"""
+    queue = _queue(1000, 1080, 1050)
+    assert ClosestEloPairing().find_pair(queue, now=0.0, newcomer=3) == (2, 3)
+
+
+def test_simulator_is_deterministic():
+    """Same seed gives the same report, and fixed-window gaps stay in the window"""
+    first = simulate(FixedWindowPairing(), arrivals=5000, seed=7)
+    second = simulate(FixedWindowPairing(), arrivals=5000, seed=7)
+    first.pop("wall_seconds")
+    second.pop("wall_seconds")
+    assert first == second
+    assert first["elo_gap"]["p99"] <= 100
+    assert first["matches"] * 2 + first["abandoned"] + first["still_queued"] == 5000
+
+
+def test_patch_frame_adds_per_recipient_fields():
+    """A shared frame patched with an opponent decodes like the full message"""
+    shared = encode_message({"type": "match_found", "match_id": 7, "problem": {"slug": "two-sum"}})
+    patched = patch_frame(shared, {"opponent": {"username": "bob", "elo": 1200}})
+    assert json.loads(patched) == {
+        "type": "match_found",
+        "match_id": 7,
+        "problem": {"slug": "two-sum"},
+        "opponent": {"username": "bob", "elo": 1200},
+    }
+    assert patch_frame(shared, {}) == shared
+
+
+def test_msgpack_codec_round_trip_and_patch():
+    """Binary clients get integer message types and the same per-recipient patching"""
+    msgpack = pytest.importorskip("msgpack")
+    codec, subprotocol = negotiate_codec(["chat", "lolc.msgpack.v1"])
+    assert subprotocol == "lolc.msgpack.v1"
+    assert negotiate_codec(None) == (JSON_CODEC, None)
+
+    message = {"type": "match_found", "match_id": 7, "problem": {"slug": "two-sum"}}
+    frame = codec.encode(message)
+    assert msgpack.unpackb(frame)["t"] == 4
+    assert codec.decode(frame) == message
+    patched = codec.patch(frame, {"opponent": {"username": "bob"}})
+    assert codec.decode(patched) == {**message, "opponent": {"username": "bob"}}
+
+
+def test_settle_match_is_idempotent():
+    """The second submit replays the first result instead of moving ratings again"""
+    from src.matchmaking.settlement import settle_match
+    from src.database.models import User
+
+    async def scenario(db):
+        match_id, first, second = await pending_match(db)
+        result = await settle_match(db, match_id, second, match_seconds=42, problem_slug="two-sum", winner_runtime=5)
+        assert (result.winner_id, result.loser_id, result.already_settled) == (second, first, False)
+        assert result.winner_elo == 1250 + result.winner_elo_change
+
+        again = await settle_match(db, match_id, first, resignation=True)
+        assert again.already_settled and (again.winner_id, again.winner_elo) == (second, result.winner_elo)
+        winner, loser = await db.get(User, second), await db.get(User, first)
+        assert winner.user_elo == result.winner_elo
+        assert (winner.games_played, winner.wins, loser.games_played, loser.losses) == (1, 1, 1, 1)
+
+    run_with_db(scenario)
+
+
+def test_settled_resignation_is_stored_not_inferred():
+    """A submission without a parsable runtime still replays as a submission"""
+    from src.matchmaking.settlement import settle_match
+
+    def scenario(resignation):
+        async def run(db):
+            match_id, first, _ = await pending_match(db)
+            await settle_match(db, match_id, first, resignation=resignation)  # winner_runtime defaults to -1
+            assert (await settle_match(db, match_id, first)).resignation is resignation
+        return run
+
+    run_with_db(scenario(False))
+    run_with_db(scenario(True))
+
+
+def test_settle_match_rejects_outsiders():
+    from fastapi import HTTPException
+    from src.matchmaking.settlement import settle_match
+
+    async def scenario(db):
+        match_id, _, _ = await pending_match(db)
+        with pytest.raises(HTTPException) as missing:
+            await settle_match(db, match_id + 1, 1)
+        with pytest.raises(HTTPException) as outsider:
+            await settle_match(db, match_id, 99)
+        return missing.value.status_code, outsider.value.status_code
+
+    assert run_with_db(scenario) == (404, 400)
+
+
+def test_status_lookups_follow_settlement():
+    """Live-match and completed-problem lookups read the status column, not the "TBD" placeholder"""
+    from src.database.models import MatchHistory, MatchStatus
+    from src.matchmaking.service import get_live_match, get_completed_problems
+    from src.matchmaking.settlement import settle_match
+
+    async def scenario(db):
+        match_id, first, second = await pending_match(db)
+        assert (await get_live_match(db, second)).match_id == match_id
+        assert await get_completed_problems(db, first) == set()
+
+        await settle_match(db, match_id, first, problem_slug="two-sum")
+        match = await db.get(MatchHistory, match_id)
+        assert match.status == MatchStatus.completed and match.completed_at is not None
+        assert await get_live_match(db, second) is None
+        assert await get_completed_problems(db, second) == {"two-sum"}
+
+    run_with_db(scenario)
+
+
+def test_new_match_abandons_stale_live_matches(monkeypatch):
+    """Re-matching marks the players' old live match abandoned; no settle path can rate it afterwards"""
+    from fastapi import HTTPException
+    from src.database.models import User, MatchHistory, MatchStatus
+    from src.leetcode.service.leetcode_service import LeetCodeService
+    from src.matchmaking.service import create_match_record
+    from src.matchmaking.settlement import settle_match
+
+    async def problem(**kwargs):
+        return Problem(id=1, title="Two Sum", slug="two-sum", difficulty="Easy", tags=[], acceptance_rate="50%")
+
+    monkeypatch.setattr(LeetCodeService, "get_random_problem", problem)
+
+    async def scenario(db):
+        match_id, first, second = await pending_match(db)
+        manager = WebSocketManager()
+        manager.match_timers[match_id] = {"start_time": None, "players": [first, second], "status": "active",
+                                          "ratings": {first: (1200, 0), second: (1250, 0)}}
+        record = await create_match_record(db, await db.get(User, first), await db.get(User, second))
+        assert record["abandoned"] == [match_id]
+        assert (await db.get(MatchHistory, match_id)).status == MatchStatus.abandoned
+        with pytest.raises(HTTPException):
+            await settle_match(db, match_id, first)
+
+        manager.abandon_match(match_id)
+        with pytest.raises(HTTPException):
+            await manager.settle_in_memory(match_id, first, manager.match_timers[match_id], False, 0, None, -1, -1.0)
+
+    run_with_db(scenario)
+
+
+def test_user_stats_follow_settlement_and_rebuild():
+    """Streaks and totals are kept per settlement; the rebuild reproduces them from history"""
+    from src.database.models import User, UserStats
+    from src.matchmaking.settlement import settle_match, find_user_stats_drift, rebuild_user_stats
+
+    async def scenario(db):
+        match_id, first, second = await pending_match(db)
+        await settle_match(db, match_id, first, match_seconds=30)
+        stats = await db.get(UserStats, first)
+        assert (stats.wins, stats.current_streak, stats.best_streak, stats.total_seconds) == (1, 1, 1, 30)
+        assert (await db.get(User, first)).winstreak == 1
+
+        stats.best_streak = 9  # drift
+        await db.commit()
+        assert await find_user_stats_drift(db) == [first]
+        assert await rebuild_user_stats(db) == 2
+        await db.commit()
+        assert await find_user_stats_drift(db) == []
+        db.expire_all()
+        loser = await db.get(UserStats, second)
+        assert (loser.losses, loser.current_streak, loser.last_match_id) == (1, 0, match_id)
+
+    run_with_db(scenario)
+
+
+def test_rebuild_user_counters_fixes_drift():
+    """Reconcile recomputes games_played/wins/losses from match history"""
+    from src.matchmaking.settlement import settle_match, find_counter_drift, rebuild_user_counters
+    from src.database.models import User
+
+    async def scenario(db):
+        match_id, first, second = await pending_match(db)
+        await settle_match(db, match_id, first)
+        loser = await db.get(User, second)
+        loser.games_played, loser.losses = 5, 0
+        await db.commit()
+        assert [row["user_id"] for row in await find_counter_drift(db)] == [second]
+
+        await rebuild_user_counters(db)
+        await db.commit()
+        db.expire_all()
+        assert await find_counter_drift(db) == []
+        assert ((await db.get(User, second)).games_played, (await db.get(User, second)).losses) == (1, 1)
+
+    run_with_db(scenario)
+
+
+def test_elo_replay_matches_elo_service_and_sweeps():
+    """The vectorized replay reproduces EloService match by match; sweeps run side by side"""
+    import random
+    from src.matchmaking.elo_replay import EloReplay, EloParams
+    from src.matchmaking.elo_service import EloService
+
+    rng = random.Random(3)
+    matches = [(w, l, rng.random() < 0.2) for w, l in (rng.sample(range(1, 15), 2) for _ in range(400))]
+    ratings, games = {}, {}
+    for winner, loser, resigned in matches:
+        dw, dl = EloService.calculate_match_rating_changes(
+            ratings.get(winner, 1200), ratings.get(loser, 1200),
+            games.get(winner, 0), games.get(loser, 0), is_resignation=resigned,
+        )
+        ratings[winner] = ratings.get(winner, 1200) + dw
+        ratings[loser] = ratings.get(loser, 1200) + dl
+        games[winner] = games.get(winner, 0) + 1
+        games[loser] = games.get(loser, 0) + 1
+
+    engine = EloReplay([EloParams(), EloParams(resignation_penalty=0)])
+    for start in range(0, len(matches), 64):
+        chunk = matches[start:start + 64]
+        engine.feed([m[0] for m in chunk], [m[1] for m in chunk], [m[2] for m in chunk])
+    assert engine.ratings_for(0) == ratings
+    assert sum(engine.ratings_for(1).values()) > sum(ratings.values())  # no penalty, more points kept
+
+
+def test_elo_replay_write_updates_derived_ratings():
+    """--write keeps match history, participants and rating points in step with users.user_elo"""
+    from sqlalchemy import select
+    from src.database.models import User, MatchHistory, MatchParticipant, RatingHistory
+    from src.matchmaking.elo_replay import EloParams, replay_history, write_replay
+    from src.matchmaking.settlement import settle_match
+
+    async def scenario(db):
+        match_id, first, second = await pending_match(db)
+        await settle_match(db, match_id, second)
+        engine, replayed = await replay_history(db, [EloParams(provisional_k=10)], record=True)
+        await write_replay(db, engine, replayed)
+        await db.commit()
+        db.expire_all()
+
+        winner = await db.get(User, second)
+        assert 0 < replayed[0].winner_change <= 10  # Rated with K=10, from the 1200 default
+        assert winner.user_elo == 1200 + replayed[0].winner_change
+        match = await db.get(MatchHistory, match_id)
+        assert (match.winner_elo, match.winner_elo_change) == (winner.user_elo, replayed[0].winner_change)
+        participant = await db.get(MatchParticipant, (second, match_id))
+        point = (await db.execute(select(RatingHistory).where(RatingHistory.user_id == second))).scalar_one()
+        assert participant.elo_after == point.elo_after == winner.user_elo
+        assert participant.elo_delta == point.delta == replayed[0].winner_change
+
+    run_with_db(scenario)
+
+
+def test_expected_score_table_matches_formula_and_clamps():
+    """The lookup table equals the closed form inside the clamp and saturates outside it"""
+    import math
+    from src.matchmaking.elo_service import EloService, EXPECTED_SCORE_CLAMP
+
+    for player, opponent in ((1200, 1200), (1500, 1137), (800, 2600), (2400, 2401)):
+        assert EloService.calculate_expected_score(player, opponent) == pytest.approx(
+            1 / (1 + math.pow(10, (opponent - player) / 400))
+        )
+    far = EloService.calculate_expected_score(0, EXPECTED_SCORE_CLAMP + 500)
+    assert far == EloService.calculate_expected_score(0, EXPECTED_SCORE_CLAMP)
+    assert EloService.get_rating_change_preview(1500, 1137, 40) == {
+        "win_probability": round(EloService.calculate_expected_score(1500, 1137) * 100, 1),
+        "rating_change_on_win": EloService.calculate_rating_change(1500, 1137, 1.0, 40),
+        "rating_change_on_loss": EloService.calculate_rating_change(1500, 1137, 0.0, 40),
+        "expected_score": EloService.calculate_expected_score(1500, 1137),
+    }
+
+
+def test_match_preview_is_cached_at_creation(monkeypatch):
+    """create_match stores the preview with the match state; the endpoint needs no DB for live matches"""
+    from src.matchmaking import websocket_manager as module
+    from src.matchmaking.elo_service import EloService
+    from src.matchmaking.routes import get_match_rating_preview
+
+    async def fake_record(db, user1, user2):
+        problem = Problem(id=1, title="Two Sum", slug="two-sum", difficulty="Easy", tags=[], acceptance_rate="50%")
+        return {"match": type("Match", (), {"match_id": 9})(), "problem": problem}
+
+    manager = WebSocketManager()
+    monkeypatch.setattr(module, "create_match_record", fake_record)
+    monkeypatch.setattr(module, "websocket_manager", manager)
+
+    async def scenario():
+        for snapshot in (
+            UserSnapshot(1, "a@x.com", 1400, "alice", True, frozenset(), frozenset(), games_played=50),
+            UserSnapshot(2, "b@x.com", 1200, None, True, frozenset(), frozenset(), games_played=3),
+        ):
+            await manager.connect(RecordingWebSocket(), snapshot.id, snapshot=snapshot)
+        await manager.create_match(1, 2, db=None)
+        preview = await get_match_rating_preview(9, db=None)
+        manager.stop_match_timer(9)
+        manager.disconnect(1)
+        manager.disconnect(2)
+
+        assert preview["player1"]["username"] == "alice" and preview["player2"]["username"] == "b@x.com"
+        assert preview["player1"]["rating_change_on_win"] == EloService.calculate_rating_change(1400, 1200, 1.0, 50)
+        assert preview["player2"]["rating_change_on_win"] == EloService.calculate_rating_change(1200, 1400, 1.0, 3)
+
+    asyncio.run(scenario())
+
+
+def test_outbox_settlement_pushes_first_and_writes_once(tmp_path, monkeypatch):
+    """Players hear the result before the DB write; a replayed outbox never settles a match twice"""
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from src.database.models import User, MatchHistory
+    from src.matchmaking import websocket_manager as module
+    from src.matchmaking.outbox import SettlementOutbox
+
+    async def scenario(db):
+        match_id, first, second = await pending_match(db)
+        sessions = async_sessionmaker(db.bind, expire_on_commit=False)
+        path = str(tmp_path / "outbox.jsonl")
+        monkeypatch.setattr(module, "SETTLEMENT_MODE", "outbox")
+        monkeypatch.setattr(module, "settlement_outbox", SettlementOutbox(path, session_factory=sessions))
+
+        manager = WebSocketManager()
+        websockets = {first: RecordingWebSocket(), second: RecordingWebSocket()}
+        for user_id, websocket in websockets.items():
+            await manager.connect(websocket, user_id)
+        manager.match_timers[match_id] = {
+            "start_time": None, "players": [first, second], "status": "active",
+            "ratings": {first: (1200, 0), second: (1250, 0)},
+        }
+        assert await manager.resign_match(match_id, first, db=None)
+        assert await manager.resign_match(match_id, first, db=None)  # replayed from the match state
+        await asyncio.sleep(0.01)
+        assert [json.loads(m)["result"] for m in websockets[second].sent] == ["won"]
+        assert (await db.get(MatchHistory, match_id)).leetcode_problem == "TBD"  # not written yet
+
+        replay = SettlementOutbox(path, session_factory=sessions)  # as if the server restarted
+        assert replay.load() == 1
+        await replay.flush()
+        assert SettlementOutbox(path).load() == 0  # committed, so the file was truncated
+        await module.settlement_outbox.flush()  # the original writer finds it already settled
+        db.expire_all()
+        winner, loser = await db.get(User, second), await db.get(User, first)
+        assert (winner.games_played, loser.games_played) == (1, 1)
+        assert (await db.get(MatchHistory, match_id)).winner_id == second
+        for user_id in websockets:
+            manager.disconnect(user_id)
+
+    run_with_db(scenario)
+
+
+def test_rest_and_in_memory_settlement_agree(tmp_path, monkeypatch):
+    """A REST settle during the outbox fsync replays the pushed result; one before it is what players get"""
+    import time
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from src.database.models import MatchHistory
+    from src.matchmaking import websocket_manager as module
+    from src.matchmaking.outbox import SettlementOutbox, settle
+
+    async def scenario(db):
+        sessions = async_sessionmaker(db.bind, expire_on_commit=False)
+        outbox = SettlementOutbox(str(tmp_path / "outbox.jsonl"), session_factory=sessions)
+        outbox._append_line = lambda line: time.sleep(0.05)  # a slow fsync
+        manager = WebSocketManager()
+        monkeypatch.setattr(module, "SETTLEMENT_MODE", "outbox")
+        monkeypatch.setattr(module, "settlement_outbox", outbox)
+        monkeypatch.setattr(module, "websocket_manager", manager)
+
+        def live(match_id, first, second):
+            manager.match_timers[match_id] = {
+                "start_time": None, "players": [first, second], "status": "active",
+                "ratings": {first: (1200, 0), second: (1250, 0)},
+            }
+
+        # WebSocket submit first: REST arrives while the outbox record is being fsynced
+        match_id, first, second = await pending_match(db)
+        live(match_id, first, second)
+        pushed = asyncio.create_task(manager.finish_match(match_id, first, db=None))
+        await asyncio.sleep(0.01)
+        rest = await settle(db, match_id, second)
+        assert await pushed
+        assert (rest.winner_id, rest.already_settled) == (first, True)
+        assert (await db.get(MatchHistory, match_id)).leetcode_problem == "TBD"  # left to the outbox
+
+        # REST submit first: the WebSocket path replays it instead of deciding again
+        other_id, third, fourth = await pending_match(db, name="q")
+        live(other_id, third, fourth)
+        rest = await settle(db, other_id, fourth)
+        assert manager.match_timers[other_id]["status"] == "completed"
+        websocket = RecordingWebSocket()
+        await manager.connect(websocket, third)
+        assert await manager.finish_match(other_id, third, db=None)
+        await asyncio.sleep(0.01)
+        told = json.loads(websocket.sent[-1])
+        assert (told["result"], rest.winner_id) == ("lost", fourth)
+        manager.disconnect(third)
+
+    run_with_db(scenario)
+
+
+def test_outbox_dead_letters_a_record_that_keeps_failing(tmp_path):
+    """After repeated failures records are written one by one; the bad one is dead-lettered, not the DB-down ones"""
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from src.database.models import MatchHistory, MatchStatus
+    from src.matchmaking.outbox import PendingSettlement, SettlementOutbox
+    from src.matchmaking.settlement import SettlementResult
+
+    class DatabaseDown:
+        async def __aenter__(self):
+            raise ConnectionError("database is down")
+
+        async def __aexit__(self, *exc):
+            return False
+
+    def pending(match_id, winner_id, loser_id):
+        return PendingSettlement(SettlementResult(
+            match_id=match_id, winner_id=winner_id, loser_id=loser_id, winner_elo_change=16, loser_elo_change=-16,
+            winner_elo=1216, loser_elo=1234, resignation=False, already_settled=False,
+        ))
+
+    async def scenario(db):
+        bad_id, first, second = await pending_match(db)
+        good_id, third, fourth = await pending_match(db, name="q")
+        path, dead = str(tmp_path / "outbox.jsonl"), str(tmp_path / "dead.jsonl")
+        sessions = async_sessionmaker(db.bind, expire_on_commit=False)
+        outbox = SettlementOutbox(path, session_factory=sessions, isolate_after=2, dead_letter_path=dead)
+        await outbox.add(pending(bad_id, 999, second))  # not a player of the match: can never be written
+        await outbox.add(pending(good_id, third, fourth))
+
+        for _ in range(2):
+            with pytest.raises(KeyError):
+                await outbox.flush()
+        assert outbox.pending_match_ids() == [bad_id, good_id]
+
+        outbox._session_factory = DatabaseDown  # an outage is not the record's fault
+        with pytest.raises(ConnectionError):
+            await outbox.flush()
+        assert outbox.snapshot()["dead_lettered"] == 0 and outbox.pending_match_ids() == [bad_id, good_id]
+
+        outbox._session_factory = sessions
+        await outbox.flush()
+        assert outbox.pending_match_ids() == [] and outbox.snapshot()["dead_lettered"] == 1
+        db.expire_all()
+        assert (await db.get(MatchHistory, good_id)).status == MatchStatus.completed
+        assert (await db.get(MatchHistory, bad_id)).status != MatchStatus.completed
+        assert SettlementOutbox(path).load() == 0  # truncated
+        assert SettlementOutbox(dead).load() == 1  # replayable once fixed
+
+    run_with_db(scenario)
+
+
+class StalledWebSocket:
+    """Accepts the first send and then never completes another one"""
+
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+        self.stall = asyncio.Event()
+
+    async def send_text(self, data):
+        self.sent.append(data)
+        await self.stall.wait()
+
+    async def close(self):
+        self.closed = True
+
+
+def test_sweep_evicts_idle_connections_and_pings_the_rest():
+    """Silent sockets leave connections and the queue; live ones get a heartbeat"""
+    async def scenario():
+        manager = WebSocketManager()
+        idle, live = RecordingWebSocket(), RecordingWebSocket()
+        await manager.connect(idle, 1)
+        await manager.connect(live, 2)
+        manager.queue[1] = {"elo": 1200, "websocket": manager.active_connections[1], "joined_at": 0.0}
+        manager.queue[3] = {"elo": 1200, "websocket": None, "joined_at": 0.0}  # socket already gone
+        manager.active_connections[1].last_seen -= 120
+
+        assert await manager.sweep(idle_timeout=90, batch_size=1) == 1
+        await asyncio.sleep(0.01)
+        assert list(manager.active_connections) == [2] and manager.queue == {}
+        assert idle.closed and live.sent == ['{"type":"ping"}']
+        manager.disconnect(2)
+
+    asyncio.run(scenario())
+
+
+def test_resume_token_restores_live_match_from_memory():
+    """A valid token replays the match state; someone else's token is refused"""
+    async def scenario():
+        manager = WebSocketManager()
+        websocket = RecordingWebSocket()
+        await manager.connect(websocket, 1)
+        manager.match_problems[7] = Problem(id=1, title="Two Sum", slug="two-sum", difficulty="Easy", tags=[], acceptance_rate="50%")
+        manager.match_timers[7] = {
+            "start_time": 1700000000.0, "players": [1, 2], "status": "active", "countdown": 1,
+            "opponents": {1: {"username": "bob", "elo": 1210}}, "resume_tokens": {1: "tok-1", 2: "tok-2"},
+        }
+        manager.resume_tokens = {"tok-1": (7, 1), "tok-2": (7, 2)}
+
+        assert await manager.resume_match(1, "tok-1")
+        assert not await manager.resume_match(1, "tok-2")
+        await asyncio.sleep(0.01)
+        resumed, failed = map(json.loads, websocket.sent)
+        assert resumed["type"] == "match_resumed" and resumed["phase"] == "active"
+        assert resumed["opponent"]["username"] == "bob" and resumed["start_timestamp"] == 1700000000.0
+        assert failed["type"] == "resume_failed"
+        manager.disconnect(1)
+
+    asyncio.run(scenario())
+
+
+def test_join_queue_uses_connection_snapshot_without_db():
+    """Queueing needs no session; ELO and settings invalidations update the snapshot"""
+    async def scenario():
+        manager = WebSocketManager()
+        snapshot = UserSnapshot(1, "a@x.com", 1200, "alice", True, frozenset({"0"}), frozenset({"1"}))
+        await manager.connect(RecordingWebSocket(), 1, snapshot=snapshot)
+        await manager.join_queue(1, user_contexts.get(1).user_elo)
+        assert manager.queue[1]["elo"] == 1200
+
+        user_contexts.update_elo(1, 1216)
+        assert user_contexts.get(1).user_elo == 1216 and user_contexts.get(1).leetcode_username == "alice"
+        user_contexts.update_elo(2, 1300)  # not connected: ignored
+        assert user_contexts.get(2) is None
+
+        manager.disconnect(1)
+        assert user_contexts.get(1) is None
+
+    asyncio.run(scenario())
+
+
+def test_send_queue_drops_oldest_timer_updates_when_full():
+    """A stalled client sheds timer ticks instead of blocking senders"""
+    async def scenario():
+        connection = ClientConnection(1, StalledWebSocket(), max_queue=3, overflow_policy="drop_oldest")
+        connection.start()
+        connection.enqueue({"type": "connected"})
+        await asyncio.sleep(0)  # writer takes "connected" and stalls on it
+        for countdown in (3, 2, 1):
+            assert connection.enqueue({"type": "timer_update", "countdown": countdown})
+        assert connection.enqueue({"type": "match_completed"})
+        assert [frame for _, frame in connection.outbox] == [
+            '{"type":"timer_update","countdown":2}',
+            '{"type":"timer_update","countdown":1}',
+            '{"type":"match_completed"}',
+        ]
+        assert connection.dropped == 1
+        connection.close()
+
+    asyncio.run(scenario())
+
+
+def test_send_queue_disconnect_policy_closes_connection():
+    """With the disconnect policy a full queue closes the socket and notifies the owner"""
+    async def scenario():
+        closed = []
+        websocket = StalledWebSocket()
+        connection = ClientConnection(1, websocket, on_close=closed.append, max_queue=1, overflow_policy="disconnect")
+        connection.start()
+        connection.enqueue({"type": "connected"})
+        await asyncio.sleep(0)
+        assert connection.enqueue({"type": "timer_update"})
+        assert not connection.enqueue({"type": "timer_update"})
+        await asyncio.sleep(0.01)  # let the background close run
+        assert connection.closed and closed == [connection] and websocket.closed
+
+    asyncio.run(scenario())
@@ -0,0 +1,44 @@
+from .conftest import run_with_db
+
+
+def test_user_search_index_ranks_matches_and_boosts_friends():
+    """Trigram search matches ILIKE substrings, ranks exact > prefix > substring, friends first"""
+    from src.users.search import UserSearchIndex
+
+    index = UserSearchIndex()
+    index.add(1, "bob@x.com", "bob")
+    index.add(2, "bobby@x.com", "bobcat")
+    index.add(3, "alice@x.com", "jimbob")
+    index.add(4, "carol@x.com", None)
+    assert index.search("BOB") == [1, 2, 3]
+    assert index.search("bob", boost=[3]) == [1, 2, 3]          # tiers still win
+    assert index.search("bob", exclude=1, boost=[3]) == [2, 3]
+    assert index.search("bo", limit=2, offset=1) == [2, 3]
+    assert index.search("bcb") == [] and index.search("x") == []
+    index.add(2, "robert@x.com", "rob")                          # re-index drops old grams
+    assert index.search("bobc") == [] and index.search("ober") == [2]
+
+
+def test_search_users_syncs_new_users_and_pages(monkeypatch):
+    from src.database.models import User, FriendEdge, FriendState
+    from src.friends import service
+    from src.users.search import UserSearchIndex
+
+    monkeypatch.setattr(service, "user_search_index", UserSearchIndex(sync_seconds=0))
+
+    async def scenario(db):
+        users = [User(email=f"sam{i}@x.com", hashed_password="x", leetcode_username=f"lc{i}") for i in range(3)]
+        db.add_all(users)
+        await db.commit()
+        me, friend, other = (user.id for user in users)
+        db.add(FriendEdge(user_id=friend, other_id=me, state=FriendState.accepted))
+        await db.commit()
+
+        page = await service.search_users(db, "sam", me, limit=1)
+        assert [u.user_id for u in page] == [friend]
+        assert [u.user_id for u in await service.search_users(db, "sam", me, limit=1, offset=1)] == [other]
+        db.add(User(email="samuel@x.com", hashed_password="x"))
+        await db.commit()
+        assert [u.username for u in await service.search_users(db, "samu", me)] == ["samuel@x.com"]
+
+    run_with_db(scenario)
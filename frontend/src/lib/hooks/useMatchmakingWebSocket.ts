@@ -30,8 +30,12 @@ interface WebSocketMessage {
   seconds?: number;
   formatted_time?: string;
   start_timestamp?: number;
+  resume_token?: string;
 }
 
+// Lets a dropped socket rejoin its live match without a round trip through /matchmaking/status
+const RESUME_TOKEN_KEY = 'matchmaking_resume_token';
+
 export const useMatchmakingWebSocket = (userId: number | null, onMatchCompleted?: () => void) => {
   const [isConnected, setIsConnected] = useState(false);
   const [isInQueue, setIsInQueue] = useState(false);
@@ -52,7 +56,9 @@ export const useMatchmakingWebSocket = (userId: number | null, onMatchCompleted?
   const connect = useCallback(() => {
     if (!userId || wsRef.current?.readyState === WebSocket.OPEN) return;
 
-    const ws = new WebSocket(`ws://127.0.0.1:8000/matchmaking/ws/matchmaking/${userId}`);
+    const resumeToken = sessionStorage.getItem(RESUME_TOKEN_KEY);
+    const query = resumeToken ? `?resume_token=${encodeURIComponent(resumeToken)}` : '';
+    const ws = new WebSocket(`ws://127.0.0.1:8000/matchmaking/ws/matchmaking/${userId}${query}`);
     wsRef.current = ws;
 
     ws.onopen = () => {
@@ -77,6 +83,9 @@ export const useMatchmakingWebSocket = (userId: number | null, onMatchCompleted?
 
           case 'match_found':
             console.log('🎉 Match found!', message);
+            if (message.resume_token) {
+              sessionStorage.setItem(RESUME_TOKEN_KEY, message.resume_token);
+            }
             setIsInQueue(false);
             setMatchData({
               match_id: message.match_id!,
@@ -92,6 +101,24 @@ export const useMatchmakingWebSocket = (userId: number | null, onMatchCompleted?
             setStartTimestamp(null);
             break;
 
+          case 'match_resumed':
+            console.log('🔁 Match resumed', message);
+            setIsInQueue(false);
+            setMatchData({
+              match_id: message.match_id!,
+              problem: message.problem,
+              opponent: message.opponent!
+            });
+            setMatchFound(true);
+            setTimerPhase(message.phase as 'countdown' | 'start' | 'active');
+            setCountdown(message.countdown || 3);
+            setStartTimestamp(message.start_timestamp || null);
+            break;
+
+          case 'resume_failed':
+            sessionStorage.removeItem(RESUME_TOKEN_KEY);
+            break;
+
           case 'timer_update':
             if (message.phase === 'countdown') {
               setTimerPhase('countdown');
@@ -106,6 +133,7 @@ export const useMatchmakingWebSocket = (userId: number | null, onMatchCompleted?
 
           case 'match_completed':
             console.log('🏁 Match completed:', message.result);
+            sessionStorage.removeItem(RESUME_TOKEN_KEY);
             
             // Notify parent that match is completed (but keep state for UI)
             if (onMatchCompleted) {
@@ -133,6 +161,11 @@ export const useMatchmakingWebSocket = (userId: number | null, onMatchCompleted?
             // Heartbeat response
             break;
 
+          case 'ping':
+            // Server heartbeat; answer so the idle sweeper keeps this connection
+            ws.send(JSON.stringify({ type: 'pong' }));
+            break;
+
           default:
             console.log('Unknown message type:', message.type);
         }